@@ -28,15 +28,19 @@
 from random import random
 from math import sqrt, log
 from interfaces import RecommenderEvaluator
-from models.datamodel import DictDataModel
+from models.datamodel import PreferenceStats
+from models.views import MaskedDataModel
 from recommender.recommender import SlopeOneRecommender
-from numpy import std, array, mean
 
 
 class AverageAbsoluteDifferenceRecommenderEvaluator(RecommenderEvaluator):
     '''
     A Recommender Evaluator which computes the average absolute difference
     between predicted and actual ratings for users.
+
+    The recommender is trained on a MaskedDataModel of the evaluated data
+    model, which hides the test preferences instead of copying the training
+    ones into a new model.
     '''
 
     def evaluate(self, recommender, dataModel, trainingPercentage,
@@ -47,17 +51,18 @@ class AverageAbsoluteDifferenceRecommenderEvaluator(RecommenderEvaluator):
         if evaluationPercentage > 1.0 or evaluationPercentage < 0.0:
             raise Exception('Evaluation Percentage is above/under the limit.')
         # numUsers = dataModel.NumUsers()
-        trainingUsers = {}
+        trainingUserIDs = []
         testUserPrefs = {}
         self.total = 0
         self.diffs = 0.0
 
         for userID in dataModel.UserIDs():
             if random() < evaluationPercentage:
-                self.processOneUser(trainingPercentage, trainingUsers,
+                self.splitOneUser(trainingPercentage, trainingUserIDs,
                         testUserPrefs, userID, dataModel)
 
-        trainingModel = DictDataModel(trainingUsers)
+        trainingModel = MaskedDataModel(dataModel, testUserPrefs,
+                                        trainingUserIDs)
 
         recommender.model = trainingModel
 
@@ -68,21 +73,32 @@ class AverageAbsoluteDifferenceRecommenderEvaluator(RecommenderEvaluator):
 
         return result
 
-    def processOneUser(self, trainingPercentage, trainingUsers, testUserPrefs,
+    def splitOneUser(self, trainingPercentage, trainingUserIDs, testUserPrefs,
             userID, dataModel):
+        '''
+        Split the preferences of the user `userID`: the test preferences go
+        to `testUserPrefs` and, if the user keeps any training preference,
+        the user is recorded in `trainingUserIDs`.
+        '''
+        trainingPrefs, testPrefs = self.splitPreferences(trainingPercentage,
+                dataModel.PreferencesFromUser(userID))
+
+        if trainingPrefs:
+            trainingUserIDs.append(userID)
+        if testPrefs:
+            testUserPrefs[userID] = dict(testPrefs)
+
+    def splitPreferences(self, trainingPercentage, prefs):
+        ''' Randomly split `prefs` into training and test preferences '''
         trainingPrefs = []
         testPrefs = []
-        prefs = dataModel.PreferencesFromUser(userID)
         for pref in prefs:
             if random() < trainingPercentage:
                 trainingPrefs.append(pref)
             else:
                 testPrefs.append(pref)
 
-        if trainingPrefs:
-            trainingUsers[userID] = dict(trainingPrefs)
-        if testPrefs:
-            testUserPrefs[userID] = dict(testPrefs)
+        return trainingPrefs, testPrefs
 
     def getEvaluation(self, testUserPrefs, recommender):
         for userID, prefs in testUserPrefs.iteritems():
@@ -91,7 +107,8 @@ class AverageAbsoluteDifferenceRecommenderEvaluator(RecommenderEvaluator):
                 try:
                     estimatedPreference = recommender.estimatePreference(
                             userID=userID, itemID=pref,
-                            similarity=recommender.similarity)
+                            similarity=getattr(recommender, 'similarity',
+                                               None))
                 except:
                     # It is possible that an item exists in the test data but
                     # not training data in which case an exception will be
@@ -136,8 +153,8 @@ class RMSRecommenderEvaluator(AverageAbsoluteDifferenceRecommenderEvaluator):
                 try:
                     estimatedPreference = \
                             recommender.estimatePreference(userID=userID,
-                                    itemID=pref,
-                                    similarity=recommender.similarity)
+                                    itemID=pref, similarity=getattr(
+                                        recommender, 'similarity', None))
                 except:
                     # It is possible that an item exists in the test data but
                     # not training data in which case an exception will be
@@ -159,6 +176,10 @@ class IRStatsRecommenderEvaluator(RecommenderEvaluator):
     example this would mean precision evaluated by removing the top 5
     preferences for a user and then finding the percentage of those 5 items
     included in the top 5 recommendations for that user.
+
+    The top preferences of the evaluated user are hidden by a
+    MaskedDataModel over the evaluated data model, so no model is rebuilt
+    for each user.
     """
 
     def evaluate(self, recommender, dataModel, at, evaluationPercentage,
@@ -186,7 +207,8 @@ class IRStatsRecommenderEvaluator(RecommenderEvaluator):
                 # List some most-preferred items that would count as most
                 # relevant results
                 relevanceThreshold = relevanceThreshold if relevanceThreshold \
-                                        else self.computeThreshold(prefs)
+                                        else self.computeThreshold(
+                                            dataModel.UserStats(userID))
 
                 prefs = sorted(prefs, key=lambda x: x[1], reverse=True)
 
@@ -198,12 +220,8 @@ class IRStatsRecommenderEvaluator(RecommenderEvaluator):
                 if len(relevantItemIDs) == 0:
                     continue
 
-                trainingUsers = {}
-                for otherUserID in dataModel.UserIDs():
-                    self.processOtherUser(userID, relevantItemIDs,
-                            trainingUsers, otherUserID, dataModel)
-
-                trainingModel = DictDataModel(trainingUsers)
+                trainingModel = MaskedDataModel(dataModel,
+                        {userID: set(relevantItemIDs)})
 
                 recommender.model = trainingModel
 
@@ -277,25 +295,19 @@ class IRStatsRecommenderEvaluator(RecommenderEvaluator):
 
         return irStats
 
-    def processOtherUser(self, userID, relevantItemIDs, trainingUsers,
-            otherUserID, dataModel):
-        prefs = dataModel.PreferencesFromUser(otherUserID)
-
-        if userID == otherUserID:
-            prefsOtherUser = [pref for pref in prefs
-                                if pref[0] not in relevantItemIDs]
-            if prefsOtherUser:
-                trainingUsers[otherUserID] = dict(prefsOtherUser)
-
-        else:
-            trainingUsers[otherUserID] = dict(prefs)
-
     def computeThreshold(self, prefs):
-        if len(prefs) < 2:
+        '''
+        The mean plus the standard deviation of the preferences `prefs`,
+        given as a list of (itemID, preference) or as their PreferenceStats.
+        '''
+        if isinstance(prefs, PreferenceStats):
+            stats = prefs
+        else:
+            stats = PreferenceStats.fromValues([pref[1] for pref in prefs])
+        if stats.count < 2:
             #Not enough data points: return a threshold that allows everything
             return - 10000000
-        data = [pref[1] for pref in prefs]
-        return mean(array(data)) + std(array(data))
+        return stats.mean() + stats.std()
 
     def log2(self, value):
         return log(value) / log(2.0)
@@ -27,10 +27,67 @@
     can be subclassed).
 """
 
+import threading
+
 # Base classes
 
 
-class Similarity(object):
+class Refreshable(object):
+    """
+    Implemented by the components whose state is derived from a data source:
+    data models, similarities, neighborhoods, candidate item strategies and
+    recommenders.
+
+    refresh brings a component up to date: it refreshes the components it
+    depends on first (the data model before the similarity, the similarity
+    before the neighborhood, and so on), then calls reload, which rebuilds
+    the state of the component aside and swaps it in with a single
+    assignment, so calls in flight finish on the old state. A component
+    shared by several others is refreshed only once per refresh.
+    """
+
+    def dependencies(self):
+        """
+        Return the components this component is derived from.
+        """
+        return []
+
+    def reload(self):
+        """
+        Rebuild the state of this component from its dependencies, already
+        refreshed, and swap it in. Components without state of their own do
+        nothing.
+        """
+        pass
+
+    def refresh(self, alreadyRefreshed=None):
+        """
+        Refresh the dependencies not in `alreadyRefreshed` (a set of the
+        components refreshed so far), then reload this component.
+        """
+        if alreadyRefreshed is None:
+            alreadyRefreshed = set()
+        if self in alreadyRefreshed:
+            return
+        alreadyRefreshed.add(self)
+
+        for dependency in self.dependencies():
+            if isinstance(dependency, Refreshable):
+                dependency.refresh(alreadyRefreshed)
+
+        self.reload()
+
+    def refreshInBackground(self):
+        """
+        Run refresh in a background thread and return the thread.
+        """
+        thread = threading.Thread(target=self.refresh)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+class Similarity(Refreshable):
     """
     Similarity Class - for similarity searches over a set of items/users.
 
@@ -64,6 +121,9 @@ class Similarity(object):
         self.distance = distance
         self.numBest = numBest
 
+    def dependencies(self):
+        return [self.model]
+
     def getSimilarity(self, vec1, vec2):
         """
         Return similarity of a vector `vec1` to a specific vector `vec2` in the
@@ -100,7 +160,7 @@ class Similarity(object):
             return tops[: self.numBest]
 
 
-class Recommender(object):
+class Recommender(Refreshable):
     """
     Recommender Class - Base interface for recommending items for a user.
 
@@ -117,6 +177,9 @@ class Recommender(object):
         """
         self.model = model
 
+    def dependencies(self):
+        return [self.model]
+
     def recommend(self, userID, howMany, rescorer=None):
         '''
         Return a list of recommended items, ordered from most strongly
@@ -224,7 +287,7 @@ class ItemBasedRecommender(Recommender):
         raise NotImplementedError("cannot instantiate Abstract Base Class")
 
 
-class Neighborhood(object):
+class Neighborhood(Refreshable):
     '''
     Implementations of this interface compute a "neighborhood" of users like a
     given user. This neighborhood can be used to compute recommendations then.
@@ -235,6 +298,9 @@ class Neighborhood(object):
         self.samplingRate = samplingRate
         self.similarity = similarity
 
+    def dependencies(self):
+        return [self.model, self.similarity]
+
     def userNeighborhood(self, userID):
         '''
         Return IDs of users in the neighborhood
@@ -242,7 +308,7 @@ class Neighborhood(object):
         raise NotImplementedError("cannot instantiate Abstract Base Class")
 
 
-class CandidateItemsStrategy(object):
+class CandidateItemsStrategy(Refreshable):
     '''
      Used to retrieve all items that could possibly be recommended to the user
     '''
@@ -0,0 +1,126 @@
+#-*- coding:utf-8 -*-
+
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`booleanmodel` -- the boolean data model module
+================================================================
+
+    This module contains data models for implicit feedback (clicks,
+    purchases, views), where a user either has a preference for an item or
+    has none, and no preference value is stored.
+
+"""
+
+from array import array
+from bisect import bisect_left
+
+from matrixmodel import MatrixDataModel, compressPreferences, \
+        compressTimes, NO_TIME
+
+
+class BooleanDataModel(MatrixDataModel):
+    '''
+    A MatrixDataModel without preference values. It expects a dictionary
+    mapping each userID to the itemIDs the user has a preference for:
+
+    {userID: [itemID, itemID2],
+     userID2: set([itemID, itemID3])}
+
+    The dict structured data of DictDataModel is accepted as well; only its
+    itemIDs are kept.
+
+    The items of every user and the users of every item are stored as sorted
+    integer arrays (4 bytes per preference and direction), and every
+    preference reads as 1.0. Similarities such as sim_tanimoto, sim_jaccard,
+    sim_sorensen and sim_loglikehood are computed from UserOverlap and
+    ItemOverlap, which intersect the sorted arrays directly.
+    '''
+
+    def buildModel(self, dataS, timestamps=None):
+        '''
+        Build the model from the dict structured data `dataS` and the
+        optional `timestamps` of its preferences.
+        '''
+        userIDs = sorted(dataS)
+        itemIDs = set()
+        for items in dataS.itervalues():
+            itemIDs.update(items)
+        itemIDs = sorted(itemIDs)
+
+        itemIndex = dict((itemID, index)
+                         for index, itemID in enumerate(itemIDs))
+
+        users = array('i')
+        items = array('i')
+        times = array('d') if timestamps is not None else None
+        for user, userID in enumerate(userIDs):
+            userTimes = timestamps.get(userID, {}) if timestamps else {}
+            for itemID in dataS[userID]:
+                users.append(user)
+                items.append(itemIndex[itemID])
+                if times is not None:
+                    times.append(userTimes.get(itemID, NO_TIME))
+
+        self._build(userIDs, itemIDs, users, items, None, times)
+
+    def _build(self, userIDs, itemIDs, users, items, values=None,
+            times=None):
+        '''
+        Compress the coordinate buffers `users`, `items` and the optional
+        `times` (dense indexes into the sorted `userIDs` and `itemIDs`) into
+        the model. `values` is accepted for compatibility with
+        MatrixDataModel and ignored.
+        '''
+        userPtr, userOrder, itemPtr, itemOrder = compressPreferences(
+                len(userIDs), len(itemIDs), users, items)
+
+        self._assign(userIDs, itemIDs,
+                array('l', userPtr),
+                array('i', [items[position] for position in userOrder]),
+                None,
+                array('l', itemPtr),
+                array('i', [users[position] for position in itemOrder]),
+                None,
+                1.0 if userOrder else None,
+                1.0 if userOrder else None,
+                *compressTimes(times, userOrder, itemOrder))
+
+    def PreferencesFromUser(self, userID, orderByID=True):
+        return [(itemID, 1.0) for itemID in self.ItemIDsFromUser(userID)]
+
+    def PreferencesForItem(self, itemID, orderByID=True):
+        start, end = self._itemColumn(itemID)
+        userIDs = self.userIDs
+        return [(userIDs[user], 1.0)
+                for user in self.itemUsers[start:end].tolist()]
+
+    def PreferenceValue(self, userID, itemID):
+        start, end = self._userRow(userID)
+        item = self.itemIndex.get(itemID, None)
+        if item is None:
+            return None
+
+        position = bisect_left(self.userItems, item, start, end)
+        if position < end and self.userItems[position] == item:
+            return 1.0
+
+        return None
+
+    def hasPreferenceValues(self):
+        return False
@@ -33,14 +33,134 @@
 
 """
 
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from math import sqrt
 
-class DataModel(object):
+from interfaces import Refreshable
+
+
+class PreferenceStats(object):
+    '''
+    The count, sum and sum of squares of a set of preference values, from
+    which their mean, norm and standard deviation follow. Adding or removing
+    a value updates the three aggregates without visiting the others.
+    '''
+
+    __slots__ = ('count', 'sum', 'sumSq')
+
+    def __init__(self, count=0, sum=0.0, sumSq=0.0):
+        ''' PreferenceStats Constructor '''
+        self.count = count
+        self.sum = sum
+        self.sumSq = sumSq
+
+    @classmethod
+    def fromValues(cls, values):
+        ''' Return the stats of the preference values `values` '''
+        stats = cls()
+        for value in values:
+            stats.add(value)
+        return stats
+
+    def add(self, value, delta=1):
+        '''
+        Count the preference value `value` once more (or once less, with
+        `delta` -1).
+        '''
+        self.count += delta
+        self.sum += delta * value
+        self.sumSq += delta * value * value
+
+    def mean(self):
+        ''' The mean of the values, None if there are none '''
+        if not self.count:
+            return None
+        return self.sum / self.count
+
+    def norm(self):
+        ''' The euclidean norm of the values '''
+        return sqrt(self.sumSq)
+
+    def std(self):
+        ''' The (population) standard deviation of the values '''
+        if not self.count:
+            return None
+        mean = self.sum / self.count
+        return sqrt(max(self.sumSq / self.count - mean * mean, 0.0))
+
+    def __eq__(self, other):
+        return isinstance(other, PreferenceStats) and \
+                (self.count, self.sum, self.sumSq) == \
+                (other.count, other.sum, other.sumSq)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'PreferenceStats(%r, %r, %r)' % (self.count, self.sum,
+                                                self.sumSq)
+
+
+class DataModel(Refreshable):
     '''
     Base Data Model Class that represents the basic repository of
     information about users and their associated preferences
     for items.
+
+    Models that can be changed call the listeners added through
+    addPreferenceListener after every setPreference and removePreference,
+    so that caches built over the model can drop only what changed.
+
+    Models whose IDs were translated to integers by IDMigrators (see
+    setIDMigrators) translate them back with convertUserID2name and
+    convertItemID2name.
+
+    UserStats and ItemStats return the PreferenceStats of a user or an item.
+    They are computed from the preferences here; models keeping them up to
+    date (DictDataModel) or precomputed (MatrixDataModel) override them.
+
+    Data models are Refreshable. Models that swap their whole state on
+    refresh (see ReloadableDataModel) keep the state seen by a thread inside
+    a ``with model.pin():`` block; for the others pin does nothing.
     '''
 
+    def __init__(self):
+        self._preferenceListeners = []
+        self.userIDMigrator = None
+        self.itemIDMigrator = None
+
+    def setIDMigrators(self, userIDMigrator, itemIDMigrator):
+        '''
+        Set the IDMigrators that translated the external user and item IDs
+        into the integer IDs held by the model.
+        '''
+        self.userIDMigrator = userIDMigrator
+        self.itemIDMigrator = itemIDMigrator
+
+    def addPreferenceListener(self, listener):
+        '''
+        Register `listener`, a function called as listener(userID, itemID)
+        whenever the preference of the user for the item changes.
+        '''
+        self._preferenceListeners.append(listener)
+
+    def removePreferenceListener(self, listener):
+        ''' Unregister a listener added by addPreferenceListener '''
+        self._preferenceListeners.remove(listener)
+
+    @contextmanager
+    def pin(self):
+        '''
+        Context manager during which the queries of the current thread see
+        the same state of the model, even if it is refreshed meanwhile.
+        '''
+        yield self
+
+    def _notifyPreferenceChanged(self, userID, itemID):
+        for listener in list(self._preferenceListeners):
+            listener(userID, itemID)
+
     def UserIDs(self):
         '''
         Return all user IDs in the model, in order
@@ -88,6 +208,38 @@ class DataModel(object):
         '''
         raise NotImplementedError("cannot instantiate Abstract Base Class")
 
+    def PreferencesFromUserSince(self, userID, since):
+        '''
+        Return the preferences of the user set at or after the time `since`,
+        ordered by item ID, as an array. Preferences without a known time are
+        left out.
+        '''
+        raise NotImplementedError("cannot instantiate Abstract Base Class")
+
+    def PreferencesForItemSince(self, itemID, since):
+        '''
+        Return the preferences for the item set at or after the time `since`,
+        ordered by user ID, as an array. Preferences without a known time are
+        left out.
+        '''
+        raise NotImplementedError("cannot instantiate Abstract Base Class")
+
+    def UserStats(self, userID):
+        '''
+        Return the PreferenceStats (count, sum, sum of squares) of the
+        preference values of the user.
+        '''
+        return PreferenceStats.fromValues(
+                [value for itemID, value in self.PreferencesFromUser(userID)])
+
+    def ItemStats(self, itemID):
+        '''
+        Return the PreferenceStats (count, sum, sum of squares) of the
+        preference values for the item.
+        '''
+        return PreferenceStats.fromValues(
+                [value for userID, value in self.PreferencesForItem(itemID)])
+
     def NumUsers(self):
         '''
         Return total number of users known to the model.
@@ -121,11 +273,15 @@ class DataModel(object):
 
     def convertItemID2name(self, itemID):
         """Given item id number return item name"""
-        raise NotImplementedError("cannot instantiate Abstract Base Class")
+        if self.itemIDMigrator is None:
+            raise NotImplementedError("The model has no item ID migrator")
+        return self.itemIDMigrator.toStringID(itemID)
 
     def convertUserID2name(self, userID):
         """Given user id number return user name"""
-        raise NotImplementedError("cannot instantiate Abstract Base Class")
+        if self.userIDMigrator is None:
+            raise NotImplementedError("The model has no user ID migrator")
+        return self.userIDMigrator.toStringID(userID)
 
     def hasPreferenceValues(self):
         '''
@@ -156,6 +312,23 @@ class DataModel(object):
         raise NotImplementedError("cannot instantiate Abstract Base Class")
 
 
+class PreferencesView(list):
+    '''
+    A read-only list of preferences. Data models hand out these views from
+    their caches without copying them, so any attempt to modify a view in
+    place raises a TypeError.
+    '''
+
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError('PreferencesView is read-only')
+
+    __setitem__ = __delitem__ = _readOnly
+    __setslice__ = __delslice__ = _readOnly
+    __iadd__ = __imul__ = _readOnly
+    append = extend = insert = pop = remove = _readOnly
+    reverse = sort = _readOnly
+
+
 class DictDataModel(DataModel):
     '''
     A DataModel backed by a python dict structured data. This class expects a
@@ -168,11 +341,28 @@ class DictDataModel(DataModel):
     Preference value is the parameter that the user simply expresses the degree
     of preference for an item.
 
+    The optional timestamps are given in a second dict of the same shape,
+    holding the time of each preference instead of its value:
+
+    {userID: {itemID:time, itemID2:time2}}
+
+    The preferences of every user and item are kept sorted by ID in read-only
+    views built once by buildModel. The views sorted by value are built on
+    first use. Both are dropped only for the rows touched by a change.
+
+    setPreference and removePreference update the model (and the dict it
+    was built from) in place. The number of preferences for every distinct
+    value is kept, so MaxPreference and MinPreference stay exact after a
+    removal without scanning the preferences again, and so are the
+    PreferenceStats of every user and item returned by UserStats and
+    ItemStats.
+
     '''
-    def __init__(self, dataS):
+    def __init__(self, dataS, timestamps=None):
         ''' DictDataModel Constructor '''
         DataModel.__init__(self)
         self.dataU = dataS
+        self.timestamps = timestamps if timestamps is not None else {}
         self.buildModel()
 
     def __getitem__(self, userID):
@@ -197,17 +387,58 @@ class DictDataModel(DataModel):
 
         self.maxPref = -100000000
         self.minPref = 100000000
+        self._valueCounts = {}
+        self._userStats = {}
+        self._itemStats = {}
 
         self.dataI = {}
         for user in self.dataU:
+            userStats = self._userStats[user] = PreferenceStats()
             for item in self.dataU[user]:
                 self.dataI.setdefault(item, {})
                 self.dataI[item][user] = self.dataU[user][item]
+                userStats.add(self.dataU[user][item])
+                self._itemStats.setdefault(item, PreferenceStats()).add(
+                        self.dataU[user][item])
+                self._valueCounts[self.dataU[user][item]] = \
+                        self._valueCounts.get(self.dataU[user][item], 0) + 1
                 if self.dataU[user][item] > self.maxPref:
                     self.maxPref = self.dataU[user][item]
                 if  self.dataU[user][item] < self.minPref:
                     self.minPref = self.dataU[user][item]
 
+        self._userPrefsByID = {}
+        self._userPrefsByValue = {}
+        self._itemPrefsByID = {}
+        self._itemPrefsByValue = {}
+        for userID in self.userIDs:
+            self._userPrefsByID[userID] = self._sortedView(
+                    self.dataU[userID], True)
+        for itemID in self.itemIDs:
+            self._itemPrefsByID[itemID] = self._sortedView(
+                    self.dataI[itemID], True)
+
+    def _sortedView(self, prefs, orderByID):
+        ''' Return the preferences in `prefs` as a sorted, read-only view '''
+        prefs = prefs.items()
+
+        if not orderByID:
+            prefs.sort(key=lambda pref: pref[1], reverse=True)
+        else:
+            prefs.sort(key=lambda pref: pref[0])
+
+        return PreferencesView(prefs)
+
+    def _invalidatePreferences(self, userID, itemID):
+        '''
+        Drop the cached views of the user `userID` and of the item `itemID`
+        after their preferences changed. They are rebuilt on next access.
+        '''
+        for cache in (self._userPrefsByID, self._userPrefsByValue):
+            cache.pop(userID, None)
+        for cache in (self._itemPrefsByID, self._itemPrefsByValue):
+            cache.pop(itemID, None)
+
     def UserIDs(self):
         return self.userIDs
 
@@ -215,18 +446,17 @@ class DictDataModel(DataModel):
         return self.itemIDs
 
     def PreferencesFromUser(self, userID, orderByID=True):
-        userPrefs = self.dataU.get(userID, None)
+        cache = self._userPrefsByID if orderByID else self._userPrefsByValue
+        userPrefs = cache.get(userID, None)
 
         if userPrefs is None:
-            raise ValueError(
-                    'User not found. Change for a suitable exception here!')
+            prefs = self.dataU.get(userID, None)
 
-        userPrefs = userPrefs.items()
+            if prefs is None:
+                raise ValueError(
+                        'User not found. Change for a suitable exception here!')
 
-        if not orderByID:
-            userPrefs.sort(key=lambda userPref: userPref[1], reverse=True)
-        else:
-            userPrefs.sort(key=lambda userPref: userPref[0])
+            userPrefs = cache[userID] = self._sortedView(prefs, orderByID)
 
         return userPrefs
 
@@ -235,24 +465,58 @@ class DictDataModel(DataModel):
         return [key for key, value in prefs]
 
     def PreferencesForItem(self, itemID, orderByID=True):
-        itemPrefs = self.dataI.get(itemID, None)
+        cache = self._itemPrefsByID if orderByID else self._itemPrefsByValue
+        itemPrefs = cache.get(itemID, None)
 
-        if not itemPrefs:
-            raise ValueError(
-                    'User not found. Change for a suitable exception here!')
+        if itemPrefs is None:
+            prefs = self.dataI.get(itemID, None)
 
-        itemPrefs = itemPrefs.items()
+            if not prefs:
+                raise ValueError(
+                        'User not found. Change for a suitable exception here!')
 
-        if not orderByID:
-            itemPrefs.sort(key=lambda itemPref: itemPref[1], reverse=True)
-        else:
-            itemPrefs.sort(key=lambda itemPref: itemPref[0])
+            itemPrefs = cache[itemID] = self._sortedView(prefs, orderByID)
 
         return itemPrefs
 
     def PreferenceValue(self, userID, itemID):
         return self.dataU.get(userID).get(itemID, None)
 
+    def PreferenceTime(self, userID, itemID):
+        if userID not in self.dataU:
+            raise ValueError(
+                    'User not found. Change for a suitable exception here!')
+
+        return self.timestamps.get(userID, {}).get(itemID, None)
+
+    def PreferencesFromUserSince(self, userID, since):
+        userTimes = self.timestamps.get(userID, {})
+        return [(itemID, value)
+                for itemID, value in self.PreferencesFromUser(userID)
+                if userTimes.get(itemID, None) is not None
+                    and userTimes[itemID] >= since]
+
+    def PreferencesForItemSince(self, itemID, since):
+        timestamps = self.timestamps
+        return [(userID, value)
+                for userID, value in self.PreferencesForItem(itemID)
+                if timestamps.get(userID, {}).get(itemID, None) is not None
+                    and timestamps[userID][itemID] >= since]
+
+    def UserStats(self, userID):
+        stats = self._userStats.get(userID, None)
+        if stats is None:
+            raise ValueError(
+                    'User not found. Change for a suitable exception here!')
+        return PreferenceStats(stats.count, stats.sum, stats.sumSq)
+
+    def ItemStats(self, itemID):
+        stats = self._itemStats.get(itemID, None)
+        if stats is None:
+            raise ValueError(
+                    'Item not found. Change for a suitable exception here!')
+        return PreferenceStats(stats.count, stats.sum, stats.sumSq)
+
     def NumUsers(self):
         return len(self.dataU)
 
@@ -260,25 +524,110 @@ class DictDataModel(DataModel):
         return len(self.dataI)
 
     def NumUsersWithPreferenceFor(self, *itemIDs):
-        if len(itemIDs) > 2 or len(itemIDs) == 0:
+        if len(itemIDs) == 0:
             raise ValueError('Illegal number of IDs')
 
-        prefs1 = dict(self.PreferencesForItem(itemIDs[0]))
+        itemsPrefs = []
+        for itemID in itemIDs:
+            prefs = self.dataI.get(itemID, None)
+            if not prefs:
+                raise ValueError(
+                        'Item not found. Change for a suitable exception here!')
+            itemsPrefs.append(prefs)
+
+        # Start from the item with fewest users and probe the others, so
+        # the candidates shrink as fast as possible.
+        itemsPrefs.sort(key=len)
+        users = itemsPrefs[0]
+        for prefs in itemsPrefs[1:]:
+            users = [user for user in users if user in prefs]
+            if not users:
+                return 0
+
+        return len(users)
+
+    def setPreference(self, userID, itemID, value, timestamp=None):
+        userPrefs = self.dataU.get(userID, None)
+        if userPrefs is None:
+            userPrefs = self.dataU[userID] = {}
+            self._userStats[userID] = PreferenceStats()
+            insort(self.userIDs, userID)
 
-        if not prefs1:
-            return 0
+        itemPrefs = self.dataI.get(itemID, None)
+        if itemPrefs is None:
+            itemPrefs = self.dataI[itemID] = {}
+            self._itemStats[itemID] = PreferenceStats()
+            insort(self.itemIDs, itemID)
 
-        if len(itemIDs) == 1:
-            return len(prefs1)
+        oldValue = userPrefs.get(itemID, None)
+        userPrefs[itemID] = value
+        itemPrefs[userID] = value
 
-        prefs2 = dict(self.PreferencesForItem(itemIDs[1]))
+        if timestamp is not None:
+            self.timestamps.setdefault(userID, {})[itemID] = timestamp
+        else:
+            self.timestamps.get(userID, {}).pop(itemID, None)
 
-        if not prefs2:
-            return 0
+        self._countValue(value, 1)
+        self._userStats[userID].add(value)
+        self._itemStats[itemID].add(value)
+        if oldValue is not None:
+            self._countValue(oldValue, -1)
+            self._userStats[userID].add(oldValue, -1)
+            self._itemStats[itemID].add(oldValue, -1)
 
-        nUsers = len([user for user in prefs1  if user in prefs2])
+        self._invalidatePreferences(userID, itemID)
+        self._notifyPreferenceChanged(userID, itemID)
 
-        return nUsers
+    def removePreference(self, userID, itemID):
+        userPrefs = self.dataU.get(userID, None)
+        if userPrefs is None:
+            raise ValueError(
+                    'User not found. Change for a suitable exception here!')
+
+        if itemID not in userPrefs:
+            return
+
+        oldValue = userPrefs.pop(itemID)
+        self.timestamps.get(userID, {}).pop(itemID, None)
+        itemPrefs = self.dataI[itemID]
+        del itemPrefs[userID]
+        if not itemPrefs:
+            # No one else rated the item: it leaves the model.
+            del self.dataI[itemID]
+            del self._itemStats[itemID]
+            del self.itemIDs[bisect_left(self.itemIDs, itemID)]
+        else:
+            self._itemStats[itemID].add(oldValue, -1)
+
+        self._countValue(oldValue, -1)
+        self._userStats[userID].add(oldValue, -1)
+
+        self._invalidatePreferences(userID, itemID)
+        self._notifyPreferenceChanged(userID, itemID)
+
+    def _countValue(self, value, delta):
+        '''
+        Add `delta` to the number of preferences equal to `value`, updating
+        the maximum and minimum preferences.
+        '''
+        count = self._valueCounts.get(value, 0) + delta
+        if count > 0:
+            self._valueCounts[value] = count
+            if value > self.maxPref:
+                self.maxPref = value
+            if value < self.minPref:
+                self.minPref = value
+            return
+
+        self._valueCounts.pop(value, None)
+        if not self._valueCounts:
+            self.maxPref = -100000000
+            self.minPref = 100000000
+        elif value == self.maxPref:
+            self.maxPref = max(self._valueCounts)
+        elif value == self.minPref:
+            self.minPref = min(self._valueCounts)
 
     def hasPreferenceValues(self):
         return True
@@ -0,0 +1,291 @@
+#-*- coding:utf-8 -*-
+
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`filemodel` -- the file data model module
+================================================================
+
+    This module contains data models that read the preferences from
+    delimited rating files, such as CSV, TSV or the MovieLens data sets.
+
+"""
+
+import bz2
+import gzip
+import time
+from array import array
+
+from datamodel import DataModel
+from matrixmodel import MatrixDataModel, NO_TIME
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DELIMITERS = ('::', '\t', ',', ';', ' ')
+
+
+def openRatingFile(path):
+    '''
+    Open the rating file at `path` for reading, decompressing it on the fly
+    when its name ends with .gz or .bz2.
+    '''
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    elif path.endswith('.bz2'):
+        return bz2.BZ2File(path, 'rb')
+    return open(path, 'rb')
+
+
+class FileDataModel(MatrixDataModel):
+    '''
+    A MatrixDataModel read from a delimited rating file. Each line holds a
+    userID, followed by an itemID, followed by the preference value and an
+    optional timestamp:
+
+    userID,itemID,preference[,timestamp]
+
+    The delimiter is detected from the first line unless given; comma, tab,
+    semicolon, space and '::' (MovieLens) are recognized. Empty lines, lines
+    starting with '#' and a header line are skipped. Files ending with .gz or
+    .bz2 are decompressed while they are read.
+
+    The file is parsed in chunks of about `chunkSize` bytes and the
+    preferences go straight into compact array buffers, without building a
+    dict for the whole data set; with numpy, the buffers are compressed by
+    whole-array passes (see MatrixDataModel.fromArrays), so no python
+    object is held per rating. If a line holds the same user and item as
+    an earlier one, the later value wins.
+
+    When the first rating line holds a timestamp, the timestamps are kept
+    (see MatrixDataModel); lines without one get an unknown time.
+
+    After loading, `loadStats` holds the number of ratings read, the time
+    spent and the throughput in ratings per second.
+    '''
+
+    def __init__(self, path, delimiter=None, idType=None, chunkSize=1 << 20,
+            progress=None, userIDMigrator=None, itemIDMigrator=None,
+            quantizer=None):
+        '''
+        FileDataModel Constructor
+
+        `path` the rating file to read.
+
+        `delimiter` the field delimiter; detected from the file if None.
+
+        `idType` the function applied to user and item IDs, such as int or
+        str. If None, IDs are integers when the first line holds integer IDs,
+        strings otherwise.
+
+        `chunkSize` approximate number of bytes parsed at a time.
+
+        `progress` optional function called after each chunk with the number
+        of ratings read so far and the current ratings per second.
+
+        `userIDMigrator` and `itemIDMigrator` optional IDMigrators; when
+        given, the user (item) IDs are read as strings and translated by the
+        migrator to integers, which are the IDs held by the model.
+
+        `quantizer` optional quantizer storing the preference values in
+        fewer bytes (see MatrixDataModel).
+        '''
+        DataModel.__init__(self)
+        self.setIDMigrators(userIDMigrator, itemIDMigrator)
+        self.path = path
+        self.delimiter = delimiter
+        self.idType = idType
+        self.chunkSize = chunkSize
+        self.progress = progress
+        self.quantizer = quantizer
+        self.loadStats = {}
+        self.buildModel()
+
+    def buildModel(self):
+        ''' Read the rating file and build the model '''
+        started = time.time()
+
+        userIndex = {}
+        itemIndex = {}
+        users = array('i')
+        items = array('i')
+        values = array('d')
+        times = None
+
+        delimiter = self.delimiter
+        idType = self.idType
+        lineNumber = 0
+
+        ratingFile = openRatingFile(self.path)
+        try:
+            while True:
+                lines = ratingFile.readlines(self.chunkSize)
+                if not lines:
+                    break
+
+                for line in lines:
+                    lineNumber += 1
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+
+                    if delimiter is None:
+                        delimiter = self._detectDelimiter(line)
+
+                    fields = line.split(delimiter)
+                    if len(fields) < 3:
+                        raise ValueError('Malformed line %d in %s: %r'
+                                         % (lineNumber, self.path, line))
+
+                    try:
+                        value = float(fields[2])
+                    except ValueError:
+                        if not len(values) and not userIndex:
+                            # A header line, such as userId,itemId,rating
+                            continue
+                        raise ValueError('Invalid preference at line %d in %s'
+                                         % (lineNumber, self.path))
+
+                    if idType is None:
+                        idType = self._detectIDType(fields[0], fields[1])
+
+                    if self.userIDMigrator is not None:
+                        userID = self.userIDMigrator.toLongID(
+                                fields[0].strip())
+                    else:
+                        userID = self._parseID(idType, fields[0], 'user',
+                                               lineNumber)
+                    if self.itemIDMigrator is not None:
+                        itemID = self.itemIDMigrator.toLongID(
+                                fields[1].strip())
+                    else:
+                        itemID = self._parseID(idType, fields[1], 'item',
+                                               lineNumber)
+
+                    user = userIndex.get(userID, None)
+                    if user is None:
+                        user = userIndex[userID] = len(userIndex)
+                    item = itemIndex.get(itemID, None)
+                    if item is None:
+                        item = itemIndex[itemID] = len(itemIndex)
+
+                    if not len(values) and len(fields) > 3:
+                        # The first rating has a timestamp: keep them all.
+                        times = array('d')
+
+                    users.append(user)
+                    items.append(item)
+                    values.append(value)
+                    if times is not None:
+                        times.append(self._parseTime(fields, lineNumber))
+
+                if self.progress is not None:
+                    elapsed = time.time() - started
+                    self.progress(len(values),
+                                  len(values) / elapsed if elapsed else 0.0)
+        finally:
+            ratingFile.close()
+
+        # Indexes were assigned in the order IDs were read: renumber them
+        # so they follow the sorted order of the IDs.
+        numRatings = len(values)
+        userIDs, users = self._renumber(userIndex, users)
+        del userIndex
+        itemIDs, items = self._renumber(itemIndex, items)
+        del itemIndex
+
+        if numpy is not None:
+            # Compressed by whole-array passes over the buffers, which are
+            # viewed as numpy arrays without copying them.
+            self._compressArrays(userIDs, itemIDs, users, items,
+                                 _asArray(values), _asArray(times))
+        else:
+            self._build(userIDs, itemIDs, users, items, values, times)
+
+        elapsed = time.time() - started
+        self.loadStats = {'ratings': numRatings,
+                          'seconds': elapsed,
+                          'ratingsPerSecond':
+                                numRatings / elapsed if elapsed else 0.0}
+
+    def _detectDelimiter(self, line):
+        for delimiter in DELIMITERS:
+            if len(line.split(delimiter)) >= 3:
+                return delimiter
+        raise ValueError('Unable to detect the delimiter of %s' % self.path)
+
+    def _parseID(self, idType, field, kind, lineNumber):
+        # The type detected on the first rating may not fit a later line.
+        try:
+            return idType(field.strip())
+        except ValueError:
+            raise ValueError('Invalid %s ID at line %d in %s: %r (pass '
+                             'idType=str for non-numeric IDs)'
+                             % (kind, lineNumber, self.path, field.strip()))
+
+    def _parseTime(self, fields, lineNumber):
+        if len(fields) < 4 or not fields[3].strip():
+            return NO_TIME
+        try:
+            return float(fields[3])
+        except ValueError:
+            raise ValueError('Invalid timestamp at line %d in %s'
+                             % (lineNumber, self.path))
+
+    def _detectIDType(self, userID, itemID):
+        try:
+            int(userID)
+            int(itemID)
+            return int
+        except ValueError:
+            return str
+
+    def _renumber(self, index, positions):
+        '''
+        Return the sorted IDs of `index` and the buffer `positions`
+        translated from the indexes in `index` to indexes in the sorted IDs,
+        a numpy array when numpy is available.
+        '''
+        ids = [None] * len(index)
+        for thingID, position in index.iteritems():
+            ids[position] = thingID
+
+        order = sorted(xrange(len(ids)), key=ids.__getitem__)
+        sortedIDs = [ids[position] for position in order]
+
+        if numpy is not None:
+            renumbered = numpy.empty(len(ids), dtype=numpy.int32)
+            renumbered[order] = numpy.arange(len(ids), dtype=numpy.int32)
+            return sortedIDs, renumbered[_asArray(positions)]
+
+        renumbered = array('i', [0]) * len(ids)
+        for newPosition, oldPosition in enumerate(order):
+            renumbered[oldPosition] = newPosition
+        return sortedIDs, \
+               array('i', (renumbered[position] for position in positions))
+
+
+def _asArray(buffer):
+    ''' A numpy view of the array `buffer`, or None '''
+    if buffer is None:
+        return None
+    if not len(buffer):
+        return numpy.zeros(0, dtype=buffer.typecode)
+    return numpy.frombuffer(buffer, dtype=buffer.typecode)
@@ -0,0 +1,101 @@
+#-*- coding:utf-8 -*-
+
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`idmigrator` -- the ID migrator module
+================================================================
+
+    This module translates external user and item IDs, such as long
+    strings, into dense integer IDs when the data is loaded, so that data
+    models, similarities and recommenders only handle integers. The
+    integers are translated back into the external IDs at the edge of the
+    application.
+
+"""
+
+
+class IDMigrator(object):
+    '''
+    A bidirectional map between external IDs and dense integer IDs, handed
+    out in the order the external IDs are first seen (0, 1, 2, ...).
+
+    The external IDs are kept once, in a list indexed by integer ID; the
+    reverse dict shares the same objects, so every external ID is stored a
+    single time.
+    '''
+
+    def __init__(self, stringIDs=None):
+        '''
+        IDMigrator Constructor
+
+        `stringIDs` optional external IDs to translate first, in order.
+        '''
+        self._stringIDs = []
+        self._longIDs = {}
+        if stringIDs is not None:
+            for stringID in stringIDs:
+                self.toLongID(stringID)
+
+    def __len__(self):
+        return len(self._stringIDs)
+
+    def __contains__(self, stringID):
+        return stringID in self._longIDs
+
+    def toLongID(self, stringID):
+        '''
+        Return the integer ID of the external ID `stringID`, assigning the
+        next free integer the first time it is seen.
+        '''
+        longID = self._longIDs.get(stringID, None)
+        if longID is None:
+            longID = self._longIDs[stringID] = len(self._stringIDs)
+            self._stringIDs.append(stringID)
+        return longID
+
+    def toStringID(self, longID):
+        ''' Return the external ID translated to the integer ID `longID` '''
+        if longID < 0 or longID >= len(self._stringIDs):
+            raise ValueError('ID not found.')
+        return self._stringIDs[longID]
+
+    def toLongIDs(self, stringIDs):
+        ''' Translate a sequence of external IDs '''
+        return [self.toLongID(stringID) for stringID in stringIDs]
+
+    def toStringIDs(self, longIDs):
+        '''
+        Translate a sequence of integer IDs, such as the result of
+        Recommender.recommend, back to the external IDs.
+        '''
+        stringIDs = self._stringIDs
+        return [stringIDs[longID] for longID in longIDs]
+
+
+def migratePreferences(dataS, userMigrator, itemMigrator):
+    '''
+    Return the dict structured data `dataS` ({userID: {itemID: preference}})
+    with every user and item ID translated to integers by `userMigrator` and
+    `itemMigrator`.
+    '''
+    toItemID = itemMigrator.toLongID
+    return dict((userMigrator.toLongID(userID),
+                 dict((toItemID(itemID), value)
+                      for itemID, value in prefs.iteritems()))
+                for userID, prefs in dataS.iteritems())
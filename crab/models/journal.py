@@ -0,0 +1,559 @@
+#-*- coding:utf-8 -*-
+
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`journal` -- the journaled data model module
+================================================================
+
+    This module contains a data model for preferences that keep streaming
+    in. Changes are appended to a journal file and kept in memory as a delta
+    over a compact base snapshot; a compactor folds the delta into a new
+    snapshot from time to time, so the model is never rebuilt from its
+    source.
+
+    A journal directory holds the snapshots (base-<generation>.snapshot) and
+    the journals (journal-<generation>.log). The snapshot of generation N
+    holds every change logged in the journals of the generations before N.
+
+"""
+
+import cPickle
+import os
+import re
+import struct
+import threading
+from bisect import bisect_left
+
+import numpy
+
+from datamodel import DataModel, DictDataModel
+from matrixmodel import MatrixDataModel, NO_TIME
+from snapshot import saveModel, loadModel
+
+_RECORD = struct.Struct('<I')
+_FILE_NAME = re.compile(r'^(base|journal)-(\d+)\.(snapshot|log)$')
+
+
+class _Delta(object):
+    '''
+    The changes logged since a snapshot, by user and by item: every entry
+    is a (value, timestamp) tuple, or None for a removed preference.
+    '''
+
+    def __init__(self):
+        self.users = {}
+        self.items = {}
+        self.size = 0
+        self.maxPref = None
+        self.minPref = None
+
+    def set(self, userID, itemID, entry):
+        self.users.setdefault(userID, {})[itemID] = entry
+        self.items.setdefault(itemID, {})[userID] = entry
+        self.size += 1
+        if entry is not None:
+            value = entry[0]
+            if self.maxPref is None or value > self.maxPref:
+                self.maxPref = value
+            if self.minPref is None or value < self.minPref:
+                self.minPref = value
+
+
+class JournaledDataModel(DataModel):
+    '''
+    A DataModel over a journal directory. Reads merge the base snapshot (a
+    memory-mapped MatrixDataModel, see the snapshot module) with the
+    in-memory deltas; setPreference and removePreference append a record to
+    the journal before changing the delta, so the changes survive a crash.
+
+    compact folds the delta into a new base snapshot and swaps it in. When
+    `compactionThreshold` is given, a background compaction starts as soon
+    as that many changes were logged. Writes go on during a compaction: they
+    are logged to the journal of the next generation.
+
+    Opening the directory again loads the newest snapshot and replays the
+    journals written after it; a record torn by a crash is dropped.
+
+    Like in MatrixDataModel, MaxPreference and MinPreference are the bounds
+    of the values stored since the last compaction. Users left without
+    preferences are dropped by the compaction.
+    '''
+
+    def __init__(self, directory, model=None, compactionThreshold=None,
+            sync=False):
+        '''
+        JournaledDataModel Constructor
+
+        `directory` the journal directory, created if it does not exist.
+
+        `model` optional DataModel saved as the first snapshot when the
+        directory holds none.
+
+        `compactionThreshold` number of logged changes that triggers a
+        background compaction; None to compact only on request.
+
+        `sync` if True, the journal is flushed to disk (fsync) after every
+        change; otherwise a crash of the machine, unlike a crash of the
+        process, may lose the last changes.
+        '''
+        DataModel.__init__(self)
+        self.directory = directory
+        self.compactionThreshold = compactionThreshold
+        self.sync = sync
+        self._lock = threading.RLock()
+        self._compactionLock = threading.Lock()
+        self._compactor = None
+        self._userIDs = None
+        self._itemIDs = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        generations = self._generations()
+        if not generations['base']:
+            saveModel(model if model is not None else DictDataModel({}),
+                      self._path('base', 0))
+            generations['base'] = [0]
+
+        self.generation = generations['base'][-1]
+        self._base = loadModel(self._path('base', self.generation))
+        self._deltas = [_Delta()]
+
+        journals = [generation for generation in generations['journal']
+                    if generation >= self.generation]
+        for generation in journals:
+            self._replay(self._path('journal', generation))
+        self._logGeneration = journals[-1] if journals else self.generation
+        self._log = open(self._path('journal', self._logGeneration), 'ab')
+        self._removeOldFiles(self.generation)
+
+    def __getitem__(self, userID):
+        return self.PreferencesFromUser(userID)
+
+    def __iter__(self):
+        for user in self.UserIDs():
+            yield user, self[user]
+
+    def _path(self, kind, generation):
+        extension = 'snapshot' if kind == 'base' else 'log'
+        return os.path.join(self.directory,
+                            '%s-%08d.%s' % (kind, generation, extension))
+
+    def _generations(self):
+        ''' The sorted generations of the snapshots and of the journals '''
+        generations = {'base': [], 'journal': []}
+        for name in os.listdir(self.directory):
+            match = _FILE_NAME.match(name)
+            if match:
+                generations[match.group(1)].append(int(match.group(2)))
+        for kind in generations:
+            generations[kind].sort()
+        return generations
+
+    def _removeOldFiles(self, generation):
+        ''' Remove the snapshots and journals older than `generation` '''
+        for name in os.listdir(self.directory):
+            match = _FILE_NAME.match(name)
+            if match and int(match.group(2)) < generation:
+                os.remove(os.path.join(self.directory, name))
+
+    def _replay(self, path):
+        '''
+        Apply the records of the journal at `path` to the delta, truncating
+        the journal after the last complete record.
+        '''
+        journal = open(path, 'rb')
+        try:
+            data = journal.read()
+        finally:
+            journal.close()
+
+        offset = 0
+        while offset + _RECORD.size <= len(data):
+            size, = _RECORD.unpack_from(data, offset)
+            end = offset + _RECORD.size + size
+            if end > len(data):
+                break
+            try:
+                userID, itemID, entry = cPickle.loads(
+                        data[offset + _RECORD.size:end])
+            except Exception:
+                break
+            self._deltas[-1].set(userID, itemID, entry)
+            offset = end
+
+        if offset < len(data):
+            journal = open(path, 'r+b')
+            try:
+                journal.truncate(offset)
+            finally:
+                journal.close()
+
+    def _write(self, userID, itemID, entry):
+        ''' Log a change to the journal, then apply it to the delta '''
+        payload = cPickle.dumps((userID, itemID, entry),
+                                cPickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._log.write(_RECORD.pack(len(payload)) + payload)
+            self._log.flush()
+            if self.sync:
+                os.fsync(self._log.fileno())
+            self._deltas[-1].set(userID, itemID, entry)
+            self._userIDs = None
+            self._itemIDs = None
+            size = self._deltas[-1].size
+
+        self._notifyPreferenceChanged(userID, itemID)
+
+        if self.compactionThreshold is not None and \
+                size >= self.compactionThreshold:
+            self.compactInBackground()
+
+    def setPreference(self, userID, itemID, value, timestamp=None):
+        self._write(userID, itemID, (value, timestamp))
+
+    def removePreference(self, userID, itemID):
+        if not self._knownUser(userID):
+            raise ValueError(
+                    'User not found. Change for a suitable exception here!')
+        if self.PreferenceValue(userID, itemID) is not None:
+            self._write(userID, itemID, None)
+
+    def compact(self):
+        '''
+        Fold the changes logged so far into a new base snapshot and swap it
+        in. Writes may go on meanwhile; only one compaction runs at a time.
+        '''
+        with self._compactionLock:
+            with self._lock:
+                delta = self._deltas[-1]
+                if not delta.size:
+                    return
+                # New writes go to the journal of the next generation.
+                generation = self._logGeneration + 1
+                self._log.close()
+                self._log = open(self._path('journal', generation), 'ab')
+                self._logGeneration = generation
+                self._deltas.append(_Delta())
+                base = self._base
+
+            path = self._path('base', generation)
+            saveModel(self._fold(base, delta), path)
+            compacted = loadModel(path)
+
+            with self._lock:
+                self._base = compacted
+                self._deltas.remove(delta)
+                self.generation = generation
+                self._userIDs = None
+                self._itemIDs = None
+            self._removeOldFiles(generation)
+
+    def compactInBackground(self):
+        '''
+        Start a compaction in a background thread, unless one is running,
+        and return the thread.
+        '''
+        with self._lock:
+            if self._compactor is None or not self._compactor.isAlive():
+                self._compactor = threading.Thread(target=self.compact)
+                self._compactor.daemon = True
+                self._compactor.start()
+            return self._compactor
+
+    def waitForCompaction(self):
+        ''' Wait for the background compaction, if any, to finish '''
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def close(self):
+        ''' Wait for the background compaction and close the journal '''
+        self.waitForCompaction()
+        with self._lock:
+            self._log.close()
+
+    def _fold(self, base, delta):
+        '''
+        Return a MatrixDataModel holding the preferences of the snapshot
+        model `base` changed by `delta`, built by whole-array passes over
+        the buffers of `base`.
+        '''
+        ptr = numpy.asarray(base.userPtr, dtype=numpy.int64)
+        size = int(ptr[-1])
+        rows = numpy.repeat(numpy.arange(len(base.userIDs)), numpy.diff(ptr))
+        items = numpy.asarray(base.userItems[:size])
+        values = numpy.asarray(base._decode(base.userValues, 0, size),
+                               dtype=numpy.float64)
+        if base.userTimes is not None:
+            times = numpy.asarray(base.userTimes[:size], dtype=numpy.float64)
+        else:
+            times = numpy.empty(size, dtype=numpy.float64)
+            times.fill(NO_TIME)
+
+        # Drop the preferences of the base changed by the delta.
+        keep = numpy.ones(size, dtype=bool)
+        for userID, prefs in delta.users.iteritems():
+            row = base.userIndex.get(userID, None)
+            if row is None:
+                continue
+            start, end = ptr[row], ptr[row + 1]
+            for itemID in prefs:
+                item = base.itemIndex.get(itemID, None)
+                if item is None:
+                    continue
+                position = bisect_left(base.userItems, item, start, end)
+                if position < end and base.userItems[position] == item:
+                    keep[position] = False
+
+        newUsers, newItems, newValues, newTimes = [], [], [], []
+        for userID, prefs in delta.users.iteritems():
+            for itemID, entry in prefs.iteritems():
+                if entry is not None:
+                    newUsers.append(userID)
+                    newItems.append(itemID)
+                    newValues.append(entry[0])
+                    newTimes.append(entry[1] if entry[1] is not None
+                                    else NO_TIME)
+
+        userIDs, users = self._denseIDs(base.userIDs, rows[keep], newUsers)
+        itemIDs, items = self._denseIDs(base.itemIDs, items[keep], newItems)
+        hasTimes = base.userTimes is not None or \
+                [time for time in newTimes if time != NO_TIME]
+        model = MatrixDataModel.__new__(MatrixDataModel)
+        DataModel.__init__(model)
+        model._compressArrays(userIDs, itemIDs, users, items,
+                numpy.concatenate((values[keep], newValues)),
+                numpy.concatenate((times[keep], newTimes))
+                if hasTimes else None)
+        return model
+
+    def _denseIDs(self, baseIDs, indexes, newIDs):
+        '''
+        Return the sorted IDs of the positions `indexes` of `baseIDs` and of
+        the IDs `newIDs`, with the array of the dense index of each, base
+        positions first. The IDs go through python lists and dicts, so IDs
+        of mixed types keep their own.
+        '''
+        if hasattr(baseIDs, 'tolist'):
+            baseIDs = baseIDs.tolist()
+        present = numpy.unique(indexes).tolist()
+        IDs = sorted(set([baseIDs[index] for index in present]) |
+                     set(newIDs))
+        dense = dict((ID, index) for index, ID in enumerate(IDs))
+        mapping = numpy.zeros(len(baseIDs), dtype=numpy.int64)
+        mapping[present] = [dense[baseIDs[index]] for index in present]
+        return IDs, numpy.concatenate((mapping[indexes],
+                numpy.array([dense[ID] for ID in newIDs], dtype=numpy.int64)))
+
+    def _merge(self, prefs, changes):
+        '''
+        Apply the delta entries `changes` ({ID: entry} dicts, oldest first)
+        to the (ID, preference) list `prefs` and return the result sorted
+        by ID.
+        '''
+        if not changes:
+            return list(prefs)
+
+        merged = dict(prefs)
+        for entries in changes:
+            for key, entry in entries.iteritems():
+                if entry is None:
+                    merged.pop(key, None)
+                else:
+                    merged[key] = entry[0]
+        return sorted(merged.iteritems())
+
+    def _baseCall(self, method, *args):
+        ''' The answer of the base, or None if it does not know the ID '''
+        try:
+            return method(*args)
+        except ValueError:
+            return None
+
+    def _knownUser(self, userID):
+        with self._lock:
+            return userID in self._base.userIndex or \
+                    bool([delta for delta in self._deltas
+                          if userID in delta.users])
+
+    def UserIDs(self):
+        with self._lock:
+            if self._userIDs is None:
+                userIDs = set(self._base.UserIDs())
+                for delta in self._deltas:
+                    userIDs.update(delta.users)
+                self._userIDs = sorted(userIDs)
+            return self._userIDs
+
+    def ItemIDs(self):
+        with self._lock:
+            if self._itemIDs is None:
+                itemIDs = set(self._base.ItemIDs())
+                for delta in self._deltas:
+                    for itemID in delta.items:
+                        if self._itemPrefs(itemID):
+                            itemIDs.add(itemID)
+                        else:
+                            itemIDs.discard(itemID)
+                self._itemIDs = sorted(itemIDs)
+            return self._itemIDs
+
+    def _userPrefs(self, userID):
+        ''' The merged preferences of the user, None if it is unknown '''
+        with self._lock:
+            prefs = self._baseCall(self._base.PreferencesFromUser, userID)
+            changes = [delta.users[userID] for delta in self._deltas
+                       if userID in delta.users]
+            if prefs is None and not changes:
+                return None
+            return self._merge(prefs or [], changes)
+
+    def _itemPrefs(self, itemID):
+        ''' The merged preferences for the item ([] if it is unknown) '''
+        with self._lock:
+            prefs = self._baseCall(self._base.PreferencesForItem, itemID)
+            changes = [delta.items[itemID] for delta in self._deltas
+                       if itemID in delta.items]
+            return self._merge(prefs or [], changes)
+
+    def PreferencesFromUser(self, userID, orderByID=True):
+        prefs = self._userPrefs(userID)
+        if prefs is None:
+            raise ValueError(
+                    'User not found. Change for a suitable exception here!')
+
+        if not orderByID:
+            prefs.sort(key=lambda pref: pref[1], reverse=True)
+        return prefs
+
+    def ItemIDsFromUser(self, userID):
+        return [itemID for itemID, value in self.PreferencesFromUser(userID)]
+
+    def PreferencesForItem(self, itemID, orderByID=True):
+        prefs = self._itemPrefs(itemID)
+        if not prefs:
+            raise ValueError(
+                    'Item not found. Change for a suitable exception here!')
+
+        if not orderByID:
+            prefs.sort(key=lambda pref: pref[1], reverse=True)
+        return prefs
+
+    def _entry(self, userID, itemID):
+        '''
+        The newest delta entry of the preference, or False if the delta
+        does not hold it.
+        '''
+        for delta in reversed(self._deltas):
+            prefs = delta.users.get(userID, None)
+            if prefs is not None and itemID in prefs:
+                return prefs[itemID]
+        return False
+
+    def PreferenceValue(self, userID, itemID):
+        with self._lock:
+            entry = self._entry(userID, itemID)
+            if entry is False:
+                if userID not in self._base.userIndex:
+                    self._checkUser(userID)
+                    return None
+                return self._base.PreferenceValue(userID, itemID)
+        return entry[0] if entry is not None else None
+
+    def PreferenceTime(self, userID, itemID):
+        with self._lock:
+            entry = self._entry(userID, itemID)
+            if entry is False:
+                if userID not in self._base.userIndex:
+                    self._checkUser(userID)
+                    return None
+                return self._base.PreferenceTime(userID, itemID)
+        return entry[1] if entry is not None else None
+
+    def _checkUser(self, userID):
+        if not self._knownUser(userID):
+            raise ValueError(
+                    'User not found. Change for a suitable exception here!')
+
+    def _since(self, prefs, changes, since):
+        ''' Apply the delta entries to the preferences set since `since` '''
+        merged = dict(prefs)
+        for entries in changes:
+            for key, entry in entries.iteritems():
+                if entry is None or entry[1] is None or entry[1] < since:
+                    merged.pop(key, None)
+                else:
+                    merged[key] = entry[0]
+        return sorted(merged.iteritems())
+
+    def PreferencesFromUserSince(self, userID, since):
+        with self._lock:
+            self._checkUser(userID)
+            prefs = self._baseCall(self._base.PreferencesFromUserSince,
+                                   userID, since)
+            return self._since(prefs or [],
+                               [delta.users[userID] for delta in self._deltas
+                                if userID in delta.users], since)
+
+    def PreferencesForItemSince(self, itemID, since):
+        with self._lock:
+            prefs = self._baseCall(self._base.PreferencesForItemSince,
+                                   itemID, since)
+            return self._since(prefs or [],
+                               [delta.items[itemID] for delta in self._deltas
+                                if itemID in delta.items], since)
+
+    def NumUsers(self):
+        return len(self.UserIDs())
+
+    def NumItems(self):
+        return len(self.ItemIDs())
+
+    def NumUsersWithPreferenceFor(self, *itemIDs):
+        if len(itemIDs) == 0:
+            raise ValueError('Illegal number of IDs')
+
+        with self._lock:
+            if not [itemID for itemID in itemIDs for delta in self._deltas
+                    if itemID in delta.items]:
+                return self._base.NumUsersWithPreferenceFor(*itemIDs)
+
+            itemsUsers = [set([userID for userID, value in
+                               self.PreferencesForItem(itemID)])
+                          for itemID in itemIDs]
+        itemsUsers.sort(key=len)
+        return len(itemsUsers[0].intersection(*itemsUsers[1:]))
+
+    def hasPreferenceValues(self):
+        return True
+
+    def MaxPreference(self):
+        with self._lock:
+            values = [value for value in [self._base.MaxPreference()] +
+                      [delta.maxPref for delta in self._deltas]
+                      if value is not None]
+        return max(values) if values else None
+
+    def MinPreference(self):
+        with self._lock:
+            values = [value for value in [self._base.MinPreference()] +
+                      [delta.minPref for delta in self._deltas]
+                      if value is not None]
+        return min(values) if values else None
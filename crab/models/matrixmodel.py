@@ -0,0 +1,824 @@
+#-*- coding:utf-8 -*-
+
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`matrixmodel` -- the compressed matrix data model module
+================================================================
+
+    This module contains data models that map user and item IDs to dense
+    integer indexes and keep the preferences in compressed, array-backed
+    buffers instead of nested python dicts.
+
+"""
+
+from array import array
+from bisect import bisect_left
+from math import sqrt
+from datamodel import DataModel, PreferenceStats
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Minimum length ratio of two slices for countIntersection to search the
+# values of the shorter one in the longer one instead of merging them.
+GALLOP_RATIO = 16
+
+# Time stored for the preferences whose time is unknown, when others have one.
+NO_TIME = float('-inf')
+
+
+def _countingSort(keys, numKeys, positions):
+    '''
+    Stable counting sort of `positions` by ``keys[position]``.
+
+    Return the offsets of each key (numKeys + 1 entries) and the sorted list
+    of positions.
+    '''
+    offsets = [0] * (numKeys + 1)
+    for position in positions:
+        offsets[keys[position] + 1] += 1
+    for key in xrange(numKeys):
+        offsets[key + 1] += offsets[key]
+
+    cursor = offsets[:-1]
+    ordered = array('l', [0]) * offsets[-1]
+    for position in positions:
+        key = keys[position]
+        ordered[cursor[key]] = position
+        cursor[key] += 1
+
+    return offsets, ordered
+
+
+def compressPreferences(numUsers, numItems, users, items):
+    '''
+    Compress the preferences given in coordinate format (the parallel
+    sequences `users` and `items` of dense indexes) by user and by item.
+
+    Return the tuple (userPtr, userOrder, itemPtr, itemOrder). The positions
+    in `userOrder` list the preferences sorted by user and then by item (CSR
+    order); the preferences of user ``u`` are at
+    ``userOrder[userPtr[u]:userPtr[u + 1]]``. `itemOrder` is the analogous
+    list sorted by item and then by user (CSC order).
+
+    When the same (user, item) pair appears more than once, only the last
+    occurrence is kept.
+    '''
+    _, byItem = _countingSort(items, numItems, xrange(len(users)))
+    _, byUser = _countingSort(users, numUsers, byItem)
+
+    # Drop repeated pairs, keeping the last one (the sort is stable).
+    userOrder = array('l')
+    for index, position in enumerate(byUser):
+        if index + 1 < len(byUser):
+            nextPosition = byUser[index + 1]
+            if users[nextPosition] == users[position] and \
+                    items[nextPosition] == items[position]:
+                continue
+        userOrder.append(position)
+
+    userPtr, userOrder = _countingSort(users, numUsers, userOrder)
+    itemPtr, itemOrder = _countingSort(items, numItems, userOrder)
+
+    return userPtr, userOrder, itemPtr, itemOrder
+
+
+def countIntersection(first, start1, end1, second, start2, end2):
+    '''
+    Return how many values the sorted slices ``first[start1:end1]`` and
+    ``second[start2:end2]`` have in common.
+
+    When one slice is much shorter than the other, each of its values is
+    searched in the longer one (galloping), so the cost stays near
+    ``m log n`` instead of ``m + n``.
+    '''
+    if end1 - start1 > end2 - start2:
+        first, start1, end1, second, start2, end2 = \
+                second, start2, end2, first, start1, end1
+
+    if start1 == end1:
+        return 0
+
+    if (end1 - start1) * GALLOP_RATIO < end2 - start2:
+        count = 0
+        for value in first[start1:end1].tolist():
+            start2 = bisect_left(second, value, start2, end2)
+            if start2 == end2:
+                break
+            if second[start2] == value:
+                count += 1
+                start2 += 1
+        return count
+
+    return len(set(first[start1:end1].tolist()).intersection(
+            second[start2:end2].tolist()))
+
+
+def intersectSorted(values, second, start, end):
+    '''
+    Return the values of the sorted list `values` that are also found in the
+    sorted slice ``second[start:end]``, keeping their order. Like
+    countIntersection, it gallops when `values` is much shorter.
+    '''
+    if len(values) * GALLOP_RATIO < end - start:
+        common = []
+        for value in values:
+            start = bisect_left(second, value, start, end)
+            if start == end:
+                break
+            if second[start] == value:
+                common.append(value)
+                start += 1
+        return common
+
+    others = set(second[start:end].tolist())
+    return [value for value in values if value in others]
+
+
+def compressTimes(times, userOrder, itemOrder):
+    '''
+    Return the `times` laid out in the user and item order, or a pair of None
+    when there are no times.
+    '''
+    if times is None:
+        return None, None
+
+    return array('d', (times[position] for position in userOrder)), \
+           array('d', (times[position] for position in itemOrder))
+
+
+def _sortRowsByTime(ptr, times):
+    '''
+    Sort the positions of every row of the compressed buffer `ptr` by their
+    `times`. Return the sorted positions and the times in that order, so the
+    preferences of a row set after some time are found by bisection. Positions
+    without a known time sort first.
+    '''
+    order = array('l')
+    sortedTimes = array('d')
+    for row in xrange(len(ptr) - 1):
+        positions = sorted(xrange(ptr[row], ptr[row + 1]),
+                           key=times.__getitem__)
+        order.extend(positions)
+        sortedTimes.extend([times[position] for position in positions])
+
+    return order, sortedTimes
+
+
+class SortedIDs(object):
+    '''
+    The sorted IDs of a model held in a numpy array, such as one mapped
+    from a snapshot file, read as a list of IDs and also used as the index
+    from every ID to its position: get and ``in`` search the array by
+    bisection, so no dict of the IDs is built.
+
+    Only IDs of the type of the array are found: `idType` is the python
+    type of the IDs (str, unicode or int).
+    '''
+
+    def __init__(self, ids, idType):
+        self.array = ids
+        self.idType = idType
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.array[index].tolist()
+        return self.array[index].item()
+
+    def __iter__(self):
+        return iter(self.array.tolist())
+
+    def __array__(self, dtype=None):
+        return self.array if dtype is None else self.array.astype(dtype)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'SortedIDs(%r)' % list(self)
+
+    def tolist(self):
+        return self.array.tolist()
+
+    def get(self, ID, default=None):
+        ''' Return the position of `ID`, or `default` if it is not found '''
+        if not isinstance(ID, self.idType) or isinstance(ID, bool):
+            return default
+        try:
+            position = int(numpy.searchsorted(self.array, ID))
+        except (OverflowError, TypeError, ValueError):
+            return default
+        if position < len(self.array) and self.array[position] == ID:
+            return position
+        return default
+
+    def __contains__(self, ID):
+        return self.get(ID) is not None
+
+    def index(self, ID):
+        position = self.get(ID)
+        if position is None:
+            raise ValueError('%r is not in the IDs' % (ID,))
+        return position
+
+
+def _index(IDs):
+    ''' The index from every ID of `IDs` to its position '''
+    if isinstance(IDs, SortedIDs):
+        return IDs
+    return dict((ID, index) for index, ID in enumerate(IDs))
+
+
+class MatrixDataModel(DataModel):
+    '''
+    A DataModel that maps every user and item ID to a dense integer index and
+    stores the preferences in array-backed buffers, once compressed by user
+    (CSR) and once compressed by item (CSC). It expects the same dictionary
+    as DictDataModel:
+
+    {userID: {itemID:preference, itemID2:preference2},
+     userID2:{itemID:preference3, itemID4:preference5}}
+
+    but does not keep it, so it costs a few bytes per preference instead of
+    the python objects held by the dict based model.
+
+    The preferences of the user with index ``u`` are the item indexes
+    ``userItems[userPtr[u]:userPtr[u + 1]]`` (sorted) and their values
+    ``userValues[userPtr[u]:userPtr[u + 1]]``. The item buffers (`itemPtr`,
+    `itemUsers` and `itemValues`) are laid out the same way. Indexes follow
+    the sorted order of the IDs, so sorting by index is sorting by ID.
+
+    Timestamps, given as a dict of the same shape holding the time of each
+    preference, are stored in two more buffers aligned with the others,
+    `userTimes` and `itemTimes` (None when no time is known). A time index,
+    built on first use, lists the preferences of every row sorted by time, so
+    PreferencesFromUserSince, PreferencesForItemSince and timeSlice search it
+    instead of scanning the preferences.
+
+    A `quantizer` (see the quantizers module) stores the preference values
+    in fewer bytes, such as one byte per rating with LinearQuantizer(0.5)
+    for ratings from 0.5 to 5.0. The values are decoded back into floats by
+    PreferenceValue and the other accessors.
+
+    The count, sum and sum of squares of the values of every user and item
+    are computed in one pass over the buffers on first use, into arrays
+    aligned with UserIDs and ItemIDs (see UserStatsArrays and
+    ItemStatsArrays); UserStats and ItemStats read them.
+    '''
+
+    quantizer = None
+
+    def __init__(self, dataS, timestamps=None, quantizer=None):
+        ''' MatrixDataModel Constructor '''
+        DataModel.__init__(self)
+        self.quantizer = quantizer
+        self.buildModel(dataS, timestamps)
+
+    def __getitem__(self, userID):
+        return self.PreferencesFromUser(userID)
+
+    def __iter__(self):
+        for user in self.userIDs:
+            yield user, self[user]
+
+    def buildModel(self, dataS, timestamps=None):
+        '''
+        Build the model from the dict structured data `dataS` and the
+        optional `timestamps` of its preferences.
+        '''
+        userIDs = sorted(dataS)
+        itemIDs = set()
+        for prefs in dataS.itervalues():
+            itemIDs.update(prefs)
+        itemIDs = sorted(itemIDs)
+
+        userIndex = dict((userID, index)
+                         for index, userID in enumerate(userIDs))
+        itemIndex = dict((itemID, index)
+                         for index, itemID in enumerate(itemIDs))
+
+        users = array('i')
+        items = array('i')
+        values = array('d')
+        times = array('d') if timestamps is not None else None
+        for userID, prefs in dataS.iteritems():
+            user = userIndex[userID]
+            userTimes = timestamps.get(userID, {}) if timestamps else {}
+            for itemID, value in prefs.iteritems():
+                users.append(user)
+                items.append(itemIndex[itemID])
+                values.append(value)
+                if times is not None:
+                    times.append(userTimes.get(itemID, NO_TIME))
+
+        self._build(userIDs, itemIDs, users, items, values, times)
+
+    @classmethod
+    def fromCompressed(cls, userIDs, itemIDs, userPtr, userItems, userValues,
+            itemPtr, itemUsers, itemValues, maxPref, minPref, userTimes=None,
+            itemTimes=None, quantizer=None):
+        '''
+        Create a model over already compressed buffers, without copying them.
+        Any sequences supporting slicing and ``tolist`` can be used, such as
+        arrays or memory-mapped numpy arrays. The value buffers hold the
+        codes of `quantizer` when one is given.
+        '''
+        model = cls.__new__(cls)
+        DataModel.__init__(model)
+        model.quantizer = quantizer
+        model._assign(userIDs, itemIDs, userPtr, userItems, userValues,
+                itemPtr, itemUsers, itemValues, maxPref, minPref, userTimes,
+                itemTimes)
+        return model
+
+    @classmethod
+    def fromArrays(cls, users, items, values=None, timestamps=None,
+            quantizer=None):
+        '''
+        Create a model from preferences in coordinate format: the parallel
+        numpy arrays (or sequences) `users`, `items`, `values` and the
+        optional `timestamps`, holding one preference per position. `values`
+        may be None only for models without preference values, such as
+        BooleanDataModel.
+
+        Every index is built by whole-array numpy passes (unique, argsort,
+        bincount, cumsum) instead of python loops, and the buffers of the
+        model are numpy arrays. When the same (user, item) pair appears more
+        than once, the last occurrence is kept. The values are encoded by
+        `quantizer` when one is given.
+        '''
+        if numpy is None:
+            raise ImportError('fromArrays requires numpy.')
+
+        userIDs, users = numpy.unique(numpy.asarray(users),
+                                      return_inverse=True)
+        itemIDs, items = numpy.unique(numpy.asarray(items),
+                                      return_inverse=True)
+
+        model = cls.__new__(cls)
+        DataModel.__init__(model)
+        if values is not None:
+            model.quantizer = quantizer
+        model._compressArrays(userIDs.tolist(), itemIDs.tolist(), users,
+                              items, values, timestamps)
+        return model
+
+    def _compressArrays(self, userIDs, itemIDs, users, items, values=None,
+            times=None):
+        '''
+        Compress the preferences given as numpy arrays of dense indexes into
+        the sorted `userIDs` and `itemIDs` (`users`, `items`), with their
+        `values` and optional `times`, into the model by whole-array passes.
+        The values are encoded by the quantizer of the model, if any.
+        '''
+        users = numpy.asarray(users)
+        items = numpy.asarray(items)
+
+        # CSR order: by user, then item, sorting a single combined key. The
+        # sort is stable, so repeated pairs stay in input order and the
+        # last one of each run is kept.
+        keys = users.astype(numpy.int64) * len(itemIDs) + items
+        userOrder = numpy.argsort(keys, kind='mergesort')
+        if len(userOrder):
+            sortedKeys = keys[userOrder]
+            last = numpy.ones(len(userOrder), dtype=bool)
+            last[:-1] = sortedKeys[1:] != sortedKeys[:-1]
+            userOrder = userOrder[last]
+            del sortedKeys, last
+        del keys
+
+        # CSC order: a stable sort by item keeps the users sorted.
+        itemOrder = userOrder[numpy.argsort(items[userOrder],
+                                            kind='mergesort')]
+
+        def pointers(indexes, count):
+            ptr = numpy.zeros(count + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(indexes, minlength=count),
+                         out=ptr[1:])
+            return ptr
+
+        def select(sequence, order, dtype):
+            if sequence is None:
+                return None
+            return numpy.asarray(sequence, dtype=dtype)[order]
+
+        userValues = select(values, userOrder, numpy.float64)
+        itemValues = select(values, itemOrder, numpy.float64)
+        if userValues is None:
+            if self.hasPreferenceValues():
+                raise ValueError('values are required by %s'
+                                 % self.__class__.__name__)
+            maxPref = minPref = 1.0 if len(userOrder) else None
+        else:
+            if len(userValues):
+                maxPref = float(userValues.max())
+                minPref = float(userValues.min())
+            else:
+                maxPref = minPref = None
+            if self.quantizer is not None:
+                userValues = self.quantizer.encode(userValues)
+                itemValues = self.quantizer.encode(itemValues)
+
+        self._assign(userIDs, itemIDs,
+                pointers(users[userOrder], len(userIDs)),
+                items[userOrder].astype(numpy.int32),
+                userValues,
+                pointers(items[itemOrder], len(itemIDs)),
+                users[itemOrder].astype(numpy.int32),
+                itemValues,
+                maxPref, minPref,
+                select(times, userOrder, numpy.float64),
+                select(times, itemOrder, numpy.float64))
+
+    def _build(self, userIDs, itemIDs, users, items, values, times=None):
+        '''
+        Compress the coordinate buffers `users`, `items`, `values` and the
+        optional `times` (dense indexes into the sorted `userIDs` and
+        `itemIDs`) into the model.
+        '''
+        userPtr, userOrder, itemPtr, itemOrder = compressPreferences(
+                len(userIDs), len(itemIDs), users, items)
+
+        userValues = array('d', (values[position] for position in userOrder))
+        itemValues = array('d', (values[position] for position in itemOrder))
+        maxPref = max(userValues) if userValues else None
+        minPref = min(userValues) if userValues else None
+        if self.quantizer is not None:
+            userValues = self.quantizer.encode(userValues)
+            itemValues = self.quantizer.encode(itemValues)
+
+        self._assign(userIDs, itemIDs,
+                array('l', userPtr),
+                array('i', (items[position] for position in userOrder)),
+                userValues,
+                array('l', itemPtr),
+                array('i', (users[position] for position in itemOrder)),
+                itemValues,
+                maxPref, minPref,
+                *compressTimes(times, userOrder, itemOrder))
+
+    def _assign(self, userIDs, itemIDs, userPtr, userItems, userValues,
+            itemPtr, itemUsers, itemValues, maxPref, minPref, userTimes=None,
+            itemTimes=None):
+        ''' Install already compressed buffers in the model '''
+        self.userIDs = userIDs
+        self.itemIDs = itemIDs
+        self.userIndex = _index(userIDs)
+        self.itemIndex = _index(itemIDs)
+        self.userPtr = userPtr
+        self.userItems = userItems
+        self.userValues = userValues
+        self.itemPtr = itemPtr
+        self.itemUsers = itemUsers
+        self.itemValues = itemValues
+        self.maxPref = maxPref
+        self.minPref = minPref
+        self.userTimes = userTimes
+        self.itemTimes = itemTimes
+        self._timeIndex = None
+        self._stats = None
+
+    def _decode(self, values, start, end):
+        ''' The preference values of the slice `start`:`end` as floats '''
+        if values is None:
+            return [1.0] * (end - start)
+        if self.quantizer is not None:
+            return self.quantizer.decode(values[start:end])
+        return values[start:end].tolist()
+
+    def _userRow(self, userID):
+        index = self.userIndex.get(userID, None)
+        if index is None:
+            raise ValueError('User not found.')
+        return self.userPtr[index], self.userPtr[index + 1]
+
+    def _itemColumn(self, itemID):
+        index = self.itemIndex.get(itemID, None)
+        if index is None:
+            raise ValueError('Item not found.')
+        return self.itemPtr[index], self.itemPtr[index + 1]
+
+    def UserIDs(self):
+        return self.userIDs
+
+    def ItemIDs(self):
+        return self.itemIDs
+
+    def PreferencesFromUser(self, userID, orderByID=True):
+        start, end = self._userRow(userID)
+        itemIDs = self.itemIDs
+
+        userPrefs = zip([itemIDs[item]
+                         for item in self.userItems[start:end].tolist()],
+                        self._decode(self.userValues, start, end))
+
+        if not orderByID:
+            userPrefs.sort(key=lambda userPref: userPref[1], reverse=True)
+
+        return userPrefs
+
+    def ItemIDsFromUser(self, userID):
+        start, end = self._userRow(userID)
+        itemIDs = self.itemIDs
+        return [itemIDs[item] for item in self.userItems[start:end].tolist()]
+
+    def PreferencesForItem(self, itemID, orderByID=True):
+        start, end = self._itemColumn(itemID)
+        userIDs = self.userIDs
+
+        itemPrefs = zip([userIDs[user]
+                         for user in self.itemUsers[start:end].tolist()],
+                        self._decode(self.itemValues, start, end))
+
+        if not orderByID:
+            itemPrefs.sort(key=lambda itemPref: itemPref[1], reverse=True)
+
+        return itemPrefs
+
+    def PreferenceValue(self, userID, itemID):
+        start, end = self._userRow(userID)
+        item = self.itemIndex.get(itemID, None)
+        if item is None:
+            return None
+
+        position = bisect_left(self.userItems, item, start, end)
+        if position < end and self.userItems[position] == item:
+            return float(self._decode(self.userValues, position,
+                                      position + 1)[0])
+
+        return None
+
+    def PreferenceTime(self, userID, itemID):
+        start, end = self._userRow(userID)
+        item = self.itemIndex.get(itemID, None)
+        if item is None or self.userTimes is None:
+            return None
+
+        position = bisect_left(self.userItems, item, start, end)
+        if position < end and self.userItems[position] == item:
+            time = self.userTimes[position]
+            if time != NO_TIME:
+                return float(time)
+
+        return None
+
+    def _getTimeIndex(self):
+        '''
+        Return the time index, building it on first use: for the user rows
+        and for the item columns, the positions of every row sorted by time
+        and the times in that order.
+        '''
+        if self._timeIndex is None:
+            if self.userTimes is None:
+                raise ValueError('The model has no timestamps.')
+            self._timeIndex = (
+                    _sortRowsByTime(self.userPtr, self.userTimes),
+                    _sortRowsByTime(self.itemPtr, self.itemTimes))
+        return self._timeIndex
+
+    def _positionsSince(self, rowIndex, start, end, since):
+        ''' Positions of the row `start`:`end` set at or after `since` '''
+        order, times = rowIndex
+        first = bisect_left(times, since, start, end)
+        return sorted(order[first:end].tolist())
+
+    def PreferencesFromUserSince(self, userID, since):
+        start, end = self._userRow(userID)
+        positions = self._positionsSince(self._getTimeIndex()[0], start, end,
+                                         since)
+        itemIDs = self.itemIDs
+        items = self.userItems
+        values = self.userValues
+        return [(itemIDs[items[position]],
+                 self._decode(values, position, position + 1)[0])
+                for position in positions]
+
+    def PreferencesForItemSince(self, itemID, since):
+        start, end = self._itemColumn(itemID)
+        positions = self._positionsSince(self._getTimeIndex()[1], start, end,
+                                         since)
+        userIDs = self.userIDs
+        users = self.itemUsers
+        values = self.itemValues
+        return [(userIDs[users[position]],
+                 self._decode(values, position, position + 1)[0])
+                for position in positions]
+
+    def timeSlice(self, start=None, end=None):
+        '''
+        Return a new model of the same class holding only the preferences set
+        at or after `start` and before `end` (either bound may be None).
+        Users and items without preferences in the slice are left out.
+        '''
+        if self.userTimes is None:
+            raise ValueError('The model has no timestamps.')
+
+        rows = []
+        items = set()
+        for user in xrange(len(self.userIDs)):
+            positions = self._positionsSlice(self.userPtr[user],
+                    self.userPtr[user + 1], start, end)
+            if positions:
+                rows.append((user, positions))
+                items.update([self.userItems[position]
+                              for position in positions])
+
+        items = sorted(items)
+        newItem = dict((item, index) for index, item in enumerate(items))
+
+        sliceUsers = array('i')
+        sliceItems = array('i')
+        sliceValues = array('d')
+        sliceTimes = array('d')
+        for newUser, (user, positions) in enumerate(rows):
+            for position in positions:
+                sliceUsers.append(newUser)
+                sliceItems.append(newItem[self.userItems[position]])
+                sliceValues.append(self._decode(self.userValues, position,
+                                                position + 1)[0])
+                sliceTimes.append(self.userTimes[position])
+
+        model = self.__class__.__new__(self.__class__)
+        DataModel.__init__(model)
+        model.quantizer = self.quantizer
+        model._build([self.userIDs[user] for user, positions in rows],
+                     [self.itemIDs[item] for item in items],
+                     sliceUsers, sliceItems, sliceValues, sliceTimes)
+        return model
+
+    def _positionsSlice(self, rowStart, rowEnd, start, end):
+        ''' Positions of the user row set in the interval [start, end) '''
+        order, times = self._getTimeIndex()[0]
+        first = rowStart if start is None else \
+                bisect_left(times, start, rowStart, rowEnd)
+        last = rowEnd if end is None else \
+                bisect_left(times, end, rowStart, rowEnd)
+        return order[first:last].tolist()
+
+    def _getStats(self):
+        '''
+        Return the stats arrays, building them on first use: for the user
+        rows and for the item columns, the tuple (counts, sums, sumsSq,
+        means, norms).
+        '''
+        if self._stats is None:
+            self._stats = (self._rowStats(self.userPtr, self.userValues),
+                           self._rowStats(self.itemPtr, self.itemValues))
+        return self._stats
+
+    def _rowStats(self, ptr, values):
+        '''
+        The counts, sums, sums of squares, means (0.0 for empty rows) and
+        norms of the rows of `values`.
+        '''
+        numRows = len(ptr) - 1
+        size = int(ptr[numRows]) if numRows >= 0 else 0
+
+        if numpy is not None:
+            ptr = numpy.asarray(ptr, dtype=numpy.int64)
+            counts = numpy.diff(ptr)
+            if values is None:
+                sums = sumsSq = counts.astype(numpy.float64)
+            else:
+                if self.quantizer is None:
+                    values = numpy.asarray(values[:size],
+                                           dtype=numpy.float64)
+                else:
+                    values = numpy.asarray(self._decode(values, 0, size),
+                                           dtype=numpy.float64)
+                rows = numpy.repeat(numpy.arange(numRows), counts)
+                sums = numpy.bincount(rows, weights=values,
+                                      minlength=numRows)
+                sumsSq = numpy.bincount(rows, weights=values * values,
+                                        minlength=numRows)
+            return counts, sums, sumsSq, \
+                    sums / numpy.maximum(counts, 1), numpy.sqrt(sumsSq)
+
+        counts = array('l')
+        sums = array('d')
+        sumsSq = array('d')
+        for row in xrange(numRows):
+            start, end = ptr[row], ptr[row + 1]
+            rowValues = self._decode(values, start, end)
+            counts.append(end - start)
+            sums.append(sum(rowValues))
+            sumsSq.append(sum([value * value for value in rowValues]))
+        return counts, sums, sumsSq, \
+                array('d', [total / count if count else 0.0
+                            for count, total in zip(counts, sums)]), \
+                array('d', [sqrt(total) for total in sumsSq])
+
+    def UserStatsArrays(self):
+        '''
+        Return the tuple (counts, sums, sumsSq, means, norms) of the users,
+        aligned with UserIDs. The mean of a user without preferences is 0.0.
+        '''
+        return self._getStats()[0]
+
+    def ItemStatsArrays(self):
+        '''
+        Return the tuple (counts, sums, sumsSq, means, norms) of the items,
+        aligned with ItemIDs.
+        '''
+        return self._getStats()[1]
+
+    def UserStats(self, userID):
+        index = self.userIndex.get(userID, None)
+        if index is None:
+            raise ValueError('User not found.')
+        counts, sums, sumsSq = self._getStats()[0][:3]
+        return PreferenceStats(int(counts[index]), float(sums[index]),
+                               float(sumsSq[index]))
+
+    def ItemStats(self, itemID):
+        index = self.itemIndex.get(itemID, None)
+        if index is None:
+            raise ValueError('Item not found.')
+        counts, sums, sumsSq = self._getStats()[1][:3]
+        return PreferenceStats(int(counts[index]), float(sums[index]),
+                               float(sumsSq[index]))
+
+    def NumUsers(self):
+        return len(self.userIDs)
+
+    def NumItems(self):
+        return len(self.itemIDs)
+
+    def NumUsersWithPreferenceFor(self, *itemIDs):
+        if len(itemIDs) == 0:
+            raise ValueError('Illegal number of IDs')
+
+        if len(itemIDs) == 1:
+            start, end = self._itemColumn(itemIDs[0])
+            return end - start
+
+        if len(itemIDs) == 2:
+            return self.ItemOverlap(itemIDs[0], itemIDs[1])[2]
+
+        # Intersect the columns from the shortest one: the common users
+        # only get fewer, so the later columns are mostly galloped.
+        columns = sorted([self._itemColumn(itemID) for itemID in itemIDs],
+                         key=lambda column: column[1] - column[0])
+        start, end = columns[0]
+        users = self.itemUsers[start:end].tolist()
+        for start, end in columns[1:]:
+            users = intersectSorted(users, self.itemUsers, start, end)
+            if not users:
+                return 0
+
+        return len(users)
+
+    def UserOverlap(self, userID1, userID2):
+        '''
+        Return the tuple (n1, n2, n12): the number of items each user has a
+        preference for and the number of items both have preferences for.
+        '''
+        start1, end1 = self._userRow(userID1)
+        start2, end2 = self._userRow(userID2)
+
+        return end1 - start1, end2 - start2, countIntersection(
+                self.userItems, start1, end1, self.userItems, start2, end2)
+
+    def ItemOverlap(self, itemID1, itemID2):
+        '''
+        Return the tuple (n1, n2, n12): the number of users with a preference
+        for each item and the number of users with preferences for both.
+        '''
+        start1, end1 = self._itemColumn(itemID1)
+        start2, end2 = self._itemColumn(itemID2)
+
+        return end1 - start1, end2 - start2, countIntersection(
+                self.itemUsers, start1, end1, self.itemUsers, start2, end2)
+
+    def hasPreferenceValues(self):
+        return True
+
+    def MaxPreference(self):
+        return self.maxPref
+
+    def MinPreference(self):
+        return self.minPref
@@ -0,0 +1,130 @@
+#-*- coding:utf-8 -*-
+
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`quantizers` -- the preference quantizers module
+================================================================
+
+    This module contains quantizers, which store the preference values of
+    a MatrixDataModel in fewer bytes than a double. A quantizer encodes a
+    sequence of values into a compact buffer and decodes slices of that
+    buffer back into floats.
+
+"""
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class LinearQuantizer(object):
+    '''
+    Store every preference as one unsigned byte: the value is
+    ``offset + step * code``, with code in [0, 255]. For ratings from 0.5 to
+    5.0 in half steps, LinearQuantizer(0.5) stores each rating exactly in
+    one byte instead of eight.
+
+    Values that are not on the declared scale raise ValueError when encoded.
+    '''
+
+    dtype = '<u1'
+
+    def __init__(self, step, offset=0.0):
+        '''
+        LinearQuantizer Constructor
+
+        `step` the difference between two consecutive values.
+
+        `offset` the value stored as code 0.
+        '''
+        if step <= 0:
+            raise ValueError('step must be positive.')
+        self.step = float(step)
+        self.offset = float(offset)
+
+    def encode(self, values):
+        ''' Return the codes of `values` in a compact buffer '''
+        if numpy is not None:
+            values = numpy.asarray(values, dtype=numpy.float64)
+            codes = numpy.rint((values - self.offset) / self.step)
+            if len(codes) and (codes.min() < 0 or codes.max() > 255 or
+                    numpy.abs(codes * self.step + self.offset - values).max()
+                        > 1e-9):
+                raise ValueError('Preference values off the scale of %r'
+                                 % self)
+            return codes.astype(numpy.uint8)
+
+        codes = array('B')
+        for value in values:
+            code = int(round((value - self.offset) / self.step))
+            if code < 0 or code > 255 or \
+                    abs(code * self.step + self.offset - value) > 1e-9:
+                raise ValueError('Preference value %r off the scale of %r'
+                                 % (value, self))
+            codes.append(code)
+        return codes
+
+    def decode(self, codes):
+        ''' Return the values of the slice of codes `codes` as floats '''
+        step = self.step
+        offset = self.offset
+        return [offset + step * code for code in codes.tolist()]
+
+    def parameters(self):
+        ''' The arguments of the constructor, as a dict '''
+        return {'step': self.step, 'offset': self.offset}
+
+    def __repr__(self):
+        return 'LinearQuantizer(%r, %r)' % (self.step, self.offset)
+
+
+class Float16Quantizer(object):
+    '''
+    Store every preference as a half precision float (two bytes). Integers
+    up to 2048 and halves up to 1024 are exact; other values keep about
+    three significant digits. Requires numpy.
+    '''
+
+    dtype = '<f2'
+
+    def encode(self, values):
+        ''' Return `values` as a float16 numpy array '''
+        if numpy is None:
+            raise ImportError('Float16Quantizer requires numpy.')
+        return numpy.asarray(values, dtype=numpy.float16)
+
+    def decode(self, codes):
+        ''' Return the values of the slice `codes` as floats '''
+        return codes.tolist()
+
+    def parameters(self):
+        ''' The arguments of the constructor, as a dict '''
+        return {}
+
+    def __repr__(self):
+        return 'Float16Quantizer()'
+
+
+# The quantizers by class name, as saved in snapshot files.
+QUANTIZERS = {
+    'LinearQuantizer': LinearQuantizer,
+    'Float16Quantizer': Float16Quantizer}
@@ -0,0 +1,262 @@
+#-*- coding:utf-8 -*-
+
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`snapshot` -- the binary snapshot module
+================================================================
+
+    This module saves data models to a versioned binary file and opens them
+    again through mmap, so loading a model does not rebuild it and every
+    process reading the same file shares its pages.
+
+    A snapshot file starts with the magic string, the format version and the
+    length of a pickled header. The header holds the metadata (maximum and
+    minimum preferences, the class name and parameters of the quantizer)
+    and the dtype, length and offset of every array. The arrays follow, each
+    one aligned to ALIGNMENT bytes.
+
+    The sorted user and item IDs are arrays of the file as well when they
+    are all strings or all integers: the loaded model searches them by
+    bisection (see SortedIDs), so the ID maps are shared through the mmap
+    too. Other IDs are pickled in the header and indexed by every process.
+
+"""
+
+import cPickle
+import mmap
+import os
+import struct
+import numpy
+
+from matrixmodel import MatrixDataModel, SortedIDs
+from booleanmodel import BooleanDataModel
+from quantizers import QUANTIZERS
+
+MAGIC = 'CRABSNAP'
+VERSION = 2
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct('<8sIQ')
+
+_MODEL_ARRAYS = (
+        ('userPtr', '<i8'),
+        ('userItems', '<i4'),
+        ('userValues', '<f8'),
+        ('itemPtr', '<i8'),
+        ('itemUsers', '<i4'),
+        ('itemValues', '<f8'),
+        ('userTimes', '<f8'),
+        ('itemTimes', '<f8'))
+
+
+# The types of the IDs stored as arrays, by the name saved in the header.
+_ID_TYPES = {
+        'int': (int, long),
+        'str': str,
+        'unicode': unicode}
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def writeArrays(path, arrays, metadata):
+    '''
+    Write the named `arrays` (a list of (name, dtype, sequence) tuples) and
+    the picklable `metadata` to the snapshot file at `path`.
+
+    The file is written aside and renamed over `path`, so readers never see
+    a partially written snapshot.
+    '''
+    arrays = [(name, numpy.asarray(values, dtype=dtype))
+              for name, dtype, values in arrays]
+
+    layout = {}
+    offset = 0
+    for name, values in arrays:
+        layout[name] = (values.dtype.str, len(values), offset)
+        offset = _aligned(offset + values.nbytes)
+
+    header = cPickle.dumps({'arrays': layout, 'metadata': metadata},
+                           cPickle.HIGHEST_PROTOCOL)
+    dataStart = _aligned(_PREAMBLE.size + len(header))
+
+    tmpPath = path + '.tmp'
+    snapshotFile = open(tmpPath, 'wb')
+    try:
+        snapshotFile.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        snapshotFile.write(header)
+        for name, values in arrays:
+            snapshotFile.seek(dataStart + layout[name][2])
+            snapshotFile.write(values.tobytes())
+        snapshotFile.flush()
+        os.fsync(snapshotFile.fileno())
+    finally:
+        snapshotFile.close()
+
+    os.rename(tmpPath, path)
+
+
+def readArrays(path):
+    '''
+    Open the snapshot file at `path` and return the tuple (arrays, metadata),
+    where `arrays` maps every name to a read-only numpy array backed by the
+    memory-mapped file.
+    '''
+    snapshotFile = open(path, 'rb')
+    try:
+        buf = mmap.mmap(snapshotFile.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        snapshotFile.close()
+
+    if len(buf) < _PREAMBLE.size:
+        raise ValueError('Not a crab snapshot file: %s' % path)
+
+    magic, version, headerSize = _PREAMBLE.unpack(buf[:_PREAMBLE.size])
+    if magic != MAGIC:
+        raise ValueError('Not a crab snapshot file: %s' % path)
+    if version > VERSION:
+        raise ValueError('Unsupported snapshot version %d' % version)
+
+    header = cPickle.loads(
+            buf[_PREAMBLE.size:_PREAMBLE.size + headerSize])
+    dataStart = _aligned(_PREAMBLE.size + headerSize)
+
+    arrays = {}
+    for name, (dtype, count, offset) in header['arrays'].iteritems():
+        if count:
+            arrays[name] = numpy.frombuffer(buf, dtype=dtype, count=count,
+                                            offset=dataStart + offset)
+        else:
+            arrays[name] = numpy.zeros(0, dtype=dtype)
+
+    return arrays, header['metadata']
+
+
+def _idArray(IDs):
+    '''
+    Return the tuple (array, type name) of the sorted `IDs` stored as an
+    array, or None when they must be pickled: empty, of mixed or other
+    types, out of the int64 range or not strictly increasing.
+    '''
+    if isinstance(IDs, SortedIDs):
+        for name, idType in _ID_TYPES.iteritems():
+            if idType is IDs.idType:
+                return IDs.array, name
+    if not len(IDs):
+        return None
+
+    types = set([type(ID) for ID in IDs])
+    if types <= set([int, long]):
+        name, dtype = 'int', '<i8'
+    elif types == set([str]) or types == set([unicode]):
+        # Fixed width strings drop trailing NULs.
+        if [ID for ID in IDs if ID.endswith('\0')]:
+            return None
+        name, dtype = types.pop().__name__, None
+    else:
+        return None
+
+    try:
+        ids = numpy.array(IDs, dtype=dtype)
+    except OverflowError:
+        return None
+    if not (ids[1:] > ids[:-1]).all():
+        return None
+    return ids, name
+
+
+def saveModel(model, path):
+    '''
+    Save the data model `model` to the snapshot file at `path`. Models other
+    than MatrixDataModel are compressed first. Buffers the model does not
+    have, such as the values of a BooleanDataModel or missing timestamps,
+    are not written. Quantized values are written as their codes, in the
+    dtype of the quantizer of the model.
+    '''
+    if not isinstance(model, MatrixDataModel):
+        model = MatrixDataModel(dict(
+                (userID, dict(model.PreferencesFromUser(userID)))
+                for userID in model.UserIDs()),
+                getattr(model, 'timestamps', None) or None)
+
+    quantizer = model.quantizer
+    metadata = {'maxPref': model.maxPref,
+                'minPref': model.minPref,
+                'hasPreferenceValues': model.hasPreferenceValues(),
+                'quantizer': None if quantizer is None else
+                        (quantizer.__class__.__name__,
+                         quantizer.parameters())}
+
+    valueType = quantizer.dtype if quantizer is not None else None
+    arrays = [(name, valueType if valueType is not None and
+                   name in ('userValues', 'itemValues') else dtype,
+               getattr(model, name))
+              for name, dtype in _MODEL_ARRAYS
+              if getattr(model, name) is not None]
+
+    for name in ('userIDs', 'itemIDs'):
+        IDs = getattr(model, name)
+        stored = _idArray(IDs)
+        if stored is None:
+            metadata[name] = list(IDs)
+        else:
+            ids, typeName = stored
+            arrays.append((name, ids.dtype.str, ids))
+            metadata[name + 'Type'] = typeName
+
+    writeArrays(path, arrays, metadata)
+
+
+def _loadIDs(arrays, metadata, name):
+    ''' The IDs `name` of a snapshot, mapped when stored as an array '''
+    if name in arrays:
+        return SortedIDs(arrays[name], _ID_TYPES[metadata[name + 'Type']])
+    return metadata[name]
+
+
+def _loadQuantizer(metadata):
+    quantizer = metadata.get('quantizer')
+    if quantizer is None:
+        return None
+    name, parameters = quantizer
+    if name not in QUANTIZERS:
+        raise ValueError('Unknown quantizer %s' % name)
+    return QUANTIZERS[name](**parameters)
+
+
+def loadModel(path):
+    '''
+    Load the data model saved at `path`. The returned MatrixDataModel reads
+    its preferences, and its IDs when they are strings or integers, straight
+    from the memory-mapped file.
+    '''
+    arrays, metadata = readArrays(path)
+
+    if metadata.get('hasPreferenceValues', True):
+        modelClass = MatrixDataModel
+    else:
+        modelClass = BooleanDataModel
+
+    return modelClass.fromCompressed(_loadIDs(arrays, metadata, 'userIDs'),
+            _loadIDs(arrays, metadata, 'itemIDs'), arrays['userPtr'],
+            arrays['userItems'], arrays.get('userValues'), arrays['itemPtr'],
+            arrays['itemUsers'], arrays.get('itemValues'), metadata['maxPref'],
+            metadata['minPref'], arrays.get('userTimes'),
+            arrays.get('itemTimes'), _loadQuantizer(metadata))
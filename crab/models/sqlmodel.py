@@ -0,0 +1,444 @@
+#-*- coding:utf-8 -*-
+
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`sqlmodel` -- the database data model module
+================================================================
+
+    This module contains data models that answer the queries from a
+    preference table kept in a relational database (SQLite).
+
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from Queue import Queue, Empty
+
+from datamodel import DataModel, PreferencesView
+
+# SQLite accepts at most 999 host parameters per statement.
+MAX_BATCH_SIZE = 500
+
+
+class ConnectionPool(object):
+    '''
+    A fixed size pool of database connections shared by multiple threads.
+    Each connection is used by a single thread at a time.
+    '''
+
+    def __init__(self, connect, size):
+        '''
+        `connect` function that opens a new connection.
+
+        `size` maximum number of open connections.
+        '''
+        self.connect = connect
+        self.size = size
+        self._idle = Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        ''' Borrow a connection, blocking while all of them are in use '''
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+
+        self._lock.acquire()
+        try:
+            canOpen = self._opened < self.size
+            if canOpen:
+                self._opened += 1
+        finally:
+            self._lock.release()
+
+        if canOpen:
+            return self.connect()
+        return self._idle.get()
+
+    def close(self):
+        ''' Close the connections that are not in use '''
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+
+class RowCache(object):
+    '''
+    A thread safe cache of preference rows that evicts the least recently
+    used row once it holds more than `maxSize` rows.
+
+    Every discard or clear bumps `generation`: a row fetched before a write
+    is only put if the generation read before the fetch is still current,
+    so a stale row never outlives the invalidation.
+    '''
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.generation = 0
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            row = self._rows.pop(key, None)
+            if row is not None:
+                self._rows[key] = row
+            return row
+        finally:
+            self._lock.release()
+
+    def put(self, key, row, generation=None):
+        ''' Cache `row`, unless `generation` is given and no longer current '''
+        if not self.maxSize:
+            return
+        self._lock.acquire()
+        try:
+            if generation is not None and generation != self.generation:
+                return
+            self._rows.pop(key, None)
+            self._rows[key] = row
+            while len(self._rows) > self.maxSize:
+                self._rows.popitem(last=False)
+        finally:
+            self._lock.release()
+
+    def discard(self, key):
+        self._lock.acquire()
+        try:
+            self.generation += 1
+            self._rows.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self.generation += 1
+            self._rows.clear()
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class SQLiteDataModel(DataModel):
+    '''
+    A DataModel backed by a preference table in a SQLite database:
+
+    CREATE TABLE taste_preferences (
+        user_id, item_id, preference REAL NOT NULL,
+        PRIMARY KEY (user_id, item_id))
+
+    The table and an index by item are created if they do not exist, so
+    every query is answered through an index. Connections come from a pool,
+    so the model can be shared by several threads, and the preferences of
+    the most recently used users and items are kept in row caches to avoid
+    round-trips to the database.
+    '''
+
+    def __init__(self, path, tableName='taste_preferences',
+            userIDColumn='user_id', itemIDColumn='item_id',
+            preferenceColumn='preference', poolSize=4, cacheSize=10000,
+            timeout=30.0):
+        '''
+        SQLiteDataModel Constructor
+
+        `path` the SQLite database file.
+
+        `tableName`, `userIDColumn`, `itemIDColumn` and `preferenceColumn`
+        name the preference table and its columns.
+
+        `poolSize` maximum number of connections opened.
+
+        `cacheSize` maximum number of users and of items whose preferences
+        are cached in memory; 0 disables the cache.
+
+        `timeout` seconds to wait for a lock held by another connection.
+        '''
+        DataModel.__init__(self)
+        self.path = path
+        self.tableName = tableName
+        self.userIDColumn = userIDColumn
+        self.itemIDColumn = itemIDColumn
+        self.preferenceColumn = preferenceColumn
+        self.timeout = timeout
+        self.pool = ConnectionPool(self._connect, poolSize)
+        self._userCache = RowCache(cacheSize)
+        self._itemCache = RowCache(cacheSize)
+        self._summary = {}
+        self._createTable()
+
+    def __getitem__(self, userID):
+        return self.PreferencesFromUser(userID)
+
+    def __iter__(self):
+        for user in self.UserIDs():
+            yield user, self[user]
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                     check_same_thread=False)
+        connection.text_factory = str
+        return connection
+
+    def _createTable(self):
+        self._execute('CREATE TABLE IF NOT EXISTS %s (%s, %s, '
+                      '%s REAL NOT NULL, PRIMARY KEY (%s, %s))' % (
+                          self.tableName, self.userIDColumn,
+                          self.itemIDColumn, self.preferenceColumn,
+                          self.userIDColumn, self.itemIDColumn), commit=True)
+        self._execute('CREATE INDEX IF NOT EXISTS %s_%s_index ON %s (%s, %s)'
+                      % (self.tableName, self.itemIDColumn, self.tableName,
+                         self.itemIDColumn, self.userIDColumn), commit=True)
+
+    def _execute(self, query, parameters=(), commit=False, many=False):
+        with self.pool.connection() as connection:
+            try:
+                if many:
+                    cursor = connection.executemany(query, parameters)
+                else:
+                    cursor = connection.execute(query, parameters)
+                rows = cursor.fetchall()
+                if commit:
+                    connection.commit()
+            except:
+                # A failed write must not go back to the pool holding the
+                # database lock of its open transaction.
+                connection.rollback()
+                raise
+        return rows
+
+    def _fetchRows(self, keyColumn, otherColumn, keys):
+        '''
+        Return a dict with the (other ID, preference) rows of every key in
+        `keys`, ordered by the other ID, fetched in batches of
+        MAX_BATCH_SIZE keys per query.
+        '''
+        rows = dict((key, []) for key in keys)
+        keys = list(keys)
+        for start in xrange(0, len(keys), MAX_BATCH_SIZE):
+            batch = keys[start:start + MAX_BATCH_SIZE]
+            query = 'SELECT %s, %s, %s FROM %s WHERE %s IN (%s) ' \
+                    'ORDER BY %s, %s' % (keyColumn, otherColumn,
+                        self.preferenceColumn, self.tableName, keyColumn,
+                        ','.join('?' * len(batch)), keyColumn, otherColumn)
+            for key, otherID, value in self._execute(query, batch):
+                rows[key].append((otherID, value))
+        return rows
+
+    def _cachedRows(self, cache, keyColumn, otherColumn, keys):
+        found = {}
+        missing = []
+        for key in keys:
+            row = cache.get(key)
+            if row is None:
+                missing.append(key)
+            else:
+                found[key] = row
+
+        if missing:
+            # Read before the fetch: a write meanwhile bumps it.
+            generation = cache.generation
+            for key, row in self._fetchRows(keyColumn, otherColumn,
+                                            missing).iteritems():
+                if row:
+                    row = PreferencesView(row)
+                    cache.put(key, row, generation)
+                    found[key] = row
+
+        return found
+
+    def _sortedByValue(self, prefs, orderByID):
+        if orderByID:
+            return prefs
+        return sorted(prefs, key=lambda pref: pref[1], reverse=True)
+
+    def _summaryValue(self, name, query):
+        '''
+        Return the first column of the rows returned by `query`, cached until
+        the next write.
+        '''
+        # A write meanwhile replaces the dict, dropping the value computed
+        # here.
+        summary = self._summary
+        value = summary.get(name, None)
+        if value is None:
+            value = summary[name] = [row[0] for row in self._execute(query)]
+        return value
+
+    def UserIDs(self):
+        return self._summaryValue('userIDs',
+                'SELECT DISTINCT %s FROM %s ORDER BY %s' % (
+                    self.userIDColumn, self.tableName, self.userIDColumn))
+
+    def ItemIDs(self):
+        return self._summaryValue('itemIDs',
+                'SELECT DISTINCT %s FROM %s ORDER BY %s' % (
+                    self.itemIDColumn, self.tableName, self.itemIDColumn))
+
+    def PreferencesFromUsers(self, userIDs):
+        '''
+        Return a dict with the preferences of the users in `userIDs`, ordered
+        by item ID. The preferences not cached are fetched in batches.
+        '''
+        return self._cachedRows(self._userCache, self.userIDColumn,
+                                self.itemIDColumn, userIDs)
+
+    def PreferencesForItems(self, itemIDs):
+        '''
+        Return a dict with the preferences for the items in `itemIDs`,
+        ordered by user ID. The preferences not cached are fetched in
+        batches.
+        '''
+        return self._cachedRows(self._itemCache, self.itemIDColumn,
+                                self.userIDColumn, itemIDs)
+
+    def PreferencesFromUser(self, userID, orderByID=True):
+        userPrefs = self.PreferencesFromUsers([userID]).get(userID, None)
+
+        if userPrefs is None:
+            raise ValueError('User not found.')
+
+        return self._sortedByValue(userPrefs, orderByID)
+
+    def ItemIDsFromUser(self, userID):
+        return [itemID for itemID, value in self.PreferencesFromUser(userID)]
+
+    def PreferencesForItem(self, itemID, orderByID=True):
+        itemPrefs = self.PreferencesForItems([itemID]).get(itemID, None)
+
+        if itemPrefs is None:
+            raise ValueError('Item not found.')
+
+        return self._sortedByValue(itemPrefs, orderByID)
+
+    def PreferenceValue(self, userID, itemID):
+        userPrefs = self._userCache.get(userID)
+        if userPrefs is not None:
+            for otherItemID, value in userPrefs:
+                if otherItemID == itemID:
+                    return value
+            return None
+
+        rows = self._execute('SELECT %s FROM %s WHERE %s = ? AND %s = ?' % (
+                    self.preferenceColumn, self.tableName,
+                    self.userIDColumn, self.itemIDColumn), (userID, itemID))
+
+        return rows[0][0] if rows else None
+
+    def NumUsers(self):
+        return self._summaryValue('numUsers',
+                'SELECT COUNT(DISTINCT %s) FROM %s' % (
+                    self.userIDColumn, self.tableName))[0]
+
+    def NumItems(self):
+        return self._summaryValue('numItems',
+                'SELECT COUNT(DISTINCT %s) FROM %s' % (
+                    self.itemIDColumn, self.tableName))[0]
+
+    def NumUsersWithPreferenceFor(self, *itemIDs):
+        if len(itemIDs) == 0 or len(itemIDs) > MAX_BATCH_SIZE:
+            raise ValueError('Illegal number of IDs')
+
+        itemIDs = set(itemIDs)
+        query = 'SELECT COUNT(*) FROM (SELECT %s FROM %s WHERE %s IN (%s) ' \
+                'GROUP BY %s HAVING COUNT(*) = ?)' % (self.userIDColumn,
+                    self.tableName, self.itemIDColumn,
+                    ','.join('?' * len(itemIDs)), self.userIDColumn)
+
+        count = self._execute(query, list(itemIDs) + [len(itemIDs)])[0][0]
+        if not count:
+            # No user has them all: check that every item exists.
+            found = self._execute('SELECT COUNT(DISTINCT %s) FROM %s WHERE '
+                                  '%s IN (%s)' % (self.itemIDColumn,
+                                      self.tableName, self.itemIDColumn,
+                                      ','.join('?' * len(itemIDs))),
+                                  list(itemIDs))[0][0]
+            if found < len(itemIDs):
+                raise ValueError('Item not found.')
+        return count
+
+    def setPreference(self, userID, itemID, value):
+        self._execute('INSERT OR REPLACE INTO %s (%s, %s, %s) '
+                      'VALUES (?, ?, ?)' % (self.tableName,
+                          self.userIDColumn, self.itemIDColumn,
+                          self.preferenceColumn),
+                      (userID, itemID, value), commit=True)
+        self._invalidate(userID, itemID)
+
+    def addPreferences(self, dataS):
+        '''
+        Insert the preferences in the dict structured data `dataS`
+        ({userID: {itemID: preference}}) with a single batched statement.
+        '''
+        self._execute('INSERT OR REPLACE INTO %s (%s, %s, %s) '
+                      'VALUES (?, ?, ?)' % (self.tableName,
+                          self.userIDColumn, self.itemIDColumn,
+                          self.preferenceColumn),
+                      [(userID, itemID, value)
+                       for userID, prefs in dataS.iteritems()
+                       for itemID, value in prefs.iteritems()],
+                      commit=True, many=True)
+        self._userCache.clear()
+        self._itemCache.clear()
+        self._summary = {}
+
+    def removePreference(self, userID, itemID):
+        self._execute('DELETE FROM %s WHERE %s = ? AND %s = ?' % (
+                          self.tableName, self.userIDColumn,
+                          self.itemIDColumn),
+                      (userID, itemID), commit=True)
+        self._invalidate(userID, itemID)
+
+    def _invalidate(self, userID, itemID):
+        self._userCache.discard(userID)
+        self._itemCache.discard(itemID)
+        self._summary = {}
+        self._notifyPreferenceChanged(userID, itemID)
+
+    def hasPreferenceValues(self):
+        return True
+
+    def MaxPreference(self):
+        return self._summaryValue('maxPref', 'SELECT MAX(%s) FROM %s' % (
+                    self.preferenceColumn, self.tableName))[0]
+
+    def MinPreference(self):
+        return self._summaryValue('minPref', 'SELECT MIN(%s) FROM %s' % (
+                    self.preferenceColumn, self.tableName))[0]
+
+    def close(self):
+        ''' Close the pooled connections '''
+        self.pool.close()
@@ -0,0 +1,662 @@
+#-*- coding:utf-8 -*-
+
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`views` -- the data model views module
+================================================================
+
+    This module contains data models that present another data model in a
+    different way (hiding some of its preferences, adding session users or
+    swapping in a reloaded model, for instance) without copying its
+    preferences.
+
+"""
+
+import threading
+import weakref
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+
+from datamodel import DataModel, PreferenceStats
+
+
+class MaskedDataModel(DataModel):
+    '''
+    A read-only view of a DataModel that hides some of its preferences, such
+    as the preferences held out by an evaluator. Nothing is copied: every
+    query goes to the underlying model and the hidden preferences are left
+    out of the answer.
+
+    `hidden` maps userIDs to the itemIDs hidden for that user (any container
+    supporting ``in``, such as a set or a {itemID: preference} dict).
+
+    `userIDs`, if given, restricts the view to those users.
+
+    A user whose preferences are all hidden, and an item whose preferences
+    are all hidden, are left out of the view, as they would be from a
+    DictDataModel built from the visible preferences. MaxPreference and
+    MinPreference are those of the underlying model.
+    '''
+
+    def __init__(self, model, hidden=None, userIDs=None):
+        ''' MaskedDataModel Constructor '''
+        DataModel.__init__(self)
+        self.model = model
+        self.hidden = hidden if hidden is not None else {}
+        self._restricted = userIDs is not None
+
+        hiddenItems = set()
+        for itemIDs in self.hidden.itervalues():
+            hiddenItems.update(itemIDs)
+        self._hiddenItems = hiddenItems
+
+        self._removedUsers = set([userID for userID in self.hidden
+                                  if self._allHidden(userID)])
+
+        if self._restricted:
+            self._visibleUsers = set(userIDs) - self._removedUsers
+            self.userIDs = sorted(self._visibleUsers)
+        elif self._removedUsers:
+            self.userIDs = [userID for userID in model.UserIDs()
+                            if userID not in self._removedUsers]
+        else:
+            self.userIDs = model.UserIDs()
+        self._allUsersVisible = not self._restricted and \
+                not self._removedUsers
+        self.itemIDs = None
+
+    def __getitem__(self, userID):
+        return self.PreferencesFromUser(userID)
+
+    def __iter__(self):
+        for user in self.UserIDs():
+            yield user, self[user]
+
+    def dependencies(self):
+        return [self.model]
+
+    def pin(self):
+        return self.model.pin()
+
+    def _allHidden(self, userID):
+        ''' True if the user has preferences and all of them are hidden '''
+        hiddenItems = self.hidden.get(userID, None)
+        if not hiddenItems:
+            return False
+
+        itemIDs = self.model.ItemIDsFromUser(userID)
+        return bool(itemIDs) and \
+                len([itemID for itemID in itemIDs
+                     if itemID not in hiddenItems]) == 0
+
+    def _isVisible(self, userID):
+        if self._restricted:
+            return userID in self._visibleUsers
+        return userID not in self._removedUsers
+
+    def _isHidden(self, userID, itemID):
+        return not self._isVisible(userID) or \
+                itemID in self.hidden.get(userID, ())
+
+    def _checkUser(self, userID):
+        if not self._isVisible(userID):
+            raise ValueError(
+                    'User not found. Change for a suitable exception here!')
+
+    def UserIDs(self):
+        return self.userIDs
+
+    def ItemIDs(self):
+        if self.itemIDs is None:
+            if self._restricted:
+                itemIDs = set()
+                for userID in self.userIDs:
+                    itemIDs.update(self.ItemIDsFromUser(userID))
+                self.itemIDs = sorted(itemIDs)
+            else:
+                self.itemIDs = [itemID for itemID in self.model.ItemIDs()
+                                if itemID not in self._hiddenItems
+                                    or self._hasVisiblePreferences(itemID)]
+        return self.itemIDs
+
+    def _hasVisiblePreferences(self, itemID):
+        for userID, value in self.model.PreferencesForItem(itemID):
+            if not self._isHidden(userID, itemID):
+                return True
+        return False
+
+    def PreferencesFromUser(self, userID, orderByID=True):
+        self._checkUser(userID)
+        prefs = self.model.PreferencesFromUser(userID, orderByID)
+        hiddenItems = self.hidden.get(userID, None)
+        if not hiddenItems:
+            return prefs
+
+        return [(itemID, value) for itemID, value in prefs
+                if itemID not in hiddenItems]
+
+    def ItemIDsFromUser(self, userID):
+        self._checkUser(userID)
+        itemIDs = self.model.ItemIDsFromUser(userID)
+        hiddenItems = self.hidden.get(userID, None)
+        if not hiddenItems:
+            return itemIDs
+
+        return [itemID for itemID in itemIDs if itemID not in hiddenItems]
+
+    def PreferencesForItem(self, itemID, orderByID=True):
+        if self._allUsersVisible and itemID not in self._hiddenItems:
+            return self.model.PreferencesForItem(itemID, orderByID)
+
+        prefs = [(userID, value) for userID, value in
+                 self.model.PreferencesForItem(itemID, orderByID)
+                 if not self._isHidden(userID, itemID)]
+        if not prefs:
+            raise ValueError(
+                    'Item not found. Change for a suitable exception here!')
+
+        return prefs
+
+    def PreferenceValue(self, userID, itemID):
+        self._checkUser(userID)
+        if self._isHidden(userID, itemID):
+            return None
+        return self.model.PreferenceValue(userID, itemID)
+
+    def PreferenceTime(self, userID, itemID):
+        self._checkUser(userID)
+        if self._isHidden(userID, itemID):
+            return None
+        return self.model.PreferenceTime(userID, itemID)
+
+    def PreferencesFromUserSince(self, userID, since):
+        self._checkUser(userID)
+        return [(itemID, value) for itemID, value in
+                self.model.PreferencesFromUserSince(userID, since)
+                if not self._isHidden(userID, itemID)]
+
+    def PreferencesForItemSince(self, itemID, since):
+        return [(userID, value) for userID, value in
+                self.model.PreferencesForItemSince(itemID, since)
+                if not self._isHidden(userID, itemID)]
+
+    def UserStats(self, userID):
+        self._checkUser(userID)
+        if not self.hidden.get(userID, None):
+            return self.model.UserStats(userID)
+        return DataModel.UserStats(self, userID)
+
+    def ItemStats(self, itemID):
+        if self._allUsersVisible and itemID not in self._hiddenItems:
+            return self.model.ItemStats(itemID)
+        return DataModel.ItemStats(self, itemID)
+
+    def NumUsers(self):
+        return len(self.userIDs)
+
+    def NumItems(self):
+        return len(self.ItemIDs())
+
+    def NumUsersWithPreferenceFor(self, *itemIDs):
+        if len(itemIDs) == 0:
+            raise ValueError('Illegal number of IDs')
+
+        if self._allUsersVisible and not [itemID for itemID in itemIDs
+                                          if itemID in self._hiddenItems]:
+            return self.model.NumUsersWithPreferenceFor(*itemIDs)
+
+        itemsUsers = [set([userID for userID, value in
+                           self.PreferencesForItem(itemID)])
+                      for itemID in itemIDs]
+        itemsUsers.sort(key=len)
+        return len(itemsUsers[0].intersection(*itemsUsers[1:]))
+
+    def convertItemID2name(self, itemID):
+        return self.model.convertItemID2name(itemID)
+
+    def convertUserID2name(self, userID):
+        return self.model.convertUserID2name(userID)
+
+    def hasPreferenceValues(self):
+        return self.model.hasPreferenceValues()
+
+    def MaxPreference(self):
+        return self.model.MaxPreference()
+
+    def MinPreference(self):
+        return self.model.MinPreference()
+
+
+def _modelListener(model, view):
+    '''
+    A preference listener of `model` telling `view` that it changed,
+    without keeping `view` alive; once `view` is gone, it unregisters
+    itself from `model` on the next change.
+    '''
+    ref = weakref.ref(view)
+
+    def listener(userID, itemID):
+        view = ref()
+        if view is None:
+            model.removePreferenceListener(listener)
+        else:
+            view._modelChanged(userID, itemID)
+    return listener
+
+
+class PlusAnonymousUserDataModel(DataModel):
+    '''
+    A view of a DataModel plus session users: visitors who are not in the
+    model but already expressed a few preferences. The session users are
+    kept apart, so the underlying model is neither copied nor rebuilt; every
+    query merges them with the answer of the underlying model. Recommenders,
+    similarities and neighborhoods built on this view recommend to session
+    users like to any other user.
+
+    Session users are added and removed at any time, from any thread: each
+    change builds a new set of session dicts and swaps it in under a lock,
+    so a query always sees the session users as they were when it started.
+    Session preferences have no timestamp.
+
+    UserIDs and ItemIDs merge the session IDs into the IDs of the underlying
+    model once per change of either, and return the merged list until the
+    next change. Changes of the underlying model are heard through its
+    preference listeners, or through its ID lists being replaced.
+    '''
+
+    def __init__(self, model):
+        ''' PlusAnonymousUserDataModel Constructor '''
+        DataModel.__init__(self)
+        self.model = model
+        self._lock = threading.Lock()
+        # ({userID: [(itemID, preference)]}, {itemID: {userID: preference}})
+        self._session = ({}, {})
+        # (generation, model IDs, session dict, merged IDs)
+        self._mergedUsers = None
+        self._mergedItems = None
+        # Bumped on every change of the underlying model.
+        self._generation = 0
+        if hasattr(model, 'addPreferenceListener'):
+            model.addPreferenceListener(_modelListener(model, self))
+
+    def __getitem__(self, userID):
+        return self.PreferencesFromUser(userID)
+
+    def __iter__(self):
+        for user in self.UserIDs():
+            yield user, self[user]
+
+    def dependencies(self):
+        return [self.model]
+
+    def pin(self):
+        return self.model.pin()
+
+    def setSessionUser(self, userID, prefs):
+        '''
+        Add the session user `userID` with the preferences `prefs` (a
+        {itemID: preference} dict), replacing the preferences of the session
+        user if it was already added. Raise ValueError if the userID belongs
+        to a user of the underlying model.
+        '''
+        prefs = sorted(prefs.iteritems())
+        with self._lock:
+            users, items = self._session
+            if userID not in users and self._inModel(userID):
+                raise ValueError('User already in the model.')
+            changed = set([itemID for itemID, value in users.get(userID, ())])
+            users, items = self._without(users, items, userID)
+            users[userID] = prefs
+            for itemID, value in prefs:
+                items[itemID] = dict(items.get(itemID, {}))
+                items[itemID][userID] = value
+                changed.add(itemID)
+            self._session = (users, items)
+
+        for itemID in changed:
+            self._notifyPreferenceChanged(userID, itemID)
+
+    def removeSessionUser(self, userID):
+        ''' Remove the session user `userID`, if it was added '''
+        with self._lock:
+            users, items = self._session
+            if userID not in users:
+                return
+            prefs = users[userID]
+            self._session = self._without(users, items, userID)
+
+        for itemID, value in prefs:
+            self._notifyPreferenceChanged(userID, itemID)
+
+    def sessionUserIDs(self):
+        ''' Return the IDs of the session users '''
+        return sorted(self._session[0])
+
+    def _without(self, users, items, userID):
+        ''' Copies of the session dicts without the session user `userID` '''
+        users = dict(users)
+        items = dict(items)
+        for itemID, value in users.pop(userID, ()):
+            itemPrefs = dict(items[itemID])
+            del itemPrefs[userID]
+            if itemPrefs:
+                items[itemID] = itemPrefs
+            else:
+                del items[itemID]
+        return users, items
+
+    def _inModel(self, userID):
+        try:
+            self.model.ItemIDsFromUser(userID)
+        except ValueError:
+            return False
+        return True
+
+    def _modelChanged(self, userID, itemID):
+        self._generation += 1
+
+    def _merged(self, cached, generation, modelIDs, sessionIDs):
+        '''
+        Return the tuple cached for `modelIDs` merged with the keys of
+        `sessionIDs`, or a new one when the model changed since (read
+        before `modelIDs`, its `generation` is stale if it changes while
+        merging) or either list was replaced.
+        '''
+        if cached is not None and cached[0] == generation and \
+                cached[1] is modelIDs and cached[2] is sessionIDs:
+            return cached
+
+        merged = list(modelIDs)
+        for ID in sessionIDs:
+            position = bisect_left(merged, ID)
+            if position == len(merged) or merged[position] != ID:
+                insort(merged, ID)
+        return generation, modelIDs, sessionIDs, merged
+
+    def UserIDs(self):
+        users = self._session[0]
+        if not users:
+            return self.model.UserIDs()
+        generation = self._generation
+        self._mergedUsers = cached = self._merged(self._mergedUsers,
+                generation, self.model.UserIDs(), users)
+        return cached[3]
+
+    def ItemIDs(self):
+        items = self._session[1]
+        if not items:
+            return self.model.ItemIDs()
+        generation = self._generation
+        self._mergedItems = cached = self._merged(self._mergedItems,
+                generation, self.model.ItemIDs(), items)
+        return cached[3]
+
+    def PreferencesFromUser(self, userID, orderByID=True):
+        prefs = self._session[0].get(userID, None)
+        if prefs is None:
+            return self.model.PreferencesFromUser(userID, orderByID)
+
+        prefs = list(prefs)
+        if not orderByID:
+            prefs.sort(key=lambda pref: pref[1], reverse=True)
+        return prefs
+
+    def ItemIDsFromUser(self, userID):
+        prefs = self._session[0].get(userID, None)
+        if prefs is None:
+            return self.model.ItemIDsFromUser(userID)
+        return [itemID for itemID, value in prefs]
+
+    def _modelPreferencesForItem(self, itemID, orderByID=True):
+        ''' The preferences of the underlying model for the item, or [] '''
+        try:
+            return self.model.PreferencesForItem(itemID, orderByID)
+        except ValueError:
+            return []
+
+    def PreferencesForItem(self, itemID, orderByID=True):
+        sessionPrefs = self._session[1].get(itemID, None)
+        if sessionPrefs is None:
+            return self.model.PreferencesForItem(itemID, orderByID)
+
+        prefs = list(self._modelPreferencesForItem(itemID)) + \
+                sessionPrefs.items()
+        if orderByID:
+            prefs.sort()
+        else:
+            prefs.sort(key=lambda pref: pref[1], reverse=True)
+        return prefs
+
+    def PreferenceValue(self, userID, itemID):
+        prefs = self._session[0].get(userID, None)
+        if prefs is None:
+            return self.model.PreferenceValue(userID, itemID)
+        return dict(prefs).get(itemID, None)
+
+    def PreferenceTime(self, userID, itemID):
+        if userID in self._session[0]:
+            return None
+        return self.model.PreferenceTime(userID, itemID)
+
+    def PreferencesFromUserSince(self, userID, since):
+        if userID in self._session[0]:
+            return []
+        return self.model.PreferencesFromUserSince(userID, since)
+
+    def PreferencesForItemSince(self, itemID, since):
+        if itemID in self._session[1]:
+            try:
+                return self.model.PreferencesForItemSince(itemID, since)
+            except ValueError:
+                return []
+        return self.model.PreferencesForItemSince(itemID, since)
+
+    def UserStats(self, userID):
+        prefs = self._session[0].get(userID, None)
+        if prefs is None:
+            return self.model.UserStats(userID)
+        return PreferenceStats.fromValues([value for itemID, value in prefs])
+
+    def ItemStats(self, itemID):
+        sessionPrefs = self._session[1].get(itemID, None)
+        if sessionPrefs is None:
+            return self.model.ItemStats(itemID)
+
+        try:
+            stats = self.model.ItemStats(itemID)
+        except ValueError:
+            stats = PreferenceStats()
+        for value in sessionPrefs.itervalues():
+            stats.add(value)
+        return stats
+
+    def NumUsers(self):
+        return self.model.NumUsers() + len(self._session[0])
+
+    def NumItems(self):
+        return len(self.ItemIDs())
+
+    def NumUsersWithPreferenceFor(self, *itemIDs):
+        if len(itemIDs) == 0:
+            raise ValueError('Illegal number of IDs')
+
+        items = self._session[1]
+        sessionItems = [itemID for itemID in itemIDs if itemID in items]
+        if not sessionItems:
+            return self.model.NumUsersWithPreferenceFor(*itemIDs)
+
+        try:
+            count = self.model.NumUsersWithPreferenceFor(*itemIDs)
+        except ValueError:
+            count = 0
+
+        if len(sessionItems) < len(itemIDs):
+            return count
+
+        itemsUsers = [items[itemID] for itemID in itemIDs]
+        itemsUsers.sort(key=len)
+        return count + len([userID for userID in itemsUsers[0]
+                            if not [itemUsers for itemUsers in itemsUsers[1:]
+                                    if userID not in itemUsers]])
+
+    def convertItemID2name(self, itemID):
+        return self.model.convertItemID2name(itemID)
+
+    def convertUserID2name(self, userID):
+        return self.model.convertUserID2name(userID)
+
+    def hasPreferenceValues(self):
+        return self.model.hasPreferenceValues()
+
+    def _sessionValues(self):
+        return [value for prefs in self._session[0].itervalues()
+                for itemID, value in prefs]
+
+    def MaxPreference(self):
+        values = [value for value in [self.model.MaxPreference()]
+                  if value is not None] + self._sessionValues()
+        return max(values) if values else None
+
+    def MinPreference(self):
+        values = [value for value in [self.model.MinPreference()]
+                  if value is not None] + self._sessionValues()
+        return min(values) if values else None
+
+
+class ReloadableDataModel(DataModel):
+    '''
+    A DataModel that answers from a model built by `loader`, a function
+    returning a new DataModel (such as ``lambda: FileDataModel(path)``).
+    reload calls the loader, possibly in a background thread through
+    refreshInBackground, and swaps the new model in with a single
+    assignment, so the similarities, neighborhoods and recommenders holding
+    this model keep working and are never rebuilt.
+
+    Inside a ``with model.pin():`` block the current thread keeps querying
+    the model that was current when the block started; recommenders pin
+    their model for the duration of recommend, so a recommendation in
+    flight finishes on the model it started with.
+    '''
+
+    def __init__(self, loader, model=None):
+        '''
+        ReloadableDataModel Constructor
+
+        `loader` function returning a new DataModel.
+
+        `model` optional first model; the loader is called if not given.
+        '''
+        DataModel.__init__(self)
+        self.loader = loader
+        self.model = model if model is not None else loader()
+        self._pinned = threading.local()
+
+    def __getitem__(self, userID):
+        return self.PreferencesFromUser(userID)
+
+    def __iter__(self):
+        model = self._current()
+        for user in model.UserIDs():
+            yield user, model.PreferencesFromUser(user)
+
+    def _current(self):
+        ''' The model pinned by the current thread, or the current one '''
+        model = getattr(self._pinned, 'model', None)
+        return model if model is not None else self.model
+
+    def reload(self):
+        self.model = self.loader()
+
+    @contextmanager
+    def pin(self):
+        if getattr(self._pinned, 'model', None) is not None:
+            # Already pinned by an outer block.
+            yield self
+            return
+
+        self._pinned.model = self.model
+        try:
+            yield self
+        finally:
+            self._pinned.model = None
+
+    def UserIDs(self):
+        return self._current().UserIDs()
+
+    def ItemIDs(self):
+        return self._current().ItemIDs()
+
+    def PreferencesFromUser(self, userID, orderByID=True):
+        return self._current().PreferencesFromUser(userID, orderByID)
+
+    def ItemIDsFromUser(self, userID):
+        return self._current().ItemIDsFromUser(userID)
+
+    def PreferencesForItem(self, itemID, orderByID=True):
+        return self._current().PreferencesForItem(itemID, orderByID)
+
+    def PreferenceValue(self, userID, itemID):
+        return self._current().PreferenceValue(userID, itemID)
+
+    def PreferenceTime(self, userID, itemID):
+        return self._current().PreferenceTime(userID, itemID)
+
+    def PreferencesFromUserSince(self, userID, since):
+        return self._current().PreferencesFromUserSince(userID, since)
+
+    def PreferencesForItemSince(self, itemID, since):
+        return self._current().PreferencesForItemSince(itemID, since)
+
+    def UserStats(self, userID):
+        return self._current().UserStats(userID)
+
+    def ItemStats(self, itemID):
+        return self._current().ItemStats(itemID)
+
+    def NumUsers(self):
+        return self._current().NumUsers()
+
+    def NumItems(self):
+        return self._current().NumItems()
+
+    def NumUsersWithPreferenceFor(self, *itemIDs):
+        return self._current().NumUsersWithPreferenceFor(*itemIDs)
+
+    def setPreference(self, userID, itemID, value):
+        self._current().setPreference(userID, itemID, value)
+        self._notifyPreferenceChanged(userID, itemID)
+
+    def removePreference(self, userID, itemID):
+        self._current().removePreference(userID, itemID)
+        self._notifyPreferenceChanged(userID, itemID)
+
+    def convertItemID2name(self, itemID):
+        return self._current().convertItemID2name(itemID)
+
+    def convertUserID2name(self, userID):
+        return self._current().convertUserID2name(userID)
+
+    def hasPreferenceValues(self):
+        return self._current().hasPreferenceValues()
+
+    def MaxPreference(self):
+        return self._current().MaxPreference()
+
+    def MinPreference(self):
+        return self._current().MinPreference()
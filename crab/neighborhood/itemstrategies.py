@@ -47,3 +47,29 @@ class PreferredItemsNeighborhoodStrategy(CandidateItemsStrategy):
         possibleItemIDs = list(set(possibleItemIDs))
 
         return [itemID for itemID in possibleItemIDs if itemID not in itemIDs]
+
+
+class IndexedItemsStrategy(CandidateItemsStrategy):
+    '''
+    Returns the items that have not been rated by the user and that an LSH
+    index over the items (see similarities.lsh, built with byUser=False)
+    returns as candidate neighbors of at least one item the user rated.
+    Unlike PreferredItemsNeighborhoodStrategy, it does not walk the users
+    of every item of the user.
+    '''
+
+    def __init__(self, index):
+        self.index = index
+
+    def dependencies(self):
+        return [self.index]
+
+    def candidateItems(self, userID, model):
+        itemIDs = model.ItemIDsFromUser(userID)
+        rated = set(itemIDs)
+
+        possibleItemIDs = set()
+        for itemID in itemIDs:
+            possibleItemIDs.update(self.index.candidates(itemID))
+
+        return [itemID for itemID in possibleItemIDs if itemID not in rated]
@@ -37,9 +37,21 @@ import random
 
 
 class NearestNUserNeighborhood(Neighborhood):
+    '''
+    Computes the neighborhood of the `numUsers` users most similar to a
+    given user.
+
+    With a `samplingRate` below 1, only a random sample of the users is
+    compared to the given user. The sample is drawn by index in a single
+    pass, without copying or changing the list of users of the model, and
+    is kept in the order of that list.
+
+    With an `index` (see similarities.lsh), only the candidates the index
+    returns for the given user are compared to it, instead of a sample.
+    '''
 
     def __init__(self, similarity, model, numUsers, minSimilarity,
-            samplingRate=1):
+            samplingRate=1, seed=None, strata=None, index=None):
         ''' Constructor Class
 
         `numUsers` neighborhood size; capped at the number of users in the data
@@ -49,11 +61,34 @@ class NearestNUserNeighborhood(Neighborhood):
         neighborhood
 
         `minSimilarity`  minimal similarity required for neighbors
+
+        `seed` optional seed of the sampler, for reproducible samples
+
+        `strata` optional number of activity strata: users are ranked by
+        their number of preferences and split in that many groups of equal
+        size, and every group is sampled at `samplingRate`, so heavy and
+        light users are represented in proportion.
+
+        `index` optional LSH index over the users of the model, giving the
+        candidate neighbors of a user.
         '''
         Neighborhood.__init__(self, similarity, model, samplingRate)
         nUsers = model.NumUsers()
         self.numUsers = nUsers if numUsers > nUsers else numUsers
         self.minSimilarity = minSimilarity
+        self.random = random.Random(seed)
+        self.strata = strata
+        self._strata = None
+        self.index = index
+
+    def dependencies(self):
+        if self.index is None:
+            return [self.model, self.similarity]
+        return [self.model, self.similarity, self.index]
+
+    def reload(self):
+        # The activity of the users may have changed.
+        self._strata = None
 
     def estimatePreference(self, **args):
         #@TODO: How to improve this architecture for estimatePreference as a
@@ -72,7 +107,10 @@ class NearestNUserNeighborhood(Neighborhood):
     def userNeighborhood(self, userID, rescorer=None):
         ''' Return the most similar users to the given userID'''
         # Sampling
-        userIDs = self.getSampleUserIDs()
+        if self.index is not None:
+            userIDs = self.index.candidates(userID)
+        else:
+            userIDs = self.getSampleUserIDs()
 
         if not userIDs:
             return []
@@ -83,6 +121,11 @@ class NearestNUserNeighborhood(Neighborhood):
         return rec_users
 
     def getSampleUserIDs(self):
+        '''
+        Return the users to compare with, a sample of `samplingRate` of the
+        users of the model. The list of the model is never changed: when
+        every user is kept it is returned as is, and must not be modified.
+        '''
         userIDs = self.model.UserIDs()
 
         numberOfUsers = int(float(self.samplingRate) * len(userIDs))
@@ -91,12 +134,48 @@ class NearestNUserNeighborhood(Neighborhood):
             return userIDs
         elif numberOfUsers == 0:
             return []
+
+        if self.strata:
+            indexes = self._stratifiedSample(userIDs, numberOfUsers)
         else:
-            total_users = 0
-            length = len(userIDs) - numberOfUsers
-            while total_users < length:
-                random.shuffle(userIDs)
-                userIDs.pop()
-                total_users += 1
+            indexes = self.random.sample(xrange(len(userIDs)), numberOfUsers)
+        indexes.sort()
+        return [userIDs[index] for index in indexes]
 
-            return userIDs
+    def _activityStrata(self, userIDs):
+        '''
+        Return the indexes of `userIDs` ranked by number of preferences and
+        split in `strata` groups, computed once and again only when the
+        number of users changes or the neighborhood is reloaded.
+        '''
+        if self._strata is None or self._strata[0] != len(userIDs):
+            model = self.model
+            order = sorted(xrange(len(userIDs)),
+                           key=lambda index:
+                                model.UserStats(userIDs[index]).count)
+            size = -(-len(order) // self.strata)
+            self._strata = (len(userIDs),
+                            [order[start:start + size]
+                             for start in xrange(0, len(order), size)])
+        return self._strata[1]
+
+    def _stratifiedSample(self, userIDs, numberOfUsers):
+        '''
+        Sample `numberOfUsers` indexes of `userIDs`, from every activity
+        stratum in proportion to its size.
+        '''
+        strata = self._activityStrata(userIDs)
+        total = len(userIDs)
+        shares = [float(numberOfUsers) * len(stratum) / total
+                  for stratum in strata]
+        counts = [int(share) for share in shares]
+        # Hand the users left by the rounding to the largest remainders.
+        remainders = sorted(xrange(len(strata)),
+                            key=lambda index: counts[index] - shares[index])
+        for index in remainders[:numberOfUsers - sum(counts)]:
+            counts[index] += 1
+
+        indexes = []
+        for stratum, count in zip(strata, counts):
+            indexes.extend(self.random.sample(stratum, count))
+        return indexes
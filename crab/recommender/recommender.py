@@ -55,16 +55,20 @@ class UserRecommender(UserBasedRecommender):
         self.similarity = similarity
         self.capper = capper
 
+    def dependencies(self):
+        return [self.model, self.similarity, self.neighborhood]
+
     def recommend(self, userID, howMany, rescorer=None):
-        nearestN = self.neighborhood.userNeighborhood(userID, rescorer)
+        with self.model.pin():
+            nearestN = self.neighborhood.userNeighborhood(userID, rescorer)
 
-        if not nearestN:
-            return []
+            if not nearestN:
+                return []
 
-        allItemIDs = self.allOtherItems(userID, nearestN)
+            allItemIDs = self.allOtherItems(userID, nearestN)
 
-        rec_items = topItems(userID, allItemIDs, howMany,
-                self.estimatePreference, self.similarity, rescorer)
+            rec_items = topItems(userID, allItemIDs, howMany,
+                    self.estimatePreference, self.similarity, rescorer)
 
         return rec_items
 
@@ -163,15 +167,32 @@ class SlopeOneRecommender(Recommender):
         self.stdDevWeighted = stdDevWeighted
         self.storage = DiffStorage(self.model, self.stdDevWeighted, toPrune)
 
+    def reset(self):
+        '''
+        Rebuild the item-item diffs from the current model, such as after
+        the model was replaced by an evaluator. The new diffs are built
+        aside and swapped in, so estimates in flight finish on the old ones.
+        '''
+        self.storage = DiffStorage(self.model, self.stdDevWeighted,
+                                   self.storage.toPrune)
+
+    reload = reset
+
     def recommend(self, userID, howMany, rescore=None):
-        possibleItemIDs = self.possibleItemIDs(userID)
-        rec_items = topItems(userID, possibleItemIDs, howMany,
-                self.estimatePreference, None, None)
+        # One storage for the whole recommendation, even if reset swaps in
+        # another meanwhile.
+        storage = self.storage
+        with self.model.pin():
+            possibleItemIDs = self.possibleItemIDs(userID, storage)
+            rec_items = topItems(userID, possibleItemIDs, howMany,
+                    self.estimatePreference, None, None, storage=storage)
         return rec_items
 
-    def possibleItemIDs(self, userID):
+    def possibleItemIDs(self, userID, storage=None):
+        if storage is None:
+            storage = self.storage
         preferences = self.model.ItemIDsFromUser(userID)
-        recommendableItems = self.storage.recommendableItems()
+        recommendableItems = storage.recommendableItems()
         return [itemID for itemID in recommendableItems
                 if itemID not in preferences]
 
@@ -187,17 +208,20 @@ class SlopeOneRecommender(Recommender):
             if pref is not None:
                 return pref
 
+        storage = args.get('storage', None)
+        if storage is None:
+            storage = self.storage
         count = 0
         totalPreference = 0.0
         prefs = self.model.PreferencesFromUser(userID)
-        averages = self.storage.diffsAverage(userID, itemID, prefs)
+        averages = storage.diffsAverage(userID, itemID, prefs)
         for i in range(len(prefs)):
             averageDiffValue = averages[i]
             if averageDiffValue is not None:
                 if self.weighted:
-                    weight = self.storage.count(itemID, prefs[i][0])
+                    weight = storage.count(itemID, prefs[i][0])
                     if self.stdDevWeighted:
-                        stdev = self.storage.standardDeviation(
+                        stdev = storage.standardDeviation(
                                 itemID, prefs[i][0])
                         if stdev is not None:
                             weight /= 1.0 + stdev
@@ -249,14 +273,18 @@ class ItemRecommender(ItemBasedRecommender):
         self.similarity = similarity
         self.capper = capper
 
+    def dependencies(self):
+        return [self.model, self.similarity, self.strategy]
+
     def recommend(self, userID, howMany, rescorer=None):
-        if self.numPreferences(userID) == 0:
-            return []
+        with self.model.pin():
+            if self.numPreferences(userID) == 0:
+                return []
 
-        possibleItemIDs = self.allOtherItems(userID)
+            possibleItemIDs = self.allOtherItems(userID)
 
-        rec_items = topItems(userID, possibleItemIDs, howMany,
-                self.estimatePreference, self.similarity, rescorer)
+            rec_items = topItems(userID, possibleItemIDs, howMany,
+                    self.estimatePreference, self.similarity, rescorer)
 
         return rec_items
 
@@ -274,6 +302,8 @@ class ItemRecommender(ItemBasedRecommender):
 
         for toItemID in toItemIDs:
             preference = similarity.getSimilarity(itemID, toItemID)
+            if preference is None:
+                continue
 
             rescoredPref = rescorer.rescore((itemID, toItemID), preference) \
                                 if rescorer else preference
@@ -281,7 +311,7 @@ class ItemRecommender(ItemBasedRecommender):
             sum += rescoredPref
             total += 1
 
-        return sum / total
+        return sum / total if total else None
 
     def numPreferences(self, userID):
         return len(self.model.PreferencesFromUser(userID))
@@ -341,6 +371,8 @@ class ItemRecommender(ItemBasedRecommender):
             return None
 
         simValue = similarity.getSimilarity(itemID, recommendedItemID)
+        if simValue is None:
+            return None
 
         return (1.0 + simValue) * pref
 
@@ -0,0 +1,249 @@
+#-*- coding:utf-8 -*-
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`batch` -- the one-vs-all similarity kernels
+================================================================
+
+    This module computes the similarities of one user (or item) against
+    every user (or item) of a MatrixDataModel at once, from its compressed
+    buffers and with numpy, instead of one pair of vectors at a time.
+
+    The column of every item of the query user lists the other users that
+    share it, so gathering those columns yields, for every other user, the
+    pairs of values the two users have in common. A handful of weighted
+    bincounts over the gathered pairs then give, for every user, the sums
+    each distance needs (size of the overlap, sums, sums of squares, sum of
+    products, ...), the same sums sim_pearson and friends compute from two
+    dicts. Only the preferences of the users sharing an item with the query
+    are read.
+
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from similarity_distance import sim_euclidian, sim_pearson, sim_cosine, \
+        sim_manhattan, sim_tanimoto, sim_jaccard, sim_sorensen, \
+        OVERLAP_DISTANCES
+
+
+def _asArray(buffer):
+    ''' A numpy view of the buffer `buffer` of a model '''
+    if isinstance(buffer, numpy.ndarray):
+        return buffer
+    return numpy.frombuffer(buffer, dtype=buffer.typecode)
+
+
+class _Pairs(object):
+    '''
+    The sums over the values shared by the query row and every other row,
+    arrays aligned with the rows of the model.
+    '''
+
+    def __init__(self, rows, x, y, numRows):
+        ''' `x` and `y` are the shared values of the query and of `rows` '''
+        self.rows = rows
+        self.x = x
+        self.y = y
+        self.numRows = numRows
+        self.count = numpy.bincount(rows, minlength=numRows)
+
+    def sum(self, weights):
+        ''' The sums of `weights` (aligned with the pairs) by row '''
+        return numpy.bincount(self.rows, weights=weights,
+                              minlength=self.numRows)
+
+
+def _euclidian(pairs, query, stats):
+    diff = pairs.x - pairs.y
+    distances = numpy.sqrt(pairs.sum(diff * diff))
+    return numpy.where(pairs.count > 0, 1.0 / (1.0 + distances), 0.0)
+
+
+def _pearson(pairs, query, stats):
+    n = numpy.maximum(pairs.count, 1)
+    sum1 = pairs.sum(pairs.x)
+    sum2 = pairs.sum(pairs.y)
+    sum1Sq = pairs.sum(pairs.x * pairs.x)
+    sum2Sq = pairs.sum(pairs.y * pairs.y)
+    pSum = pairs.sum(pairs.x * pairs.y)
+
+    num = pSum - sum1 * sum2 / n
+    # The variances are sums of squares minus nearly the same number: when
+    # sim_pearson would find them to be exactly 0.0, the summation order may
+    # leave a rounding residue here instead, so treat those as 0.0 as well.
+    var1 = sum1Sq - sum1 * sum1 / n
+    var2 = sum2Sq - sum2 * sum2 / n
+    var1[var1 <= 1e-12 * sum1Sq] = 0.0
+    var2[var2 <= 1e-12 * sum2Sq] = 0.0
+    den = numpy.sqrt(var1 * var2)
+
+    sims = numpy.zeros(pairs.numRows)
+    valid = (pairs.count > 0) & (den > 0.0)
+    sims[valid] = num[valid] / den[valid]
+    return sims
+
+
+def _manhattan(pairs, query, stats):
+    distances = pairs.sum(numpy.abs(pairs.x - pairs.y))
+    return numpy.where(pairs.count > 0,
+                       1.0 - distances / numpy.maximum(pairs.count, 1), 0.0)
+
+
+def _cosine(pairs, query, stats):
+    # Like sim_cosine on dicts: the dot product over the shared values and
+    # the norms of the whole vectors.
+    norms = stats[4]
+    den = norms[query] * norms
+
+    sims = numpy.zeros(pairs.numRows)
+    valid = den > 0.0
+    sims[valid] = pairs.sum(pairs.x * pairs.y)[valid] / den[valid]
+    return sims
+
+
+def _shared(nP1, nP2, nP1P2):
+    # sim_tanimoto and sim_jaccard: the rows sharing nothing are 0.0.
+    sims = numpy.zeros(len(nP2))
+    valid = nP1P2 > 0
+    sims[valid] = nP1P2[valid] / (nP1 + nP2[valid] - nP1P2[valid])
+    return sims
+
+
+def _sorensen(nP1, nP2, nP1P2):
+    sims = numpy.zeros(len(nP2))
+    valid = nP1P2 > 0
+    sims[valid] = 2.0 * nP1P2[valid] / (nP1 + nP2[valid])
+    return sims
+
+
+# The overlap distances with a vectorized version; the others of
+# OVERLAP_DISTANCES are called once per row sharing something with the query.
+BATCH_OVERLAPS = {
+    sim_tanimoto: _shared,
+    sim_jaccard: _shared,
+    sim_sorensen: _sorensen}
+
+# The distances with a batched kernel, besides those of OVERLAP_DISTANCES.
+BATCH_DISTANCES = {
+    sim_euclidian: _euclidian,
+    sim_pearson: _pearson,
+    sim_manhattan: _manhattan,
+    sim_cosine: _cosine}
+
+
+def supportsBatch(model, distance):
+    '''
+    Return True when the similarities measured by `distance` on `model` can
+    be batched: numpy is available, the model keeps compressed buffers
+    (MatrixDataModel and its subclasses) and the distance has a kernel.
+    '''
+    return numpy is not None and hasattr(model, 'userPtr') and \
+            (distance in BATCH_DISTANCES or distance in OVERLAP_DISTANCES)
+
+
+def _values(model, buffer, positions):
+    ''' The preference values at `positions` of `buffer` as floats '''
+    if buffer is None:
+        return numpy.ones(len(positions))
+    values = _asArray(buffer)[positions]
+    if model.quantizer is not None:
+        values = model.quantizer.decode(values)
+    return numpy.asarray(values, dtype=numpy.float64)
+
+
+def _similarities(model, distance, index, rowPtr, rowIndexes, rowValues,
+                  colPtr, colIndexes, colValues, numRows, numCols, stats):
+    '''
+    The similarities of the row `index` against every row of the matrix
+    given compressed by row (`rowPtr`, `rowIndexes`, `rowValues`) and by
+    column (`colPtr`, `colIndexes`, `colValues`).
+    '''
+    rowPtr = _asArray(rowPtr)
+    colPtr = _asArray(colPtr)
+    start, end = int(rowPtr[index]), int(rowPtr[index + 1])
+    columns = _asArray(rowIndexes)[start:end]
+
+    # The positions of the gathered columns, one run per column of the
+    # query row, and the query value repeated along each run.
+    starts = colPtr[columns]
+    lengths = colPtr[columns + 1] - starts
+    total = int(lengths.sum())
+    offsets = numpy.cumsum(lengths) - lengths
+    positions = numpy.repeat(starts - offsets, lengths) + \
+            numpy.arange(total, dtype=numpy.int64)
+    rows = _asArray(colIndexes)[positions]
+
+    overlap = OVERLAP_DISTANCES.get(distance, None)
+    if overlap is not None:
+        counts = numpy.bincount(rows, minlength=numRows)
+        rowCounts = stats[0]
+        nP1 = end - start
+        if distance in BATCH_OVERLAPS:
+            return BATCH_OVERLAPS[distance](float(nP1),
+                    numpy.asarray(rowCounts, dtype=numpy.float64),
+                    counts.astype(numpy.float64))
+
+        sims = numpy.zeros(numRows)
+        for row in numpy.flatnonzero(counts).tolist():
+            sims[row] = overlap(nP1, int(rowCounts[row]), int(counts[row]),
+                                numCols)
+        return sims
+
+    queryValues = numpy.repeat(
+            _values(model, rowValues, numpy.arange(start, end)), lengths)
+    pairs = _Pairs(rows, queryValues, _values(model, colValues, positions),
+                   numRows)
+    return BATCH_DISTANCES[distance](pairs, index, stats)
+
+
+def userSimilarities(model, distance, userID):
+    '''
+    Return the similarities of the user `userID` to every user of `model`,
+    as a numpy array aligned with UserIDs, or None when they cannot be
+    batched (see supportsBatch).
+    '''
+    if not supportsBatch(model, distance):
+        return None
+    index = model.userIndex.get(userID, None)
+    if index is None:
+        raise ValueError('User not found.')
+    return _similarities(model, distance, index,
+            model.userPtr, model.userItems, model.userValues,
+            model.itemPtr, model.itemUsers, model.itemValues,
+            model.NumUsers(), model.NumItems(), model.UserStatsArrays())
+
+
+def itemSimilarities(model, distance, itemID):
+    '''
+    Return the similarities of the item `itemID` to every item of `model`,
+    as a numpy array aligned with ItemIDs, or None when they cannot be
+    batched (see supportsBatch).
+    '''
+    if not supportsBatch(model, distance):
+        return None
+    index = model.itemIndex.get(itemID, None)
+    if index is None:
+        raise ValueError('Item not found.')
+    return _similarities(model, distance, index,
+            model.itemPtr, model.itemUsers, model.itemValues,
+            model.userPtr, model.userItems, model.userValues,
+            model.NumItems(), model.NumUsers(), model.ItemStatsArrays())
@@ -0,0 +1,195 @@
+#-*- coding:utf-8 -*-
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`cooccurrence` -- the co-occurrence similarity engine
+================================================================
+
+    This module computes the similarities of one user (or item) against
+    every user (or item) of any data model by walking the inverted index of
+    the model: the users with a preference for each item of the query user,
+    given by PreferencesForItem. Only the users sharing at least one item
+    with the query are met, and for each of them the walk accumulates, in a
+    single pass, the sufficient statistics of the pair: the size of the
+    overlap, the sums and sums of squares of both sides, the sum of the
+    products and the sums of the squared and absolute differences.
+
+    The distances of FINALIZERS are then computed from those statistics and
+    the PreferenceStats of both sides; the users sharing nothing get 0.0,
+    as sim_pearson and the others return for them. Comparing one user with
+    all costs the sum of the popularities of its items instead of one
+    distance per user of the model.
+
+"""
+
+from math import sqrt
+
+from similarity_distance import sim_euclidian, sim_pearson, sim_cosine, \
+        sim_manhattan, OVERLAP_DISTANCES
+
+# The positions of the statistics in the list kept for every pair.
+COUNT, SUM1, SUM2, SUM1SQ, SUM2SQ, PRODUCTS, SQUARED_DIFFS, ABS_DIFFS = \
+        range(8)
+
+
+def _cooccurrences(prefs, otherPrefs):
+    '''
+    Return the statistics of the pairs of the query, whose preferences are
+    `prefs`, with every ID it co-occurs with, found by `otherPrefs`.
+    '''
+    pairs = {}
+    for ID, x in prefs:
+        for otherID, y in otherPrefs(ID):
+            diff = x - y
+            stats = pairs.get(otherID, None)
+            if stats is None:
+                pairs[otherID] = [1, x, y, x * x, y * y, x * y,
+                                  diff * diff, abs(diff)]
+            else:
+                stats[COUNT] += 1
+                stats[SUM1] += x
+                stats[SUM2] += y
+                stats[SUM1SQ] += x * x
+                stats[SUM2SQ] += y * y
+                stats[PRODUCTS] += x * y
+                stats[SQUARED_DIFFS] += diff * diff
+                stats[ABS_DIFFS] += abs(diff)
+    return pairs
+
+
+def userCooccurrences(model, userID):
+    '''
+    Return a dict mapping every user sharing an item with the user `userID`
+    (the user included) to the statistics of the pair, a list indexed by
+    COUNT, SUM1 (the values of `userID`), SUM2, SUM1SQ, SUM2SQ, PRODUCTS,
+    SQUARED_DIFFS and ABS_DIFFS.
+    '''
+    return _cooccurrences(model.PreferencesFromUser(userID),
+                          model.PreferencesForItem)
+
+
+def itemCooccurrences(model, itemID):
+    '''
+    Return a dict mapping every item sharing a user with the item `itemID`
+    to the statistics of the pair (see userCooccurrences).
+    '''
+    return _cooccurrences(model.PreferencesForItem(itemID),
+                          model.PreferencesFromUser)
+
+
+def _pearson(stats, query, other, n):
+    count = stats[COUNT]
+    num = stats[PRODUCTS] - (stats[SUM1] * stats[SUM2] / float(count))
+    # Rounding may leave a variance slightly below 0.0.
+    den = sqrt(max(0.0, (stats[SUM1SQ] - pow(stats[SUM1], 2.0) / count) *
+                        (stats[SUM2SQ] - pow(stats[SUM2], 2.0) / count)))
+    if den == 0.0:
+        return 0.0
+    return num / den
+
+
+def _euclidian(stats, query, other, n):
+    return 1 / (1 + sqrt(stats[SQUARED_DIFFS]))
+
+
+def _manhattan(stats, query, other, n):
+    return 1 - (float(stats[ABS_DIFFS]) / stats[COUNT])
+
+
+def _cosine(stats, query, other, n):
+    # The norms are those of the whole vectors, as in sim_cosine.
+    den = query.norm() * other.norm()
+    if den == 0.0:
+        return 0.0
+    return stats[PRODUCTS] / den
+
+
+def _overlap(overlap):
+    def finalize(stats, query, other, n):
+        return overlap(query.count, other.count, stats[COUNT], n)
+    return finalize
+
+
+# The distances computed from the statistics of a pair, called as
+# finalize(stats, queryStats, otherStats, n) for the pairs sharing something
+# with the query; `n` is the number of items (or users, comparing items).
+FINALIZERS = {
+    sim_pearson: _pearson,
+    sim_euclidian: _euclidian,
+    sim_manhattan: _manhattan,
+    sim_cosine: _cosine}
+FINALIZERS.update((distance, _overlap(overlap))
+                  for distance, overlap in OVERLAP_DISTANCES.iteritems())
+
+# The distances whose finalizers read the PreferenceStats of both sides;
+# the others get None for them, and no stats are fetched.
+STATS_DISTANCES = set([sim_cosine]) | set(OVERLAP_DISTANCES)
+
+
+def supportsCooccurrence(distance):
+    ''' Return True when `distance` can be computed from co-occurrences '''
+    return distance in FINALIZERS
+
+
+def _similarities(IDs, pairs, finalize, stats, queryID, n):
+    # `stats` is None when the finalizer does not read the PreferenceStats.
+    query = other = None
+    if stats is not None:
+        query = stats(queryID)
+    sims = []
+    for ID in IDs:
+        pair = pairs.get(ID, None)
+        if pair is None:
+            sims.append((ID, 0.0))
+        else:
+            if stats is not None:
+                other = stats(ID)
+            sims.append((ID, finalize(pair, query, other, n)))
+    return sims
+
+
+def userCooccurrenceSimilarities(model, distance, userID):
+    '''
+    Return the list of (userID, similarity) of the user `userID` with every
+    user of `model`, in the order of UserIDs, or None when `distance` is
+    not supported.
+    '''
+    finalize = FINALIZERS.get(distance, None)
+    if finalize is None:
+        return None
+    stats = None
+    if distance in STATS_DISTANCES:
+        stats = model.UserStats
+    return _similarities(model.UserIDs(), userCooccurrences(model, userID),
+                         finalize, stats, userID, model.NumItems())
+
+
+def itemCooccurrenceSimilarities(model, distance, itemID):
+    '''
+    Return the list of (itemID, similarity) of the item `itemID` with every
+    item of `model`, in the order of ItemIDs, or None when `distance` is
+    not supported.
+    '''
+    finalize = FINALIZERS.get(distance, None)
+    if finalize is None:
+        return None
+    stats = None
+    if distance in STATS_DISTANCES:
+        stats = model.ItemStats
+    return _similarities(model.ItemIDs(), itemCooccurrences(model, itemID),
+                         finalize, stats, itemID, model.NumUsers())
@@ -0,0 +1,477 @@
+#-*- coding:utf-8 -*-
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`lsh` -- the locality sensitive hashing indexes
+================================================================
+
+    This module contains indexes that find the candidate neighbors of a user
+    (or item) without comparing it with every other one. Every user gets a
+    signature of `bands` * `rows` hashes, such that two users are more
+    likely to agree on a hash the more similar they are. The signature is
+    cut in `bands` bands of `rows` hashes, and every band is bucketed in its
+    own hash table: the candidates of a user are the users sharing a bucket
+    with it in at least one band.
+
+    Two users of similarity s share a band with probability s ** rows, so
+    they are candidates with probability 1 - (1 - s ** rows) ** bands, an S
+    shaped curve rising around (1 / bands) ** (1 / rows): more rows make the
+    index more selective (faster, fewer candidates), more bands bring back
+    the recall. recallReport measures it against the exact neighbors; run
+    this module (PYTHONPATH=. python similarities/lsh.py) to print it for a
+    few settings on random data.
+
+    MinHashIndex hashes the sets of items (Jaccard similarity), SimHashIndex
+    the preference values (cosine similarity, or Pearson once centered).
+    Either serves as the `index` of NearestNUserNeighborhood or of
+    IndexedItemsStrategy, which rescore its candidates exactly.
+
+"""
+
+import random
+import zlib
+from collections import defaultdict
+from itertools import combinations
+from math import acos, cos, pi
+
+import numpy
+
+from interfaces import Refreshable
+
+# The Mersenne prime 2 ** 31 - 1, modulus of the MinHash functions.
+PRIME = (1 << 31) - 1
+
+# Number of IDs whose signatures are computed together by build.
+BUILD_CHUNK = 1024
+
+
+def _hashFunctions(generator, size):
+    ''' The factors and offsets of `size` hash functions (a * x + b) % PRIME '''
+    return (numpy.array([generator.randint(1, PRIME - 1)
+                         for index in xrange(size)], dtype=numpy.int64),
+            numpy.array([generator.randint(0, PRIME - 1)
+                         for index in xrange(size)], dtype=numpy.int64))
+
+
+def _hashID(ID):
+    '''
+    The hash of `ID` below PRIME, taken from the crc32 of its repr so that
+    it does not change across processes (hash() does, with -R or
+    PYTHONHASHSEED, and so would the signatures).
+    '''
+    return (zlib.crc32(repr(ID)) & 0xffffffff) % PRIME
+
+
+def _flatten(vectors):
+    '''
+    Return the element hashes and values of all the `vectors`, one after
+    the other, with the count of each vector and the start of the non-empty
+    ones, as expected by the numpy reduceat functions.
+    '''
+    counts = numpy.array([len(vector) for vector in vectors],
+                         dtype=numpy.int64)
+    elements = numpy.array([_hashID(ID) for vector in vectors
+                            for ID, value in vector], dtype=numpy.int64)
+    values = numpy.array([value for vector in vectors
+                          for ID, value in vector], dtype=numpy.float64)
+    nonEmpty = numpy.flatnonzero(counts)
+    starts = (numpy.cumsum(counts) - counts)[nonEmpty]
+    return elements, values, counts, nonEmpty, starts
+
+
+class LSHIndex(Refreshable):
+    '''
+    Base class of the banded LSH indexes over the users of `model` (or its
+    items, with byUser=False). Subclasses compute the signatures.
+
+    The index is built on creation and rebuilt by reload (or refresh), then
+    swapped in with a single assignment.
+    '''
+
+    def __init__(self, model, bands=20, rows=5, byUser=True, seed=None):
+        '''
+        LSHIndex Constructor
+
+        `bands` the number of bands (and hash tables).
+
+        `rows` the number of hashes of each band.
+
+        `byUser` index the users (True) or the items (False).
+
+        `seed` the seed of the random hash functions.
+        '''
+        self.model = model
+        self.bands = bands
+        self.rows = rows
+        self.byUser = byUser
+        self.seed = seed
+        self._state = None
+        self.build()
+
+    def dependencies(self):
+        return [self.model]
+
+    def reload(self):
+        self.build()
+
+    def IDs(self):
+        ''' The IDs indexed, users or items '''
+        return self.model.UserIDs() if self.byUser else self.model.ItemIDs()
+
+    def vector(self, ID):
+        ''' The preferences (otherID, value) of the user or item `ID` '''
+        if self.byUser:
+            return self.model.PreferencesFromUser(ID)
+        return self.model.PreferencesForItem(ID)
+
+    def signature(self, vector):
+        '''
+        Return the signature of `vector` (a list of (ID, value)), a numpy
+        array of bands * rows hashes, or None for an empty vector.
+        '''
+        raise NotImplementedError("cannot instantiate Abstract Base Class")
+
+    def signatures(self, vectors):
+        '''
+        Return the signatures of the list `vectors`; subclasses may compute
+        them together.
+        '''
+        return [self.signature(vector) for vector in vectors]
+
+    def build(self):
+        ''' Compute the signatures of every ID and bucket their bands '''
+        IDs = list(self.IDs())
+        signatures = {}
+        tables = [defaultdict(list) for band in xrange(self.bands)]
+        for start in xrange(0, len(IDs), BUILD_CHUNK):
+            chunk = IDs[start:start + BUILD_CHUNK]
+            for ID, signature in zip(chunk, self.signatures(
+                    [self.vector(ID) for ID in chunk])):
+                if signature is None:
+                    continue
+                signatures[ID] = signature
+                for band, key in enumerate(self._bandKeys(signature)):
+                    tables[band][key].append(ID)
+
+        positions = dict((ID, position) for position, ID in enumerate(IDs))
+        self._state = (positions, signatures,
+                       [dict(table) for table in tables])
+
+    def _bandKeys(self, signature):
+        rows = self.rows
+        return [signature[band * rows:(band + 1) * rows].tobytes()
+                for band in xrange(self.bands)]
+
+    def _probeKeys(self, signature):
+        '''
+        Return, for every band, the keys of the buckets candidates() looks
+        up; just the bucket of the signature here.
+        '''
+        return [[key] for key in self._bandKeys(signature)]
+
+    def _signatureOf(self, ID, signatures):
+        signature = signatures.get(ID, None)
+        if signature is None:
+            # Not indexed (yet): a session user, or one without preferences.
+            try:
+                signature = self.signature(self.vector(ID))
+            except ValueError:
+                return None
+        return signature
+
+    def candidates(self, ID):
+        '''
+        Return the IDs sharing a bucket with `ID` in at least one band, `ID`
+        excluded, in the order of the model. IDs not indexed are hashed on
+        the fly, so a user added after the index was built finds its
+        candidates among the indexed ones.
+        '''
+        positions, signatures, tables = self._state
+        signature = self._signatureOf(ID, signatures)
+        if signature is None:
+            return []
+
+        found = set()
+        for table, keys in zip(tables, self._probeKeys(signature)):
+            for key in keys:
+                found.update(table.get(key, ()))
+        found.discard(ID)
+        return sorted(found, key=positions.get)
+
+    def estimateSimilarity(self, ID1, ID2):
+        '''
+        Return the fraction of hashes the signatures of `ID1` and `ID2`
+        agree on, an estimate of their similarity, or None if either has no
+        signature.
+        '''
+        positions, signatures, tables = self._state
+        signature1 = self._signatureOf(ID1, signatures)
+        signature2 = self._signatureOf(ID2, signatures)
+        if signature1 is None or signature2 is None:
+            return None
+        return float((signature1 == signature2).mean())
+
+    def probability(self, similarity):
+        '''
+        Return the probability that two IDs of the given similarity are
+        candidates of each other.
+        '''
+        return 1.0 - (1.0 - similarity ** self.rows) ** self.bands
+
+    def threshold(self):
+        ''' The similarity around which the probability rises steeply '''
+        return (1.0 / self.bands) ** (1.0 / self.rows)
+
+
+class MinHashIndex(LSHIndex):
+    '''
+    An LSH index for the Jaccard (or Tanimoto) similarity of the sets of
+    items of the users, the measure of sim_jaccard and sim_tanimoto on
+    binary data; preference values are ignored.
+
+    Every hash of the signature is the minimum of a random hash function
+    ``(a * x + b) mod PRIME`` over the items of the user, and two users
+    agree on it with probability equal to their Jaccard similarity.
+    '''
+
+    def __init__(self, model, bands=20, rows=5, byUser=True, seed=None):
+        self._a, self._b = _hashFunctions(random.Random(seed), bands * rows)
+        LSHIndex.__init__(self, model, bands, rows, byUser, seed)
+
+    def signature(self, vector):
+        return self.signatures([vector])[0]
+
+    def signatures(self, vectors):
+        elements, values, counts, nonEmpty, starts = _flatten(vectors)
+        signatures = [None] * len(vectors)
+        if not len(elements):
+            return signatures
+
+        # The minimum of every hash function over the elements of each
+        # non-empty vector, for all the vectors at once. Both factors are
+        # below 2 ** 31, so the products fit in 63 bits.
+        mins = numpy.empty((len(self._a), len(nonEmpty)), dtype=numpy.int64)
+        for function in xrange(len(self._a)):
+            hashes = (self._a[function] * elements + self._b[function]) % PRIME
+            mins[function] = numpy.minimum.reduceat(hashes, starts)
+
+        for column, index in enumerate(nonEmpty.tolist()):
+            signatures[index] = mins[:, column].copy()
+        return signatures
+
+
+class SimHashIndex(LSHIndex):
+    '''
+    An LSH index for the cosine similarity of the preference vectors of the
+    users, as sim_cosine measures it, or with `centered` for the cosine of
+    the vectors minus the mean of each user, which approximates
+    sim_pearson.
+
+    Every bit of the signature is the side of a random hyperplane the
+    vector falls on (signed random projection): two vectors at an angle
+    theta agree on it with probability 1 - theta / pi. The normal of the
+    hyperplanes is drawn from a gaussian per item, derived from two hashes
+    of the item, so it needs no matrix over the items and covers the items
+    added later.
+
+    With `probes` above 0, candidates() also looks up, in every band, the
+    buckets of the signatures up to `probes` bits away (multi-probe LSH),
+    so fewer bands reach the same recall.
+    '''
+
+    def __init__(self, model, bands=16, rows=8, byUser=True, seed=None,
+            centered=False, probes=0):
+        '''
+        SimHashIndex Constructor
+
+        `centered` project the preferences minus the mean of the user (or
+        item) instead of the raw preferences.
+
+        `probes` the number of bits the buckets probed in every band may
+        differ from the bucket of the signature.
+        '''
+        generator = random.Random(seed)
+        self._a1, self._b1 = _hashFunctions(generator, bands * rows)
+        self._a2, self._b2 = _hashFunctions(generator, bands * rows)
+        self.centered = centered
+        self.probes = probes
+        LSHIndex.__init__(self, model, bands, rows, byUser, seed)
+
+    def signature(self, vector):
+        return self.signatures([vector])[0]
+
+    def signatures(self, vectors):
+        elements, values, counts, nonEmpty, starts = _flatten(vectors)
+        signatures = [None] * len(vectors)
+        if not len(elements):
+            return signatures
+
+        if self.centered:
+            means = numpy.add.reduceat(values, starts) / counts[nonEmpty]
+            values = values - numpy.repeat(means, counts[nonEmpty])
+        # A vector of zeros (all the preferences equal, once centered) is
+        # on no side of any hyperplane.
+        valid = numpy.add.reduceat(values * values, starts) > 1e-12
+
+        bits = numpy.empty((len(self._a1), len(nonEmpty)), dtype=numpy.uint8)
+        for function in xrange(len(self._a1)):
+            # Box-Muller: two uniform hashes of every item give the
+            # gaussian component of the normal of the hyperplane.
+            uniform1 = ((self._a1[function] * elements + self._b1[function])
+                        % PRIME + 1.0) / PRIME
+            uniform2 = ((self._a2[function] * elements + self._b2[function])
+                        % PRIME) / float(PRIME)
+            normal = numpy.sqrt(-2.0 * numpy.log(uniform1)) * \
+                    numpy.cos(2.0 * pi * uniform2)
+            bits[function] = numpy.add.reduceat(values * normal, starts) > 0
+
+        for column, index in enumerate(nonEmpty.tolist()):
+            if valid[column]:
+                signatures[index] = bits[:, column].copy()
+        return signatures
+
+    def _probeKeys(self, signature):
+        if not self.probes:
+            return LSHIndex._probeKeys(self, signature)
+
+        rows = self.rows
+        keys = []
+        for band in xrange(self.bands):
+            bandBits = signature[band * rows:(band + 1) * rows]
+            bandKeys = [bandBits.tobytes()]
+            for distance in xrange(1, min(self.probes, rows) + 1):
+                for flipped in combinations(xrange(rows), distance):
+                    probe = bandBits.copy()
+                    probe[list(flipped)] ^= 1
+                    bandKeys.append(probe.tobytes())
+            keys.append(bandKeys)
+        return keys
+
+    def estimateSimilarity(self, ID1, ID2):
+        '''
+        Return the cosine of the angle estimated from the fraction of bits
+        the signatures of `ID1` and `ID2` agree on, or None if either has no
+        signature.
+        '''
+        agreement = LSHIndex.estimateSimilarity(self, ID1, ID2)
+        if agreement is None:
+            return None
+        return cos(pi * (1.0 - agreement))
+
+    def probability(self, similarity):
+        # The probability a bit agrees, then that a band is probed.
+        bit = 1.0 - acos(max(-1.0, min(1.0, similarity))) / pi
+        band = sum([_binomial(self.rows, distance) *
+                    bit ** (self.rows - distance) * (1.0 - bit) ** distance
+                    for distance in xrange(min(self.probes, self.rows) + 1)])
+        return 1.0 - (1.0 - band) ** self.bands
+
+    def threshold(self):
+        # The cosine whose bit agreement is the threshold of the bands,
+        # probes left aside.
+        return cos(pi * (1.0 - LSHIndex.threshold(self)))
+
+
+def _binomial(n, k):
+    result = 1
+    for index in xrange(k):
+        result = result * (n - index) // (index + 1)
+    return result
+
+
+def recallReport(index, similarity, IDs=None, numNeighbors=10):
+    '''
+    Compare the candidates of `index` with the exact neighbors given by
+    `similarity` (a UserSimilarity or ItemSimilarity over the same model,
+    usually with the distance the index approximates).
+
+    For every ID of `IDs` (all the indexed IDs by default), the exact
+    neighbors are its `numNeighbors` most similar IDs of positive
+    similarity. Return a dict with the mean 'recall' (the fraction of exact
+    neighbors found among the candidates) and the mean 'candidates' ratio
+    (the fraction of all the IDs returned as candidates, the work left to
+    the exact similarity).
+    '''
+    if IDs is None:
+        IDs = index.IDs()
+    total = len(index.IDs())
+
+    recalls = []
+    ratios = []
+    for ID in IDs:
+        exact = sorted([(other, sim)
+                        for other, sim in similarity.getSimilarities(ID)
+                        if other != ID and sim > 0.0],
+                       key=lambda item: -item[1])[:numNeighbors]
+        exact = [other for other, sim in exact]
+        candidates = set(index.candidates(ID))
+        if exact:
+            recalls.append(float(len([other for other in exact
+                                      if other in candidates])) / len(exact))
+        ratios.append(float(len(candidates)) / max(total - 1, 1))
+
+    return {'recall': sum(recalls) / len(recalls) if recalls else 1.0,
+            'candidates': sum(ratios) / len(ratios) if ratios else 0.0}
+
+
+if __name__ == '__main__':
+    import time
+    from models.booleanmodel import BooleanDataModel
+    from models.matrixmodel import MatrixDataModel
+    from similarities.similarity import UserSimilarity
+    from similarities.similarity_distance import sim_jaccard, sim_cosine
+
+    def report(index, exact, sample, label):
+        start = time.time()
+        index.refresh()
+        elapsed = time.time() - start
+        result = recallReport(index, exact, sample)
+        print '%-22s %9.3f %7.3f %11.3f %9.2f' % (label, index.threshold(),
+                result['recall'], result['candidates'], elapsed)
+
+    # Users drawn from a few taste clusters, so neighbors exist. The users
+    # of a cluster share its items and, roughly, their ratings.
+    generator = random.Random(0)
+    clusters = [dict((item, generator.choice([1.0, 2.0, 3.0, 4.0, 5.0]))
+                     for item in generator.sample(xrange(2000), 40))
+                for cluster in xrange(50)]
+    data = {}
+    for user in xrange(2000):
+        cluster = clusters[user % len(clusters)]
+        prefs = dict((item, min(5.0, max(1.0, cluster[item] +
+                                         generator.choice([-1.0, 0.0, 1.0]))))
+                     for item in generator.sample(cluster, 30))
+        for item in generator.sample(xrange(2000), 5):
+            prefs.setdefault(item, generator.choice([1.0, 3.0, 5.0]))
+        data[user] = prefs
+    sample = generator.sample(sorted(data), 200)
+
+    print '%-22s threshold  recall  candidates  build(s)' % 'index'
+    model = BooleanDataModel(data)
+    exact = UserSimilarity(model, sim_jaccard)
+    for bands, rows in ((10, 2), (20, 3), (10, 5), (20, 5), (20, 8)):
+        report(MinHashIndex(model, bands, rows, seed=1), exact, sample,
+               'MinHash %dx%d' % (bands, rows))
+
+    model = MatrixDataModel(data)
+    exact = UserSimilarity(model, sim_cosine)
+    for bands, rows, probes in ((8, 8, 0), (16, 8, 0), (8, 8, 1),
+                                (16, 12, 0), (16, 12, 1)):
+        report(SimHashIndex(model, bands, rows, seed=1, probes=probes),
+               exact, sample, 'SimHash %dx%d probes=%d' % (bands, rows,
+                                                           probes))
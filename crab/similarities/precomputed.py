@@ -0,0 +1,220 @@
+#-*- coding:utf-8 -*-
+
+#========================================================================
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#========================================================================
+"""
+:mod:`precomputed` -- the precomputed item similarities
+================================================================
+
+    This module contains an ItemSimilarity whose similarities are computed
+    once for every pair of items, pruned to the nearest neighbors of every
+    item and then only looked up, optionally saved to and loaded from a
+    snapshot file.
+
+"""
+
+import numpy
+
+from similarity import ItemSimilarity
+from models.snapshot import writeArrays, readArrays
+
+
+class PrecomputedItemSimilarity(ItemSimilarity):
+    '''
+    An ItemSimilarity that computes the similarities of all the pairs of
+    items of `model` once, with any of the distances of ItemSimilarity, and
+    keeps for every item only its `numNeighbors` most similar items whose
+    similarity is at least `threshold`.
+
+    The neighbors are stored compressed by item, like the buffers of a
+    MatrixDataModel: the neighbors of the item with index ``i`` are the
+    item indexes ``neighbors[ptr[i]:ptr[i + 1]]`` (sorted) and their
+    similarities ``values[ptr[i]:ptr[i + 1]]``, stored as float32.
+    getSimilarity is then a binary search in two short rows, and returns
+    None for the pairs that were pruned, which ItemRecommender skips.
+
+    The table is rebuilt by reload (or refresh), and can be saved to a
+    snapshot file and loaded back without the model or the distance. It is
+    kept as a single tuple (itemIDs, itemIndex, ptr, neighbors, values),
+    swapped in with one assignment, so a lookup during a reload reads
+    either the old table or the new one.
+    '''
+
+    def __init__(self, model, distance, numNeighbors=None, threshold=None,
+            numBest=None):
+        '''
+        PrecomputedItemSimilarity Constructor
+
+        `numNeighbors` the number of neighbors kept for every item, all of
+        them if None.
+
+        `threshold` the minimal similarity of a neighbor, None to keep
+        every similarity that is a number.
+        '''
+        ItemSimilarity.__init__(self, model, distance, numBest)
+        self.numNeighbors = numNeighbors
+        self.threshold = threshold
+        self._state = ([], {}, numpy.zeros(1, dtype=numpy.int64),
+                       numpy.zeros(0, dtype=numpy.int32),
+                       numpy.zeros(0, dtype=numpy.float32))
+        if model is not None:
+            self.build()
+
+    def build(self):
+        ''' Compute the similarities of every item and keep its neighbors '''
+        # A plain ItemSimilarity, batched on matrix models, does the work.
+        # Its iterSimilarities computes each pair of a pairwise distance
+        # once, for both items; one more neighbor is asked for the item
+        # itself.
+        source = ItemSimilarity(self.model, self.distance)
+        itemIDs = list(self.model.ItemIDs())
+        itemIndex = dict((itemID, index)
+                         for index, itemID in enumerate(itemIDs))
+        if self.numNeighbors is None:
+            numBest = len(itemIDs)
+        else:
+            numBest = self.numNeighbors + 1
+
+        counts = []
+        neighbors = []
+        values = []
+        for itemID, row in source.iterSimilarities(numBest=numBest):
+            columns = numpy.array([itemIndex[other] for other, sim in row],
+                                  dtype=numpy.int64)
+            sims = numpy.array([numpy.nan if sim is None else sim
+                                for other, sim in row], dtype=numpy.float64)
+            valid = ~numpy.isnan(sims)
+            valid &= columns != itemIndex[itemID]
+            if self.threshold is not None:
+                valid[valid] = sims[valid] >= self.threshold
+            kept = numpy.flatnonzero(valid)
+            if self.numNeighbors is not None and \
+                    len(kept) > self.numNeighbors:
+                order = numpy.argsort(-sims[kept], kind='mergesort')
+                kept = kept[order[:self.numNeighbors]]
+            kept = kept[numpy.argsort(columns[kept], kind='mergesort')]
+            counts.append(len(kept))
+            neighbors.append(columns[kept])
+            values.append(sims[kept])
+
+        self._assign(itemIDs, counts, neighbors, values)
+
+    def _assign(self, itemIDs, counts, neighbors, values):
+        ''' Install the neighbors of every item, given row by row '''
+        ptr = numpy.zeros(len(itemIDs) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=ptr[1:])
+        self._install(itemIDs, ptr,
+                      numpy.concatenate(
+                          [numpy.zeros(0)] + neighbors).astype(numpy.int32),
+                      numpy.concatenate(
+                          [numpy.zeros(0)] + values).astype(numpy.float32))
+
+    def _install(self, itemIDs, ptr, neighbors, values):
+        ''' Swap in the table of the neighbors of `itemIDs` '''
+        itemIndex = dict((itemID, index)
+                         for index, itemID in enumerate(itemIDs))
+        self._state = (itemIDs, itemIndex, ptr, neighbors, values)
+
+    @property
+    def itemIDs(self):
+        return self._state[0]
+
+    def dependencies(self):
+        return [self.model] if self.model is not None else []
+
+    def reload(self):
+        # Loaded similarities without their model are kept as they are.
+        if self.model is not None and self.distance is not None:
+            self.build()
+
+    def _find(self, state, row, column):
+        ''' The position of `column` among the neighbors of `row`, or None '''
+        itemIDs, itemIndex, ptr, neighbors, values = state
+        start, end = int(ptr[row]), int(ptr[row + 1])
+        position = start + int(numpy.searchsorted(neighbors[start:end],
+                                                  column))
+        if position < end and neighbors[position] == column:
+            return position
+        return None
+
+    def _index(self, state, itemID):
+        index = state[1].get(itemID, None)
+        if index is None:
+            raise ValueError('Item not found.')
+        return index
+
+    def getSimilarity(self, vec1, vec2):
+        '''
+        Return the similarity of the items `vec1` and `vec2`, or None when
+        neither is a kept neighbor of the other.
+        '''
+        state = self._state
+        index1 = self._index(state, vec1)
+        index2 = self._index(state, vec2)
+        position = self._find(state, index1, index2)
+        if position is None:
+            position = self._find(state, index2, index1)
+            if position is None:
+                return None
+        return float(state[4][position])
+
+    def _neighbors(self, state, index):
+        itemIDs, itemIndex, ptr, neighbors, values = state
+        start, end = int(ptr[index]), int(ptr[index + 1])
+        return zip([itemIDs[neighbor]
+                    for neighbor in neighbors[start:end].tolist()],
+                   values[start:end].tolist())
+
+    def getSimilarities(self, vec):
+        ''' Return the kept neighbors of the item `vec` and similarities '''
+        state = self._state
+        return self._neighbors(state, self._index(state, vec))
+
+    def iterSimilarities(self, blockSize=None, numBest=None):
+        ''' Yield every item with its kept neighbors, as self[itemID] '''
+        state = self._state
+        for index, itemID in enumerate(state[0]):
+            sims = self._neighbors(state, index)
+            if numBest is not None:
+                sims = sorted(sims, key=lambda item: -item[1])[:numBest]
+            yield itemID, sims
+
+    def save(self, path):
+        ''' Save the neighbors of every item to the snapshot file `path` '''
+        itemIDs, itemIndex, ptr, neighbors, values = self._state
+        writeArrays(path, [('ptr', '<i8', ptr),
+                           ('neighbors', '<i4', neighbors),
+                           ('values', '<f4', values)],
+                    {'itemIDs': itemIDs,
+                     'numNeighbors': self.numNeighbors,
+                     'threshold': self.threshold})
+
+    @classmethod
+    def load(cls, path, model=None, distance=None, numBest=None):
+        '''
+        Load the similarities saved at `path`. They are read straight from
+        the memory-mapped file. Without `model` and `distance`, reload keeps
+        the loaded similarities.
+        '''
+        arrays, metadata = readArrays(path)
+
+        similarity = cls(None, distance, metadata['numNeighbors'],
+                         metadata['threshold'], numBest)
+        similarity.model = model
+        similarity._install(metadata['itemIDs'], arrays['ptr'],
+                            arrays['neighbors'], arrays['values'])
+        return similarity
@@ -29,8 +29,116 @@ collection of vectors.
 
 """
 
+import heapq
+import threading
+import weakref
+from collections import OrderedDict
 
 from interfaces import Similarity
+from similarity_distance import OVERLAP_DISTANCES
+from batch import userSimilarities, itemSimilarities, supportsBatch
+from cooccurrence import userCooccurrenceSimilarities, \
+        itemCooccurrenceSimilarities, supportsCooccurrence
+
+# Number of rows whose similarities iterSimilarities computes together.
+BLOCK_SIZE = 256
+
+
+def _rows(IDs, rowSimilarities, numBest):
+    '''
+    Yield every ID of `IDs` with its similarities, computed a row at a time
+    by `rowSimilarities` (a one-vs-all getSimilarities). Unlike
+    _blockedPairs, each pair is computed for both of its rows.
+    '''
+    for ID in IDs:
+        sims = rowSimilarities(ID)
+        if numBest is not None:
+            sims = heapq.nlargest(numBest, sims, key=lambda item: item[1])
+        yield ID, sims
+
+
+def _addPair(rows, row, column, sim, numBest):
+    ''' Add the similarity `sim` of `column` to the heap of `row` '''
+    pairs = rows[row]
+    if pairs is None:
+        pairs = rows[row] = []
+    if len(pairs) < numBest:
+        # Ties are won by the smaller index, as in a stable sort.
+        heapq.heappush(pairs, (sim, -column))
+    else:
+        heapq.heappushpop(pairs, (sim, -column))
+
+
+def _blockedPairs(IDs, vector, pairSimilarity, blockSize, numBest):
+    '''
+    Yield every ID of `IDs` with its similarities, the vectors of the rows
+    fetched `blockSize` at a time, so each vector is fetched once per block
+    instead of once per row. The memory held stays bounded: by the number
+    of rows times `numBest` (see _blockedBest), or without `numBest` by the
+    rows of a block (see _blockedRows).
+    '''
+    if numBest is None:
+        return _blockedRows(IDs, vector, pairSimilarity, blockSize)
+    return _blockedBest(IDs, vector, pairSimilarity, blockSize, numBest)
+
+
+def _blockedRows(IDs, vector, pairSimilarity, blockSize):
+    '''
+    Yield every ID of `IDs` with its similarities to every ID, a block of
+    rows at a time: the vectors of the block are compared with the vector
+    of every row, so each pair across two blocks is computed twice, but
+    only the rows of the current block are held.
+    '''
+    numRows = len(IDs)
+    for blockStart in xrange(0, numRows, blockSize):
+        blockEnd = min(blockStart + blockSize, numRows)
+        block = [vector(IDs[row]) for row in xrange(blockStart, blockEnd)]
+        rows = [[] for row in block]
+        for column in xrange(numRows):
+            if blockStart <= column < blockEnd:
+                other = block[column - blockStart]
+            else:
+                other = vector(IDs[column])
+            otherID = IDs[column]
+            for row, rowVector in enumerate(block):
+                rows[row].append((otherID,
+                                  pairSimilarity(rowVector, other)))
+
+        for row, sims in enumerate(rows):
+            yield IDs[blockStart + row], sims
+
+
+def _blockedBest(IDs, vector, pairSimilarity, blockSize, numBest):
+    '''
+    Yield every ID of `IDs` with its `numBest` most similar IDs, computing
+    each pair once.
+
+    The vectors of a block of rows are compared with the vector of every
+    row from the block on. Every similarity goes to the heaps of both rows,
+    which keep at most `numBest` pairs each; a row is complete, yielded and
+    dropped once its block is done.
+    '''
+    numRows = len(IDs)
+    rows = [None] * numRows
+    for blockStart in xrange(0, numRows, blockSize):
+        blockEnd = min(blockStart + blockSize, numRows)
+        block = [vector(IDs[row]) for row in xrange(blockStart, blockEnd)]
+        for column in xrange(blockStart, numRows):
+            if column < blockEnd:
+                other = block[column - blockStart]
+            else:
+                other = vector(IDs[column])
+            for row in xrange(blockStart, min(column + 1, blockEnd)):
+                sim = pairSimilarity(block[row - blockStart], other)
+                _addPair(rows, row, column, sim, numBest)
+                if row != column:
+                    _addPair(rows, column, row, sim, numBest)
+
+        for row in xrange(blockStart, blockEnd):
+            pairs = rows[row] or []
+            rows[row] = None
+            pairs.sort(reverse=True)
+            yield IDs[row], [(IDs[-negated], sim) for sim, negated in pairs]
 
 
 class UserSimilarity(Similarity):
@@ -45,6 +153,12 @@ class UserSimilarity(Similarity):
         Similarity.__init__(self, model, distance, numBest)
 
     def getSimilarity(self, vec1, vec2):
+        overlap = OVERLAP_DISTANCES.get(self.distance, None)
+        if overlap is not None and hasattr(self.model, 'UserOverlap'):
+            # Only the shared items matter: count them on the model.
+            nP1, nP2, nP1P2 = self.model.UserOverlap(vec1, vec2)
+            return overlap(nP1, nP2, nP1P2, self.model.NumItems())
+
         usr1Prefs = dict(self.model.PreferencesFromUser(vec1))
         usr2Prefs = dict(self.model.PreferencesFromUser(vec2))
 
@@ -52,15 +166,59 @@ class UserSimilarity(Similarity):
         return self.distance(usr1Prefs, usr2Prefs)
 
     def getSimilarities(self, vec):
+        # One pass over the model buffers when the distance has a batched
+        # kernel, a walk over the users sharing an item with `vec` when it
+        # can be computed from co-occurrences, one getSimilarity per user
+        # otherwise.
+        sims = userSimilarities(self.model, self.distance, vec)
+        if sims is not None:
+            return zip(self.model.UserIDs(), sims.tolist())
+
+        sims = userCooccurrenceSimilarities(self.model, self.distance, vec)
+        if sims is not None:
+            return sims
+
         return [(other, self.getSimilarity(vec, other))
                 for other, v in self.model]
 
+    def iterSimilarities(self, blockSize=BLOCK_SIZE, numBest=None):
+        '''
+        Yield every user of the model with its similarities to every user,
+        as self[userID] returns them, a user at a time.
+
+        Batched distances and those computed from co-occurrences compute
+        each row at once (see getSimilarities) and are not blocked: each
+        pair is computed for both of its users, a row kernel comparing a
+        user with all the others in one pass over the model, which beats
+        blocking the pairs through the scalar distance. Only one row is
+        held at a time.
+
+        The others fetch the preferences of `blockSize` users at a time
+        (see _blockedPairs): with `numBest`, each pair of users is computed
+        once and only the numBest most similar users of each user are kept,
+        so the memory held is bounded by the number of users times numBest;
+        without it, the rows of a block are computed against every user and
+        yielded, each pair across two blocks being computed twice.
+        '''
+        userIDs = list(self.model.UserIDs())
+        if supportsBatch(self.model, self.distance) or \
+                supportsCooccurrence(self.distance):
+            return _rows(userIDs, self.getSimilarities, numBest)
+
+        if self.distance in OVERLAP_DISTANCES and \
+                hasattr(self.model, 'UserOverlap'):
+            return _blockedPairs(userIDs, lambda userID: userID,
+                                 self.getSimilarity, blockSize, numBest)
+
+        return _blockedPairs(userIDs,
+                lambda userID: dict(self.model.PreferencesFromUser(userID)),
+                self.distance, blockSize, numBest)
+
     def __iter__(self):
         """
         For each object in model, compute the similarity function against all
         other objects and yield the result.  """
-        for num, user, vec in enumerate(self.model):
-            yield self[user]
+        return self.iterSimilarities(numBest=self.numBest)
 
 
 class ItemSimilarity(Similarity):
@@ -74,6 +232,12 @@ class ItemSimilarity(Similarity):
         Similarity.__init__(self, model, distance, numBest)
 
     def getSimilarity(self, vec1, vec2):
+        overlap = OVERLAP_DISTANCES.get(self.distance, None)
+        if overlap is not None and hasattr(self.model, 'ItemOverlap'):
+            # Only the shared users matter: count them on the model.
+            nP1, nP2, nP1P2 = self.model.ItemOverlap(vec1, vec2)
+            return overlap(nP1, nP2, nP1P2, self.model.NumUsers())
+
         item1Prefs = dict(self.model.PreferencesForItem(vec1))
         item2Prefs = dict(self.model.PreferencesForItem(vec2))
 
@@ -81,13 +245,190 @@ class ItemSimilarity(Similarity):
         return self.distance(item1Prefs, item2Prefs)
 
     def getSimilarities(self, vec):
+        sims = itemSimilarities(self.model, self.distance, vec)
+        if sims is not None:
+            return zip(self.model.ItemIDs(), sims.tolist())
+
+        sims = itemCooccurrenceSimilarities(self.model, self.distance, vec)
+        if sims is not None:
+            return sims
+
         return [(other, self.getSimilarity(vec, other))
                 for other in self.model.ItemIDs()]
 
+    def iterSimilarities(self, blockSize=BLOCK_SIZE, numBest=None):
+        '''
+        Yield every item of the model with its similarities to every item,
+        as self[itemID] returns them, an item at a time. See
+        UserSimilarity.iterSimilarities.
+        '''
+        itemIDs = list(self.model.ItemIDs())
+        if supportsBatch(self.model, self.distance) or \
+                supportsCooccurrence(self.distance):
+            return _rows(itemIDs, self.getSimilarities, numBest)
+
+        if self.distance in OVERLAP_DISTANCES and \
+                hasattr(self.model, 'ItemOverlap'):
+            return _blockedPairs(itemIDs, lambda itemID: itemID,
+                                 self.getSimilarity, blockSize, numBest)
+
+        return _blockedPairs(itemIDs,
+                lambda itemID: dict(self.model.PreferencesForItem(itemID)),
+                self.distance, blockSize, numBest)
+
     def __iter__(self):
         """
         For each object in model, compute the similarity function against all
         other objects and yield the result.
         """
-        for num, item in enumerate(self.model.ItemIDs()):
-            yield item, self.PreferencesForItem(userID)
+        return self.iterSimilarities(numBest=self.numBest)
+
+
+# Cached in place of None, to tell a cached "no similarity" from a miss.
+_NO_SIMILARITY = object()
+
+
+def _weakListener(model, owner, name):
+    '''
+    A preference listener calling the method `name` of `owner` without
+    keeping `owner` alive; once `owner` is gone, it unregisters itself
+    from `model` on the next change.
+    '''
+    ref = weakref.ref(owner)
+
+    def listener(userID, itemID):
+        owner = ref()
+        if owner is None:
+            model.removePreferenceListener(listener)
+        else:
+            getattr(owner, name)(userID, itemID)
+    return listener
+
+
+class CachingSimilarity(Similarity):
+    '''
+    Wraps a UserSimilarity or an ItemSimilarity and remembers the
+    similarities it computes, so the same pair asked again by the
+    recommenders (once per candidate item, for instance) is not recomputed.
+
+    Pairs are cached in either order under the same key, including the
+    pairs without similarity (None). Once more than `maxSize` pairs are
+    cached, the least recently used ones are evicted. The cache counts its
+    `hits` and `misses`.
+
+    When the model reports a preference change, the pairs of the user (or
+    item, for an ItemSimilarity) whose preference changed are evicted; a
+    reload (or refresh) empties the cache. A similarity computed while an
+    eviction ran is returned but not cached.
+
+    The cache listens to the model through a weak reference, so dropping
+    the cache frees it; close unregisters the listener at once.
+    '''
+
+    def __init__(self, similarity, maxSize=100000):
+        '''
+        CachingSimilarity Constructor
+
+        `similarity` the UserSimilarity or ItemSimilarity to cache.
+
+        `maxSize` the maximum number of pairs cached.
+        '''
+        Similarity.__init__(self, similarity.model, similarity.distance,
+                            similarity.numBest)
+        self.similarity = similarity
+        self.maxSize = maxSize
+        self.byUser = not isinstance(similarity, ItemSimilarity)
+        self.hits = 0
+        self.misses = 0
+        self._pairs = OrderedDict()
+        self._keys = {}
+        # Bumped by every eviction: a pair computed meanwhile may be stale.
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        if hasattr(self.model, 'addPreferenceListener'):
+            self._listener = _weakListener(self.model, self,
+                                           '_preferenceChanged')
+            self.model.addPreferenceListener(self._listener)
+
+    def dependencies(self):
+        return [self.similarity]
+
+    def reload(self):
+        self.clear()
+
+    def close(self):
+        ''' Stop listening to the preference changes of the model '''
+        if self._listener is not None:
+            self.model.removePreferenceListener(self._listener)
+            self._listener = None
+
+    def clear(self):
+        ''' Evict every cached pair '''
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            self._pairs.clear()
+            self._keys.clear()
+        finally:
+            self._lock.release()
+
+    def evict(self, ID):
+        ''' Evict the pairs of the user (or item) `ID` '''
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            for key in self._keys.pop(ID, ()):
+                if self._pairs.pop(key, None) is not None:
+                    self._forget(key)
+        finally:
+            self._lock.release()
+
+    def _forget(self, key):
+        ''' Drop `key` from the keys of both its IDs '''
+        for ID in key:
+            keys = self._keys.get(ID, None)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys[ID]
+
+    def _preferenceChanged(self, userID, itemID):
+        self.evict(userID if self.byUser else itemID)
+
+    def getSimilarity(self, vec1, vec2):
+        key = (vec1, vec2) if vec1 <= vec2 else (vec2, vec1)
+
+        self._lock.acquire()
+        try:
+            sim = self._pairs.pop(key, None)
+            if sim is not None:
+                self._pairs[key] = sim
+                self.hits += 1
+                return None if sim is _NO_SIMILARITY else sim
+            self.misses += 1
+            generation = self._generation
+        finally:
+            self._lock.release()
+
+        sim = self.similarity.getSimilarity(vec1, vec2)
+
+        self._lock.acquire()
+        try:
+            if generation != self._generation:
+                return sim
+            self._pairs[key] = _NO_SIMILARITY if sim is None else sim
+            for ID in key:
+                self._keys.setdefault(ID, set()).add(key)
+            while len(self._pairs) > self.maxSize:
+                self._forget(self._pairs.popitem(last=False)[0])
+        finally:
+            self._lock.release()
+
+        return sim
+
+    def getSimilarities(self, vec):
+        return self.similarity.getSimilarities(vec)
+
+    def __len__(self):
+        return len(self._pairs)
@@ -224,11 +224,9 @@ def sim_tanimoto(vector1, vector2, **args):
     The value returned is in [0,1].
 
     '''
-    simP1P2 = [item for item in vector1 if item in vector2]
-    if len(simP1P2) == 0:
-        return 0.0
+    nP1P2 = len([item for item in vector1 if item in vector2])
 
-    return float(len(simP1P2)) / (len(vector1) + len(vector2) - len(simP1P2))
+    return overlap_tanimoto(len(vector1), len(vector2), nP1P2)
 
 
 def sim_cosine(vector1, vector2, **args):
@@ -293,47 +291,16 @@ def sim_loglikehood(n, vector1, vector2, **args):
     The value returned is in [0,1].
     '''
 
-    def safeLog(d):
-        if d <= 0.0:
-            return 0.0
-        else:
-            return log(d)
-
-    def logL(p, k, n):
-        return k * safeLog(p) + (n - k) * safeLog(1.0 - p)
-
-    def twoLogLambda(k1, k2, n1, n2):
-        p = (k1 + k2) / (n1 + n2)
-        return 2.0 * (logL(k1 / n1, k1, n1) + logL(k2 / n2, k2, n2)
-                      - logL(p, k1, n1) - logL(p, k2, n2))
-
     # Using Content Mode.
     if type(vector1) == type({}):
         simP1P2 = {}
         [simP1P2.update({item: 1}) for item in vector1 if item in vector2]
 
-        if len(simP1P2) == 0:
-            return 0.0
-
         nP1P2 = len(simP1P2)
-        nP1 = len(vector1)
-        nP2 = len(vector2)
     else:
         nP1P2 = len([item  for item in vector1 if item in vector2])
 
-        if nP1P2 == 0:
-            return 0.0
-
-        nP1 = len(vector1)
-        nP2 = len(vector2)
-
-    if (nP1 - nP1P2 == 0)  or (n - nP2 == 0):
-        return 1.0
-
-    logLikeliHood = twoLogLambda(float(nP1P2), float(nP1 - nP1P2),
-                                 float(nP2), float(n - nP2))
-
-    return 1.0 - 1.0 / (1.0 + float(logLikeliHood))
+    return overlap_loglikehood(len(vector1), len(vector2), nP1P2, n)
 
 
 def sim_sorensen(vector1, vector2, **args):
@@ -357,10 +324,7 @@ def sim_sorensen(vector1, vector2, **args):
     '''
     nP1P2 = len([item  for item in vector1 if item in vector2])
 
-    if len(vector1) + len(vector2) == 0:
-        return 0.0
-
-    return float(2.0 * nP1P2 / (len(vector1) + len(vector2)))
+    return overlap_sorensen(len(vector1), len(vector2), nP1P2)
 
 
 def sim_manhattan(vector1, vector2, **args):
@@ -419,7 +383,71 @@ def sim_jaccard(vector1, vector2, **args):
     else:
         nP1P2 = len([item  for item in vector1 if item in vector2])
 
-    if len(vector1) == 0 and len(vector2) == 0:
+    return overlap_jaccard(len(vector1), len(vector2), nP1P2)
+
+
+# The similarities that only depend on which items two vectors share can be
+# computed from three counts: the size of each vector (nP1, nP2) and the size
+# of their intersection (nP1P2). Data models able to count intersections
+# directly, such as MatrixDataModel and BooleanDataModel, use them through
+# OVERLAP_DISTANCES instead of building the vectors. `n` is the total number
+# of items (or users, when comparing items).
+
+def overlap_tanimoto(nP1, nP2, nP1P2, n=None):
+    ''' sim_tanimoto computed from the overlap counts '''
+    if nP1P2 == 0:
+        return 0.0
+
+    return float(nP1P2) / (nP1 + nP2 - nP1P2)
+
+
+def overlap_jaccard(nP1, nP2, nP1P2, n=None):
+    ''' sim_jaccard computed from the overlap counts '''
+    if nP1 == 0 and nP2 == 0:
+        return 0.0
+
+    return float(nP1P2) / (nP1 + nP2 - nP1P2)
+
+
+def overlap_sorensen(nP1, nP2, nP1P2, n=None):
+    ''' sim_sorensen computed from the overlap counts '''
+    if nP1 + nP2 == 0:
+        return 0.0
+
+    return float(2.0 * nP1P2 / (nP1 + nP2))
+
+
+def overlap_loglikehood(nP1, nP2, nP1P2, n):
+    ''' sim_loglikehood computed from the overlap counts '''
+
+    def safeLog(d):
+        if d <= 0.0:
+            return 0.0
+        else:
+            return log(d)
+
+    def logL(p, k, n):
+        return k * safeLog(p) + (n - k) * safeLog(1.0 - p)
+
+    def twoLogLambda(k1, k2, n1, n2):
+        p = (k1 + k2) / (n1 + n2)
+        return 2.0 * (logL(k1 / n1, k1, n1) + logL(k2 / n2, k2, n2)
+                      - logL(p, k1, n1) - logL(p, k2, n2))
+
+    if nP1P2 == 0:
         return 0.0
 
-    return float(nP1P2) / (len(vector1) + len(vector2) - nP1P2)
+    if (nP1 - nP1P2 == 0)  or (n - nP2 == 0):
+        return 1.0
+
+    logLikeliHood = twoLogLambda(float(nP1P2), float(nP1 - nP1P2),
+                                 float(nP2), float(n - nP2))
+
+    return 1.0 - 1.0 / (1.0 + float(logLikeliHood))
+
+
+OVERLAP_DISTANCES = {
+    sim_tanimoto: overlap_tanimoto,
+    sim_jaccard: overlap_jaccard,
+    sim_sorensen: overlap_sorensen,
+    sim_loglikehood: overlap_loglikehood}
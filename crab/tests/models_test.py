@@ -24,9 +24,28 @@
 
 __author__ = 'marcel@orygens.com'
 
+import bz2
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
 import unittest
+from array import array
 
 from models.datamodel import *
+from models.matrixmodel import MatrixDataModel, countIntersection, \
+        intersectSorted
+from models.booleanmodel import BooleanDataModel
+from models.snapshot import saveModel, loadModel, readArrays
+from models.filemodel import FileDataModel
+from models.sqlmodel import SQLiteDataModel
+from models.views import MaskedDataModel, PlusAnonymousUserDataModel, \
+        ReloadableDataModel
+from models.journal import JournaledDataModel
+from models.idmigrator import IDMigrator, migratePreferences
+from models.quantizers import LinearQuantizer, Float16Quantizer
 
 
 class TestDictModel(unittest.TestCase):
@@ -183,6 +202,8 @@ class TestDictModel(unittest.TestCase):
                 'SuperMan Returns', 'Just My Luck', 'Lady in The Water')
         self.assertRaises(ValueError, model.NumUsersWithPreferenceFor,
                 'SuperMan Returns', 'Back to the future')
+        self.assertRaises(ValueError, model.NumUsersWithPreferenceFor,
+                'Superman Returns', 'Just My Luck', 'Back to the future')
 
     def test_NumUsersWithPreferenceFor_One_User_DictModel(self):
         model = DictDataModel(self.movies)
@@ -194,6 +215,39 @@ class TestDictModel(unittest.TestCase):
         self.assertEquals(4, model.NumUsersWithPreferenceFor(
                     'Superman Returns', 'Just My Luck'))
 
+    def test_NumUsersWithPreferenceFor_Many_Users_DictModel(self):
+        model = DictDataModel(self.movies)
+        self.assertEquals(3, model.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck', 'Lady in the Water'))
+        self.assertEquals(3, model.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck', 'Lady in the Water',
+                    'You, Me and Dupree', 'The Night Listener',
+                    'Snakes on a Plane'))
+
+    def test_PreferenceTime_DictModel(self):
+        timestamps = {'Penny Frewman': {'Snakes on a Plane': 100,
+                                        'Superman Returns': 300},
+                      'Sheldom': {'Superman Returns': 200}}
+        model = DictDataModel(self.movies, timestamps)
+        self.assertEquals(300,
+                model.PreferenceTime('Penny Frewman', 'Superman Returns'))
+        self.assertEquals(None,
+                model.PreferenceTime('Penny Frewman', 'You, Me and Dupree'))
+        self.assertRaises(ValueError, model.PreferenceTime, 'Flavia',
+                          'Superman Returns')
+        self.assertEquals([('Snakes on a Plane', 4.5),
+                           ('Superman Returns', 4.0)],
+                model.PreferencesFromUserSince('Penny Frewman', 100))
+        self.assertEquals([('Penny Frewman', 4.0), ('Sheldom', 5.0)],
+                model.PreferencesForItemSince('Superman Returns', 200))
+
+        model.setPreference('Penny Frewman', 'Superman Returns', 2.0)
+        self.assertEquals(None,
+                model.PreferenceTime('Penny Frewman', 'Superman Returns'))
+        model.setPreference('Penny Frewman', 'Just My Luck', 2.0, 400)
+        self.assertEquals([('Just My Luck', 2.0)],
+                model.PreferencesFromUserSince('Penny Frewman', 150))
+
     def test_hasPreferenceValues_DictModel(self):
         model = DictDataModel(self.movies)
         self.assertEquals(True, model.hasPreferenceValues())
@@ -226,9 +280,1536 @@ class TestDictModel(unittest.TestCase):
                           elements[0])
 
 
+    def test_cached_views_DictModel(self):
+        model = DictDataModel(self.movies)
+        prefs = model.PreferencesFromUser('Lorena Abreu')
+        self.assert_(prefs is model.PreferencesFromUser('Lorena Abreu'))
+        self.assert_(model.PreferencesForItem('Just My Luck') is
+                     model.PreferencesForItem('Just My Luck'))
+        self.assertRaises(TypeError, prefs.append, ('Back to the Future', 5.0))
+        self.assertRaises(TypeError, prefs.sort)
+
+    def test_invalidate_views_DictModel(self):
+        model = DictDataModel(self.movies)
+        userPrefs = model.PreferencesFromUser('Penny Frewman')
+        itemPrefs = model.PreferencesForItem('Just My Luck')
+        otherPrefs = model.PreferencesFromUser('Lorena Abreu')
+        model.dataU['Penny Frewman']['Just My Luck'] = 2.0
+        model.dataI['Just My Luck']['Penny Frewman'] = 2.0
+        model._invalidatePreferences('Penny Frewman', 'Just My Luck')
+        self.assertEquals([('Just My Luck', 2.0),
+                           ('Snakes on a Plane', 4.5),
+                           ('Superman Returns', 4.0),
+                           ('You, Me and Dupree', 1.0)],
+                          model.PreferencesFromUser('Penny Frewman'))
+        self.assert_(userPrefs is not model.PreferencesFromUser('Penny Frewman'))
+        self.assert_(itemPrefs is not model.PreferencesForItem('Just My Luck'))
+        self.assert_(otherPrefs is model.PreferencesFromUser('Lorena Abreu'))
+
+    def test_setPreference_DictModel(self):
+        model = DictDataModel(self.movies)
+        itemPrefs = model.PreferencesForItem('Just My Luck')
+        model.setPreference('Penny Frewman', 'Just My Luck', 5.5)
+        self.assertEquals(5.5, model.PreferenceValue('Penny Frewman',
+                                                     'Just My Luck'))
+        self.assertEquals(5.5, model.MaxPreference())
+        self.assertEquals(5, model.NumUsersWithPreferenceFor('Just My Luck'))
+        self.assert_(itemPrefs is not model.PreferencesForItem('Just My Luck'))
+
+        model.setPreference('Maria Gabriela', 'Back to the Future', 0.5)
+        model.setPreference('Aline Vieira', 'Back to the Future', 3.0)
+        self.assertEquals(['Aline Vieira', 'Leopoldo Pires', 'Lorena Abreu',
+                           'Luciana Nunes', 'Marcel Caraciolo', 'Maria Gabriela',
+                           'Penny Frewman', 'Sheldom', 'Steve Gates'],
+                          model.UserIDs())
+        self.assertEquals(['Back to the Future', 'Just My Luck',
+                           'Lady in the Water', 'Snakes on a Plane',
+                           'Superman Returns', 'The Night Listener',
+                           'You, Me and Dupree'], model.ItemIDs())
+        self.assertEquals([('Aline Vieira', 3.0), ('Maria Gabriela', 0.5)],
+                          model.PreferencesForItem('Back to the Future'))
+        self.assertEquals(0.5, model.MinPreference())
+
+        model.setPreference('Maria Gabriela', 'Back to the Future', 2.0)
+        self.assertEquals(1.0, model.MinPreference())
+
+    def test_removePreference_DictModel(self):
+        model = DictDataModel(self.movies)
+        model.removePreference('Penny Frewman', 'You, Me and Dupree')
+        self.assertEquals(None, model.PreferenceValue('Penny Frewman',
+                                                      'You, Me and Dupree'))
+        self.assertEquals(1.5, model.MinPreference())
+        self.assertEquals([('Snakes on a Plane', 4.5),
+                           ('Superman Returns', 4.0)],
+                          model.PreferencesFromUser('Penny Frewman'))
+
+        model.removePreference('Luciana Nunes', 'Superman Returns')
+        self.assertEquals(5.0, model.MaxPreference())
+        model.removePreference('Sheldom', 'Superman Returns')
+        self.assertEquals(4.5, model.MaxPreference())
+
+        # Removing a missing preference does nothing.
+        model.removePreference('Maria Gabriela', 'Superman Returns')
+        self.assertRaises(ValueError, model.removePreference, 'Flavia',
+                          'Superman Returns')
+
+        model.setPreference('Maria Gabriela', 'Back to the Future', 3.0)
+        model.removePreference('Maria Gabriela', 'Back to the Future')
+        self.assert_('Back to the Future' not in model.ItemIDs())
+        self.assertRaises(ValueError, model.PreferencesForItem,
+                          'Back to the Future')
+        self.assert_('Maria Gabriela' in model.UserIDs())
+
+    def test_preference_listeners_DictModel(self):
+        model = DictDataModel(self.movies)
+        changes = []
+        listener = lambda userID, itemID: changes.append((userID, itemID))
+        model.addPreferenceListener(listener)
+        model.setPreference('Penny Frewman', 'Just My Luck', 2.0)
+        model.removePreference('Penny Frewman', 'Just My Luck')
+        self.assertEquals([('Penny Frewman', 'Just My Luck'),
+                           ('Penny Frewman', 'Just My Luck')], changes)
+        model.removePreferenceListener(listener)
+        model.setPreference('Penny Frewman', 'Just My Luck', 2.0)
+        self.assertEquals(2, len(changes))
+
+    def test_stats_DictModel(self):
+        model = DictDataModel(self.movies)
+        self.assertEquals(PreferenceStats(3, 9.5, 37.25),
+                          model.UserStats('Penny Frewman'))
+        self.assertEquals(PreferenceStats(7, 28.0, 115.5),
+                          model.ItemStats('Superman Returns'))
+        self.assertEquals(4.0, model.ItemStats('Superman Returns').mean())
+        self.assertEquals(PreferenceStats(), model.UserStats('Maria Gabriela'))
+        self.assertEquals(None, model.UserStats('Maria Gabriela').mean())
+        self.assertRaises(ValueError, model.UserStats, 'Flavia')
+        self.assertRaises(ValueError, model.ItemStats, 'Pulp Fiction')
+
+        model.setPreference('Penny Frewman', 'Snakes on a Plane', 2.5)
+        model.setPreference('Flavia', 'Pulp Fiction', 3.0)
+        self.assertEquals(PreferenceStats(3, 7.5, 23.25),
+                          model.UserStats('Penny Frewman'))
+        self.assertEquals(PreferenceStats(1, 3.0, 9.0),
+                          model.ItemStats('Pulp Fiction'))
+        model.removePreference('Flavia', 'Pulp Fiction')
+        model.removePreference('Penny Frewman', 'Superman Returns')
+        self.assertRaises(ValueError, model.ItemStats, 'Pulp Fiction')
+        self.assertEquals(PreferenceStats(2, 3.5, 7.25),
+                          model.UserStats('Penny Frewman'))
+        self.assertEquals(PreferenceStats(6, 24.0, 99.5),
+                          model.ItemStats('Superman Returns'))
+        self.assertEquals(PreferenceStats.fromValues([2.5, 1.0]),
+                          model.UserStats('Penny Frewman'))
+        self.assertEquals(0.75, model.UserStats('Penny Frewman').std())
+
+class TestMatrixModel(unittest.TestCase):
+
+    def setUp(self):
+        # SIMILARITY BY RATES.
+        self.movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+    def test_create_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        self.assertEquals(8, len(model.userPtr) - 1)
+        self.assertEquals(6, len(model.itemPtr) - 1)
+        self.assertEquals(35, len(model.userItems))
+        self.assertEquals(35, len(model.itemUsers))
+
+    def test_UserIDs_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        self.assertEquals(DictDataModel(self.movies).UserIDs(),
+                          model.UserIDs())
+
+    def test_ItemIDs_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        self.assertEquals(DictDataModel(self.movies).ItemIDs(),
+                          model.ItemIDs())
+
+    def test_PreferencesFromUser_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        dictModel = DictDataModel(self.movies)
+        for userID in model.UserIDs():
+            self.assertEquals(dictModel.PreferencesFromUser(userID),
+                              model.PreferencesFromUser(userID))
+        self.assertEquals([('The Night Listener', 4.5),
+                           ('Superman Returns', 4.0),
+                           ('Snakes on a Plane', 3.5),
+                           ('Just My Luck', 3.0),
+                           ('You, Me and Dupree', 2.5)],
+                   model.PreferencesFromUser('Lorena Abreu', orderByID=False))
+        self.assertEquals([], model.PreferencesFromUser('Maria Gabriela'))
+        self.assertRaises(ValueError, model.PreferencesFromUser, 'Flavia')
+
+    def test_PreferencesForItem_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        dictModel = DictDataModel(self.movies)
+        for itemID in model.ItemIDs():
+            self.assertEquals(dictModel.PreferencesForItem(itemID),
+                              model.PreferencesForItem(itemID))
+        self.assertRaises(ValueError, model.PreferencesForItem,
+                          'Back to the Future')
+
+    def test_PreferenceValue_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        self.assertEquals(3.5,
+                model.PreferenceValue('Marcel Caraciolo', 'Superman Returns'))
+        self.assertEquals(None,
+                model.PreferenceValue('Leopoldo Pires', 'Just My Luck'))
+        self.assertEquals(None,
+                model.PreferenceValue('Maria Gabriela', 'Just My Luck'))
+
+    def test_NumUsersWithPreferenceFor_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        self.assertEquals(7,
+                model.NumUsersWithPreferenceFor('Superman Returns'))
+        self.assertEquals(4, model.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck'))
+        self.assertEquals(3, model.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck', 'Lady in the Water'))
+        self.assertEquals(3, model.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck', 'Lady in the Water',
+                    'You, Me and Dupree', 'The Night Listener',
+                    'Snakes on a Plane'))
+        self.assertRaises(ValueError, model.NumUsersWithPreferenceFor)
+        self.assertRaises(ValueError, model.NumUsersWithPreferenceFor,
+                'Superman Returns', 'Just My Luck', 'Back to the Future')
+
+    def test_Overlap_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        self.assertEquals((6, 3, 3),
+                model.UserOverlap('Marcel Caraciolo', 'Penny Frewman'))
+        self.assertEquals((6, 0, 0),
+                model.UserOverlap('Marcel Caraciolo', 'Maria Gabriela'))
+        self.assertEquals((7, 4, 4),
+                model.ItemOverlap('Superman Returns', 'Just My Luck'))
+        self.assertRaises(ValueError, model.UserOverlap, 'Marcel Caraciolo',
+                          'Flavia')
+
+    def test_countIntersection(self):
+        short = array('i', [3, 500, 999])
+        long = array('i', range(0, 1000, 3))
+        self.assertEquals(2, countIntersection(short, 0, 3, long, 0, 334))
+        self.assertEquals(2, countIntersection(long, 0, 334, short, 0, 3))
+        self.assertEquals(1, countIntersection(short, 1, 3, long, 0, 334))
+        self.assertEquals(0, countIntersection(short, 0, 0, long, 0, 334))
+        self.assertEquals(34, countIntersection(long, 0, 334,
+                array('i', range(0, 100)), 0, 100))
+        self.assertEquals([3, 999], intersectSorted([3, 500, 999], long,
+                                                    0, 334))
+        self.assertEquals([0, 3], intersectSorted(range(5), long, 0, 334))
+
+    def test_timestamps_MatrixModel(self):
+        timestamps = {'Penny Frewman': {'Snakes on a Plane': 100,
+                                        'You, Me and Dupree': 400,
+                                        'Superman Returns': 300},
+                      'Sheldom': {'Superman Returns': 200,
+                                  'Lady in the Water': 500}}
+        model = MatrixDataModel(self.movies, timestamps)
+        self.assertEquals(300.0,
+                model.PreferenceTime('Penny Frewman', 'Superman Returns'))
+        self.assertEquals(None,
+                model.PreferenceTime('Sheldom', 'Snakes on a Plane'))
+        self.assertEquals([('Superman Returns', 4.0),
+                           ('You, Me and Dupree', 1.0)],
+                model.PreferencesFromUserSince('Penny Frewman', 300))
+        self.assertEquals([('Penny Frewman', 4.0), ('Sheldom', 5.0)],
+                model.PreferencesForItemSince('Superman Returns', 0))
+        self.assertEquals([],
+                model.PreferencesFromUserSince('Marcel Caraciolo', 0))
+
+        recent = model.timeSlice(200, 500)
+        self.assertEquals(['Penny Frewman', 'Sheldom'], recent.UserIDs())
+        self.assertEquals(['Superman Returns', 'You, Me and Dupree'],
+                          recent.ItemIDs())
+        self.assertEquals([('Superman Returns', 4.0),
+                           ('You, Me and Dupree', 1.0)],
+                          recent.PreferencesFromUser('Penny Frewman'))
+        self.assertEquals(200.0,
+                recent.PreferenceTime('Sheldom', 'Superman Returns'))
+        self.assertEquals(3, model.timeSlice(start=300).NumItems())
+
+        self.assertEquals(None, MatrixDataModel(self.movies).PreferenceTime(
+                'Penny Frewman', 'Superman Returns'))
+        self.assertRaises(ValueError, MatrixDataModel(self.movies).timeSlice)
+
+    def test_fromArrays_MatrixModel(self):
+        users, items, values = [], [], []
+        for userID, prefs in self.movies.iteritems():
+            for itemID, value in prefs.iteritems():
+                users.append(userID)
+                items.append(itemID)
+                values.append(value)
+        # A repeated pair: the last value wins.
+        users.insert(0, 'Penny Frewman')
+        items.insert(0, 'Superman Returns')
+        values.insert(0, 0.5)
+
+        model = MatrixDataModel.fromArrays(users, items, values)
+        expected = MatrixDataModel(self.movies)
+        # Maria Gabriela has no preferences: she is not in the arrays.
+        self.assertEquals([pref for pref in expected
+                           if pref[0] != 'Maria Gabriela'],
+                          [pref for pref in model])
+        for itemID in expected.ItemIDs():
+            self.assertEquals(expected.PreferencesForItem(itemID),
+                              model.PreferencesForItem(itemID))
+        self.assertEquals(5.0, model.MaxPreference())
+        self.assertEquals(1.0, model.MinPreference())
+        self.assertEquals(4.0, model.PreferenceValue('Penny Frewman',
+                                                     'Superman Returns'))
+        self.assertEquals(4, model.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck'))
+
+    def test_fromArrays_timestamps_MatrixModel(self):
+        model = MatrixDataModel.fromArrays([3, 1, 3, 2], [10, 20, 20, 10],
+                [1.0, 2.0, 3.0, 4.0], [400, 300, 200, 100])
+        self.assertEquals([1, 2, 3], model.UserIDs())
+        self.assertEquals([(10, 1.0), (20, 3.0)], model.PreferencesFromUser(3))
+        self.assertEquals(200.0, model.PreferenceTime(3, 20))
+        self.assertEquals([(3, 1.0)], model.PreferencesForItemSince(10, 150))
+
+        boolean = BooleanDataModel.fromArrays([3, 1], [10, 20])
+        self.assertEquals([(10, 1.0)], boolean.PreferencesFromUser(3))
+        self.assertEquals(1.0, boolean.MaxPreference())
+        self.assertRaises(ValueError, MatrixDataModel.fromArrays, [3], [10])
+
+        empty = MatrixDataModel.fromArrays([], [], [])
+        self.assertEquals([], empty.UserIDs())
+        self.assertEquals(None, empty.MaxPreference())
+
+    def test_Min_MaxPreference_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        self.assertEquals(5.0, model.MaxPreference())
+        self.assertEquals(1.0, model.MinPreference())
+        self.assertEquals(8, model.NumUsers())
+        self.assertEquals(6, model.NumItems())
+
+    def test_iter_MatrixModel(self):
+        model = MatrixDataModel(self.movies)
+        self.assertEquals([pref for pref in DictDataModel(self.movies)],
+                          [pref for pref in model])
+
+    def test_stats_MatrixModel(self):
+        expected = DictDataModel(self.movies)
+        for model in (MatrixDataModel(self.movies),
+                      MatrixDataModel(self.movies,
+                                      quantizer=LinearQuantizer(0.5))):
+            for userID in expected.UserIDs():
+                self.assertEquals(expected.UserStats(userID),
+                                  model.UserStats(userID))
+            for itemID in expected.ItemIDs():
+                self.assertEquals(expected.ItemStats(itemID),
+                                  model.ItemStats(itemID))
+        counts, sums, sumsSq, means, norms = model.ItemStatsArrays()
+        index = model.ItemIDs().index('Superman Returns')
+        self.assertEquals(7, counts[index])
+        self.assertEquals(4.0, means[index])
+        self.assertAlmostEquals(115.5 ** 0.5, norms[index])
+        counts, sums, sumsSq, means, norms = model.UserStatsArrays()
+        index = model.UserIDs().index('Maria Gabriela')
+        self.assertEquals(0, counts[index])
+        self.assertEquals(0.0, means[index])
+        self.assertRaises(ValueError, model.ItemStats, 'Pulp Fiction')
+
+    def test_quantized_MatrixModel(self):
+        expected = MatrixDataModel(self.movies)
+        for quantizer in (LinearQuantizer(0.5), Float16Quantizer()):
+            model = MatrixDataModel(self.movies, quantizer=quantizer)
+            self.assertEquals([pref for pref in expected],
+                              [pref for pref in model])
+            for itemID in expected.ItemIDs():
+                self.assertEquals(expected.PreferencesForItem(itemID),
+                                  model.PreferencesForItem(itemID))
+            self.assertEquals(expected.PreferencesFromUser('Sheldom', False),
+                              model.PreferencesFromUser('Sheldom', False))
+            self.assertEquals(4.5, model.PreferenceValue('Penny Frewman',
+                                                         'Snakes on a Plane'))
+            self.assertEquals(5.0, model.MaxPreference())
+            self.assertEquals(1.0, model.MinPreference())
+        self.assertEquals(8, expected.userValues.itemsize)
+        self.assertEquals(1, MatrixDataModel(self.movies,
+                quantizer=LinearQuantizer(0.5)).userValues.itemsize)
+        self.assertRaises(ValueError, MatrixDataModel, self.movies,
+                          quantizer=LinearQuantizer(1.0))
+
+    def test_quantized_fromArrays_MatrixModel(self):
+        model = MatrixDataModel.fromArrays([1, 1, 2], [10, 20, 10],
+                [2.5, 4.0, 1.5], [100, 200, 300], LinearQuantizer(0.5, 1.0))
+        self.assertEquals(1, model.userValues.itemsize)
+        self.assertEquals([(10, 2.5), (20, 4.0)], model.PreferencesFromUser(1))
+        self.assertEquals([(1, 2.5), (2, 1.5)], model.PreferencesForItem(10))
+        self.assertEquals([(20, 4.0)], model.PreferencesFromUserSince(1, 150))
+        self.assertEquals([(2, 1.5)],
+                model.timeSlice(250).PreferencesForItem(10))
+        self.assertRaises(ValueError, MatrixDataModel.fromArrays, [1], [10],
+                          [0.5], None, LinearQuantizer(0.5, 1.0))
+
+
+class TestBooleanModel(unittest.TestCase):
+
+    def setUp(self):
+        # CLICKS.
+        self.clicks = {
+                'Marcel Caraciolo': ['Lady in the Water', 'Snakes on a Plane',
+                    'Just My Luck', 'Superman Returns'],
+                'Luciana Nunes': set(['Snakes on a Plane', 'Just My Luck']),
+                'Penny Frewman': ['Superman Returns'],
+                'Maria Gabriela': []}
+
+    def test_create_BooleanModel(self):
+        model = BooleanDataModel(self.clicks)
+        self.assertEquals(False, model.hasPreferenceValues())
+        self.assertEquals(['Luciana Nunes', 'Marcel Caraciolo',
+                           'Maria Gabriela', 'Penny Frewman'], model.UserIDs())
+        self.assertEquals(['Just My Luck', 'Lady in the Water',
+                           'Snakes on a Plane', 'Superman Returns'],
+                          model.ItemIDs())
+        self.assertEquals(None, model.userValues)
+        self.assertEquals(1.0, model.MaxPreference())
+        self.assertEquals(1.0, model.MinPreference())
+
+    def test_Preferences_BooleanModel(self):
+        model = BooleanDataModel(self.clicks)
+        self.assertEquals([('Just My Luck', 1.0), ('Snakes on a Plane', 1.0)],
+                          model.PreferencesFromUser('Luciana Nunes'))
+        self.assertEquals([('Marcel Caraciolo', 1.0), ('Penny Frewman', 1.0)],
+                          model.PreferencesForItem('Superman Returns'))
+        self.assertEquals([], model.PreferencesFromUser('Maria Gabriela'))
+        self.assertEquals(1.0, model.PreferenceValue('Penny Frewman',
+                                                     'Superman Returns'))
+        self.assertEquals(None, model.PreferenceValue('Penny Frewman',
+                                                      'Just My Luck'))
+        self.assertRaises(ValueError, model.PreferencesFromUser, 'Flavia')
+
+    def test_from_DictModel_data_BooleanModel(self):
+        movies = {'Marcel Caraciolo': {'Lady in the Water': 2.5,
+                                       'Snakes on a Plane': 3.5},
+                  'Penny Frewman': {'Snakes on a Plane': 4.5}}
+        model = BooleanDataModel(movies)
+        self.assertEquals((2, 1, 1),
+                model.UserOverlap('Marcel Caraciolo', 'Penny Frewman'))
+        self.assertEquals(2,
+                model.NumUsersWithPreferenceFor('Snakes on a Plane'))
+
+    def test_empty_BooleanModel(self):
+        model = BooleanDataModel({})
+        self.assertEquals([], model.UserIDs())
+        self.assertEquals(None, model.MaxPreference())
+
+    def test_stats_BooleanModel(self):
+        model = BooleanDataModel(self.clicks)
+        self.assertEquals(PreferenceStats(2, 2.0, 2.0),
+                          model.UserStats('Luciana Nunes'))
+        self.assertEquals(PreferenceStats(2, 2.0, 2.0),
+                          model.ItemStats('Superman Returns'))
+
+
+class TestMaskedDataModel(unittest.TestCase):
+
+    def setUp(self):
+        # SIMILARITY BY RATES.
+        self.movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+    def test_hidden_preferences_MaskedDataModel(self):
+        model = MaskedDataModel(DictDataModel(self.movies),
+                {'Penny Frewman': set(['You, Me and Dupree']),
+                 'Leopoldo Pires': {'Lady in the Water': 2.5}})
+        self.assertEquals(8, model.NumUsers())
+        self.assertEquals(6, model.NumItems())
+        self.assertEquals([('Snakes on a Plane', 4.5),
+                           ('Superman Returns', 4.0)],
+                          model.PreferencesFromUser('Penny Frewman'))
+        self.assertEquals(None, model.PreferenceValue('Penny Frewman',
+                                                      'You, Me and Dupree'))
+        self.assertEquals(3.5, model.PreferenceValue('Sheldom',
+                                                     'You, Me and Dupree'))
+        self.assertEquals(['Lorena Abreu', 'Luciana Nunes', 'Marcel Caraciolo',
+                           'Sheldom', 'Steve Gates'],
+                          [userID for userID, value in
+                           model.PreferencesForItem('You, Me and Dupree')])
+        self.assertEquals(4, model.NumUsersWithPreferenceFor(
+                    'Lady in the Water', 'Snakes on a Plane'))
+        self.assertEquals(7, model.NumUsersWithPreferenceFor(
+                    'Superman Returns'))
+
+    def test_stats_MaskedDataModel(self):
+        model = MaskedDataModel(DictDataModel(self.movies),
+                {'Penny Frewman': set(['You, Me and Dupree'])})
+        self.assertEquals(PreferenceStats(2, 8.5, 36.25),
+                          model.UserStats('Penny Frewman'))
+        self.assertEquals(PreferenceStats(5, 14.0, 41.0),
+                          model.ItemStats('You, Me and Dupree'))
+        self.assertEquals(PreferenceStats(7, 28.0, 115.5),
+                          model.ItemStats('Superman Returns'))
+
+    def test_removed_users_and_items_MaskedDataModel(self):
+        self.movies['Flavia'] = {'Back to the Future': 4.0}
+        model = MaskedDataModel(DictDataModel(self.movies),
+                {'Flavia': ['Back to the Future']})
+        self.assert_('Flavia' not in model.UserIDs())
+        self.assert_('Maria Gabriela' in model.UserIDs())
+        self.assert_('Back to the Future' not in model.ItemIDs())
+        self.assertRaises(ValueError, model.PreferencesFromUser, 'Flavia')
+        self.assertRaises(ValueError, model.PreferencesForItem,
+                          'Back to the Future')
+
+    def test_restricted_users_MaskedDataModel(self):
+        model = MaskedDataModel(MatrixDataModel(self.movies),
+                {'Penny Frewman': set(['Snakes on a Plane'])},
+                ['Penny Frewman', 'Leopoldo Pires'])
+        self.assertEquals(['Leopoldo Pires', 'Penny Frewman'], model.UserIDs())
+        self.assertEquals(['Lady in the Water', 'Snakes on a Plane',
+                           'Superman Returns', 'The Night Listener',
+                           'You, Me and Dupree'], model.ItemIDs())
+        self.assertEquals([('Leopoldo Pires', 3.0)],
+                          model.PreferencesForItem('Snakes on a Plane'))
+        self.assertRaises(ValueError, model.PreferencesFromUser, 'Sheldom')
+        self.assertEquals([('Leopoldo Pires', 3.5), ('Penny Frewman', 4.0)],
+                          model.PreferencesForItem('Superman Returns'))
+
+
+class TestReloadableDataModel(unittest.TestCase):
+
+    def setUp(self):
+        # SIMILARITY BY RATES.
+        self.movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+    def test_reload_ReloadableDataModel(self):
+        loads = []
+
+        def loader():
+            loads.append(len(loads))
+            return DictDataModel(dict(self.movies))
+
+        model = ReloadableDataModel(loader)
+        self.assertEquals(1, len(loads))
+        first = model.model
+        self.assertEquals(8, model.NumUsers())
+        self.assertEquals(DictDataModel(self.movies).PreferencesFromUser(
+                    'Penny Frewman'), model.PreferencesFromUser('Penny Frewman'))
+
+        self.movies['Flavia'] = {'Pulp Fiction': 4.0}
+        model.refresh()
+        self.assertEquals(2, len(loads))
+        self.assert_(model.model is not first)
+        self.assertEquals(9, model.NumUsers())
+        self.assertEquals([('Flavia', 4.0)],
+                          model.PreferencesForItem('Pulp Fiction'))
+
+    def test_pin_ReloadableDataModel(self):
+        model = ReloadableDataModel(lambda: DictDataModel(dict(self.movies)))
+        with model.pin():
+            self.movies['Flavia'] = {'Pulp Fiction': 4.0}
+            model.refreshInBackground().join()
+            with model.pin():
+                self.assertEquals(8, model.NumUsers())
+            self.assertEquals(8, model.NumUsers())
+            self.assertEquals(8, len([pref for pref in model]))
+        self.assertEquals(9, model.NumUsers())
+
+        masked = MaskedDataModel(model, {'Flavia': set(['Pulp Fiction'])})
+        self.assertEquals([model], masked.dependencies())
+        with masked.pin():
+            model.reload()
+            self.assertEquals(9, model.NumUsers())
+
+
+class TestPlusAnonymousUserDataModel(unittest.TestCase):
+
+    def setUp(self):
+        # SIMILARITY BY RATES.
+        self.movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+    def test_session_user_PlusAnonymousUserDataModel(self):
+        model = PlusAnonymousUserDataModel(DictDataModel(self.movies))
+        model.setSessionUser('Visitor', {'Snakes on a Plane': 5.0,
+                                         'Pulp Fiction': 4.0})
+        self.assertEquals(9, model.NumUsers())
+        self.assertEquals(7, model.NumItems())
+        self.assert_('Visitor' in model.UserIDs())
+        self.assertEquals([('Pulp Fiction', 4.0), ('Snakes on a Plane', 5.0)],
+                          model.PreferencesFromUser('Visitor'))
+        self.assertEquals([('Snakes on a Plane', 5.0), ('Pulp Fiction', 4.0)],
+                          model.PreferencesFromUser('Visitor', False))
+        self.assertEquals(5.0, model.PreferenceValue('Visitor',
+                                                     'Snakes on a Plane'))
+        self.assertEquals(None, model.PreferenceValue('Visitor',
+                                                      'Superman Returns'))
+        self.assertEquals([('Visitor', 4.0)],
+                          model.PreferencesForItem('Pulp Fiction'))
+        self.assertEquals(('Visitor', 5.0),
+                          model.PreferencesForItem('Snakes on a Plane')[-1])
+        self.assertEquals(8, model.NumUsersWithPreferenceFor(
+                    'Snakes on a Plane'))
+        self.assertEquals(1, model.NumUsersWithPreferenceFor(
+                    'Snakes on a Plane', 'Pulp Fiction'))
+        self.assertEquals(4.5, model.PreferencesFromUser('Penny Frewman')[0][1])
+        self.assertEquals(8, model.model.NumUsers())
+
+    def test_merged_ids_PlusAnonymousUserDataModel(self):
+        base = DictDataModel(self.movies)
+        model = PlusAnonymousUserDataModel(base)
+        model.setSessionUser('Visitor', {'Pulp Fiction': 4.0})
+        userIDs = model.UserIDs()
+        self.assertEquals(sorted(self.movies.keys() + ['Visitor']), userIDs)
+        # Merged once, until the session or the model changes.
+        self.assert_(userIDs is model.UserIDs())
+        self.assert_(model.ItemIDs() is model.ItemIDs())
+        model.setSessionUser('Another', {'Just My Luck': 1.0})
+        self.assert_('Another' in model.UserIDs())
+        self.assertEquals(7, model.NumItems())
+        base.setPreference('Newcomer', 'Jaws', 3.0)
+        self.assert_('Newcomer' in model.UserIDs())
+        self.assert_('Jaws' in model.ItemIDs())
+        model.removeSessionUser('Another')
+        model.removeSessionUser('Visitor')
+        self.assert_(base.UserIDs() is model.UserIDs())
+
+    def test_merged_ids_model_changed_PlusAnonymousUserDataModel(self):
+        base = DictDataModel(self.movies)
+        model = PlusAnonymousUserDataModel(base)
+        model.setSessionUser('Visitor', {'Pulp Fiction': 4.0})
+        self.assert_('Just My Luck' in model.ItemIDs())
+        # The model changes its item IDs in place, keeping their number.
+        for userID in base.UserIDs():
+            if base.PreferenceValue(userID, 'Just My Luck') is not None:
+                base.removePreference(userID, 'Just My Luck')
+        base.setPreference('Sheldom', 'Jaws', 3.0)
+        self.assertFalse('Just My Luck' in model.ItemIDs())
+        self.assert_('Jaws' in model.ItemIDs())
+        self.assertEquals(sorted(base.ItemIDs() + ['Pulp Fiction']),
+                          model.ItemIDs())
+
+    def test_stats_PlusAnonymousUserDataModel(self):
+        model = PlusAnonymousUserDataModel(DictDataModel(self.movies))
+        model.setSessionUser('Visitor', {'Superman Returns': 1.0,
+                                         'Pulp Fiction': 4.0})
+        self.assertEquals(PreferenceStats(2, 5.0, 17.0),
+                          model.UserStats('Visitor'))
+        self.assertEquals(PreferenceStats(8, 29.0, 116.5),
+                          model.ItemStats('Superman Returns'))
+        self.assertEquals(PreferenceStats(1, 4.0, 16.0),
+                          model.ItemStats('Pulp Fiction'))
+        self.assertEquals(PreferenceStats(3, 9.5, 37.25),
+                          model.UserStats('Penny Frewman'))
+
+    def test_remove_session_user_PlusAnonymousUserDataModel(self):
+        base = DictDataModel(self.movies)
+        model = PlusAnonymousUserDataModel(base)
+        changed = []
+        model.addPreferenceListener(
+                lambda userID, itemID: changed.append((userID, itemID)))
+        model.setSessionUser('Visitor', {'Pulp Fiction': 4.0})
+        model.setSessionUser('Visitor', {'Just My Luck': 2.0})
+        self.assertEquals(['Visitor'], model.sessionUserIDs())
+        self.assertEquals(6, model.NumItems())
+        self.assertRaises(ValueError, model.PreferencesForItem, 'Pulp Fiction')
+        model.removeSessionUser('Visitor')
+        self.assertEquals(base.UserIDs(), model.UserIDs())
+        self.assertEquals(base.PreferencesForItem('Just My Luck'),
+                          model.PreferencesForItem('Just My Luck'))
+        self.assertRaises(ValueError, model.PreferencesFromUser, 'Visitor')
+        self.assertEquals([('Visitor', 'Just My Luck'),
+                           ('Visitor', 'Just My Luck'),
+                           ('Visitor', 'Pulp Fiction'),
+                           ('Visitor', 'Pulp Fiction')], sorted(changed))
+        self.assertRaises(ValueError, model.setSessionUser, 'Sheldom',
+                          {'Just My Luck': 2.0})
+
+    def test_concurrent_session_users_PlusAnonymousUserDataModel(self):
+        model = PlusAnonymousUserDataModel(DictDataModel(self.movies))
+        errors = []
+
+        def visit(userID):
+            try:
+                for i in range(50):
+                    model.setSessionUser(userID, {'Just My Luck': 1.0 + i % 4})
+                    if model.PreferencesFromUser(userID) != \
+                            [('Just My Luck', 1.0 + i % 4)]:
+                        errors.append(userID)
+                    model.removeSessionUser(userID)
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=visit, args=('Visitor %d' % i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals([], errors)
+        self.assertEquals([], model.sessionUserIDs())
+        self.assertEquals(8, model.NumUsers())
+
+
+class TestIDMigrator(unittest.TestCase):
+
+    def setUp(self):
+        # SIMILARITY BY RATES.
+        self.movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+    def test_IDMigrator(self):
+        migrator = IDMigrator(['Superman Returns'])
+        self.assertEquals(0, migrator.toLongID('Superman Returns'))
+        self.assertEquals(1, migrator.toLongID('Just My Luck'))
+        self.assertEquals(0, migrator.toLongID('Superman Returns'))
+        self.assertEquals(2, len(migrator))
+        self.assert_('Just My Luck' in migrator)
+        self.assertEquals('Just My Luck', migrator.toStringID(1))
+        self.assertEquals(['Just My Luck', 'Superman Returns'],
+                          migrator.toStringIDs([1, 0]))
+        self.assertRaises(ValueError, migrator.toStringID, 2)
+
+    def test_migrated_DictModel(self):
+        userMigrator = IDMigrator()
+        itemMigrator = IDMigrator()
+        model = DictDataModel(migratePreferences(self.movies, userMigrator,
+                                                 itemMigrator))
+        self.assertRaises(NotImplementedError, model.convertUserID2name, 0)
+        model.setIDMigrators(userMigrator, itemMigrator)
+
+        self.assertEquals(range(8), model.UserIDs())
+        self.assertEquals(range(6), model.ItemIDs())
+        penny = userMigrator.toLongID('Penny Frewman')
+        superman = itemMigrator.toLongID('Superman Returns')
+        self.assertEquals(4.0, model.PreferenceValue(penny, superman))
+        self.assertEquals('Penny Frewman', model.convertUserID2name(penny))
+        self.assertEquals('Superman Returns',
+                          model.convertItemID2name(superman))
+        self.assertEquals(sorted(self.movies['Penny Frewman'].items()),
+                sorted([(model.convertItemID2name(itemID), value)
+                        for itemID, value in model.PreferencesFromUser(penny)]))
+
+    def test_migrated_FileDataModel(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'ratings.csv')
+            open(path, 'wb').write('a9f0c1,item-b,2.5\n'
+                                   'a9f0c1,item-a,3.0\n'
+                                   '77d2e4,item-b,4.0\n')
+            model = FileDataModel(path, userIDMigrator=IDMigrator(),
+                                  itemIDMigrator=IDMigrator())
+        finally:
+            shutil.rmtree(directory)
+        self.assertEquals([0, 1], model.UserIDs())
+        self.assertEquals([(0, 2.5), (1, 3.0)], model.PreferencesFromUser(0))
+        self.assertEquals('77d2e4', model.convertUserID2name(1))
+        self.assertEquals('item-a', model.convertItemID2name(1))
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        # SIMILARITY BY RATES.
+        self.movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'movies.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_save_load_DictModel(self):
+        model = DictDataModel(self.movies)
+        saveModel(model, self.path)
+        loaded = loadModel(self.path)
+        self.assertEquals(model.UserIDs(), loaded.UserIDs())
+        self.assertEquals(model.ItemIDs(), loaded.ItemIDs())
+        self.assertEquals([pref for pref in model], [pref for pref in loaded])
+        for itemID in model.ItemIDs():
+            self.assertEquals(model.PreferencesForItem(itemID),
+                              loaded.PreferencesForItem(itemID))
+        self.assertEquals(5.0, loaded.MaxPreference())
+        self.assertEquals(1.0, loaded.MinPreference())
+        self.assertEquals(3.5,
+                loaded.PreferenceValue('Marcel Caraciolo', 'Superman Returns'))
+        self.assertEquals(None,
+                loaded.PreferenceValue('Leopoldo Pires', 'Just My Luck'))
+        self.assertEquals(4, loaded.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck'))
+
+    def test_loaded_model_is_memory_mapped(self):
+        saveModel(MatrixDataModel(self.movies), self.path)
+        loaded = loadModel(self.path)
+        self.assertEquals(False, loaded.userValues.flags.writeable)
+        self.assertEquals(False, loaded.userValues.flags.owndata)
+
+    def test_save_load_timestamps(self):
+        timestamps = {'Penny Frewman': {'Snakes on a Plane': 100,
+                                        'Superman Returns': 300}}
+        saveModel(DictDataModel(self.movies, timestamps), self.path)
+        loaded = loadModel(self.path)
+        self.assertEquals(300.0,
+                loaded.PreferenceTime('Penny Frewman', 'Superman Returns'))
+        self.assertEquals([('Superman Returns', 4.0)],
+                loaded.PreferencesFromUserSince('Penny Frewman', 200))
+
+    def test_save_load_BooleanModel(self):
+        model = BooleanDataModel(self.movies)
+        saveModel(model, self.path)
+        loaded = loadModel(self.path)
+        self.assert_(isinstance(loaded, BooleanDataModel))
+        self.assertEquals([pref for pref in model], [pref for pref in loaded])
+        self.assertEquals(None, loaded.userTimes)
+
+    def test_save_load_quantized_model(self):
+        model = MatrixDataModel(self.movies, quantizer=LinearQuantizer(0.5))
+        saveModel(model, self.path)
+        loaded = loadModel(self.path)
+        self.assertEquals(1, loaded.userValues.itemsize)
+        self.assertEquals(0.5, loaded.quantizer.step)
+        self.assertEquals([pref for pref in model], [pref for pref in loaded])
+        self.assertEquals(3.5,
+                loaded.PreferenceValue('Marcel Caraciolo', 'Superman Returns'))
+
+    def test_save_load_empty_model(self):
+        saveModel(DictDataModel({}), self.path)
+        loaded = loadModel(self.path)
+        self.assertEquals([], loaded.UserIDs())
+        self.assertEquals(0, loaded.NumItems())
+
+    def test_quantizer_saved_by_name(self):
+        saveModel(MatrixDataModel(self.movies,
+                                  quantizer=LinearQuantizer(0.5, 1.0)),
+                  self.path)
+        arrays, metadata = readArrays(self.path)
+        self.assertEquals(('LinearQuantizer', {'step': 0.5, 'offset': 1.0}),
+                          metadata['quantizer'])
+        self.assertEquals(1.0, loadModel(self.path).quantizer.offset)
+
+    def test_loaded_ids_are_memory_mapped(self):
+        saveModel(MatrixDataModel(self.movies), self.path)
+        loaded = loadModel(self.path)
+        self.assertEquals(False, loaded.userIDs.array.flags.owndata)
+        self.assertEquals(sorted(self.movies), loaded.UserIDs())
+        self.assertEquals('Lorena Abreu', loaded.UserIDs()[1])
+        self.assertTrue('Sheldom' in loaded.userIndex)
+        self.assertFalse('Shel' in loaded.userIndex)
+        self.assertFalse(3 in loaded.itemIndex)
+        self.assertRaises(ValueError, loaded.PreferencesFromUser, 'Shel')
+        self.assertEquals(4, loaded.NumUsersWithPreferenceFor('Just My Luck'))
+
+        saveModel(MatrixDataModel({1: {10: 1.0, 20: 2.0}, 3: {20: 4.0}}),
+                  self.path)
+        loaded = loadModel(self.path)
+        self.assertEquals([(10, 1.0), (20, 2.0)],
+                          loaded.PreferencesFromUser(1))
+        self.assertEquals(int, type(loaded.UserIDs()[0]))
+        self.assertFalse('1' in loaded.userIndex)
+
+    def test_mixed_ids_are_pickled(self):
+        saveModel(MatrixDataModel({1: {'a': 1.0}, 'b': {2: 2.0}}), self.path)
+        arrays, metadata = readArrays(self.path)
+        self.assertFalse('userIDs' in arrays)
+        loaded = loadModel(self.path)
+        self.assertEquals([(2, 2.0)], loaded.PreferencesFromUser('b'))
+        self.assertEquals([(1, 1.0)], loaded.PreferencesForItem('a'))
+
+    def test_invalid_snapshot(self):
+        open(self.path, 'wb').write('not a snapshot at all, sorry')
+        self.assertRaises(ValueError, loadModel, self.path)
+
+
+class TestJournaledDataModel(unittest.TestCase):
+
+    def setUp(self):
+        # SIMILARITY BY RATES.
+        self.movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameModel(self, expected, model):
+        self.assertEquals(expected.UserIDs(), model.UserIDs())
+        self.assertEquals(expected.ItemIDs(), model.ItemIDs())
+        self.assertEquals([pref for pref in expected],
+                          [pref for pref in model])
+        for itemID in expected.ItemIDs():
+            self.assertEquals(list(expected.PreferencesForItem(itemID)),
+                              model.PreferencesForItem(itemID))
+
+    def changeModels(self, models):
+        for model in models:
+            model.setPreference('Penny Frewman', 'Just My Luck', 2.0, 500)
+            model.setPreference('Flavia', 'Pulp Fiction', 4.5, 600)
+            model.setPreference('Sheldom', 'Superman Returns', 1.0)
+            model.removePreference('Penny Frewman', 'Superman Returns')
+            model.removePreference('Luciana Nunes', 'Just My Luck')
+
+    def test_changes_JournaledDataModel(self):
+        expected = DictDataModel(self.movies)
+        model = JournaledDataModel(self.path, DictDataModel(self.movies))
+        self.changeModels([expected, model])
+        self.assertSameModel(expected, model)
+        self.assertEquals(2.0, model.PreferenceValue('Penny Frewman',
+                                                     'Just My Luck'))
+        self.assertEquals(None, model.PreferenceValue('Penny Frewman',
+                                                      'Superman Returns'))
+        self.assertEquals(500, model.PreferenceTime('Penny Frewman',
+                                                    'Just My Luck'))
+        self.assertEquals([('Flavia', 4.5)],
+                          model.PreferencesForItemSince('Pulp Fiction', 550))
+        self.assertEquals(3, model.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck'))
+        self.assertEquals(9, model.NumUsers())
+        self.assertEquals(7, model.NumItems())
+        self.assertEquals(5.0, model.MaxPreference())
+        self.assertEquals(1.0, model.MinPreference())
+        self.assertRaises(ValueError, model.PreferencesFromUser, 'Carla')
+        self.assertRaises(ValueError, model.removePreference, 'Carla',
+                          'Pulp Fiction')
+        model.close()
+
+    def test_recover_JournaledDataModel(self):
+        expected = DictDataModel(self.movies)
+        model = JournaledDataModel(self.path, DictDataModel(self.movies))
+        self.changeModels([expected, model])
+        model.close()
+
+        # A record torn by a crash is dropped.
+        journal = open(os.path.join(self.path, 'journal-00000000.log'), 'ab')
+        journal.write('\x40\x00\x00\x00torn')
+        journal.close()
+
+        recovered = JournaledDataModel(self.path)
+        self.assertSameModel(expected, recovered)
+        self.assertEquals(500, recovered.PreferenceTime('Penny Frewman',
+                                                        'Just My Luck'))
+        recovered.setPreference('Flavia', 'Just My Luck', 3.0)
+        recovered.close()
+        self.assertEquals(3.0, JournaledDataModel(self.path).PreferenceValue(
+                    'Flavia', 'Just My Luck'))
+
+    def test_compact_JournaledDataModel(self):
+        expected = DictDataModel(self.movies)
+        model = JournaledDataModel(self.path, DictDataModel(self.movies))
+        self.changeModels([expected, model])
+        model.compact()
+        self.assertEquals(1, model.generation)
+        self.assertEquals(['base-00000001.snapshot', 'journal-00000001.log'],
+                          sorted(os.listdir(self.path)))
+        self.assertEquals([], [delta for delta in model._deltas
+                               if delta.size])
+        expected.dataU.pop('Maria Gabriela')
+        expected.buildModel()
+        self.assertSameModel(expected, model)
+        self.assertEquals(500, model.PreferenceTime('Penny Frewman',
+                                                    'Just My Luck'))
+
+        expected.setPreference('Carla', 'Lady in the Water', 3.0)
+        model.setPreference('Carla', 'Lady in the Water', 3.0)
+        model.close()
+        self.assertSameModel(expected, JournaledDataModel(self.path))
+
+    def test_compact_mixed_ids_JournaledDataModel(self):
+        expected = DictDataModel({5: {'Jaws': 3.0, 7: 2.0},
+                                  'Carla': {7: 4.0}})
+        model = JournaledDataModel(self.path, DictDataModel(
+                {5: {'Jaws': 3.0, 7: 2.0}, 'Carla': {7: 4.0}}))
+        for changed in (expected, model):
+            changed.setPreference(9, 'Jaws', 1.0)
+            changed.setPreference('Carla', 8, 2.5)
+        model.compact()
+        self.assertEquals([5, 9, 'Carla'], model.UserIDs())
+        self.assertEquals([7, 8, 'Jaws'], model.ItemIDs())
+        self.assertSameModel(expected, model)
+        model.close()
+        self.assertSameModel(expected, JournaledDataModel(self.path))
+
+    def test_background_compaction_JournaledDataModel(self):
+        expected = DictDataModel(self.movies)
+        model = JournaledDataModel(self.path, DictDataModel(self.movies),
+                                   compactionThreshold=3)
+        self.changeModels([expected, model])
+        for index in range(20):
+            value = 1.0 + index % 5
+            expected.setPreference('Carla', 'Movie %d' % index, value)
+            model.setPreference('Carla', 'Movie %d' % index, value)
+        model.waitForCompaction()
+        model.compact()
+        self.assert_(model.generation >= 1)
+        expected.dataU.pop('Maria Gabriela')
+        expected.buildModel()
+        self.assertSameModel(expected, model)
+        model.close()
+        self.assertSameModel(expected, JournaledDataModel(self.path))
+
+
+class TestFileDataModel(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.ratings = [('1', '10', '2.5'), ('1', '20', '3.5'),
+                        ('2', '10', '3.0'), ('2', '30', '1.5'),
+                        ('3', '20', '4.0'), ('3', '30', '5.0'),
+                        ('10', '10', '1.0')]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeRatings(self, name, delimiter, header=None, opener=open):
+        path = os.path.join(self.directory, name)
+        ratingFile = opener(path, 'wb')
+        if header:
+            ratingFile.write(header + '\n')
+        for index, rating in enumerate(self.ratings):
+            ratingFile.write(delimiter.join(rating + (str(index),)) + '\n')
+        ratingFile.close()
+        return path
+
+    def test_csv_FileDataModel(self):
+        path = self.writeRatings('ratings.csv', ',',
+                                 'userId,movieId,rating,timestamp')
+        model = FileDataModel(path)
+        self.assertEquals([1, 2, 3, 10], model.UserIDs())
+        self.assertEquals([10, 20, 30], model.ItemIDs())
+        self.assertEquals([(10, 2.5), (20, 3.5)], model.PreferencesFromUser(1))
+        self.assertEquals([(1, 2.5), (2, 3.0), (10, 1.0)],
+                          model.PreferencesForItem(10))
+        self.assertEquals(5.0, model.MaxPreference())
+        self.assertEquals(1.0, model.MinPreference())
+        self.assertEquals(7, model.loadStats['ratings'])
+        # Compressed by numpy passes over the parsed buffers.
+        self.assertEquals('int32', str(model.userItems.dtype))
+        self.assert_(model.loadStats['ratingsPerSecond'] >= 0.0)
+        self.assertEquals(3.0, model.PreferenceTime(2, 30))
+        self.assertEquals([(20, 4.0), (30, 5.0)],
+                          model.PreferencesFromUserSince(3, 4))
+
+    def test_compressed_FileDataModel(self):
+        tsv = FileDataModel(self.writeRatings('u.data.gz', '\t',
+                                              opener=gzip.open))
+        movieLens = FileDataModel(self.writeRatings('ratings.dat.bz2', '::',
+                                                    opener=bz2.BZ2File))
+        self.assertEquals([pref for pref in tsv], [pref for pref in movieLens])
+        self.assertEquals(3.0, tsv.PreferenceValue(2, 10))
+
+    def test_string_ids_FileDataModel(self):
+        self.ratings.append(('Marcel', '10', '4.0'))
+        self.ratings.append(('1', '10', '3.0'))
+        model = FileDataModel(self.writeRatings('ratings.tsv', '\t'),
+                              idType=str, chunkSize=16)
+        self.assertEquals(['1', '10', '2', '3', 'Marcel'], model.UserIDs())
+        self.assertEquals(3.0, model.PreferenceValue('1', '10'))
+        self.assertEquals(4, model.NumUsersWithPreferenceFor('10'))
+        self.assertEquals(7.0, model.PreferenceTime('Marcel', '10'))
+
+    def test_no_timestamps_FileDataModel(self):
+        path = os.path.join(self.directory, 'ratings.csv')
+        open(path, 'wb').write('1,10,2.5\n2,10,3.0\n')
+        model = FileDataModel(path)
+        self.assertEquals(None, model.userTimes)
+        self.assertEquals(None, model.PreferenceTime(1, 10))
+
+    def test_malformed_FileDataModel(self):
+        self.ratings.append(('4', '10', 'good'))
+        self.assertRaises(ValueError, FileDataModel,
+                          self.writeRatings('ratings.csv', ','))
+
+
+    def test_invalid_id_FileDataModel(self):
+        path = os.path.join(self.directory, 'ratings.csv')
+        open(path, 'wb').write('1,10,2.5\n2,10,3.0\nMarcel,10,4.0\n')
+        try:
+            FileDataModel(path)
+            self.fail('ValueError not raised')
+        except ValueError, e:
+            self.assert_('line 3 in %s' % path in str(e))
+        model = FileDataModel(path, idType=str)
+        self.assertEquals(['1', '2', 'Marcel'], model.UserIDs())
+
+class TestSQLiteDataModel(unittest.TestCase):
+
+    def setUp(self):
+        # SIMILARITY BY RATES.
+        self.movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+        self.directory = tempfile.mkdtemp()
+        self.model = SQLiteDataModel(
+                os.path.join(self.directory, 'movies.db'), cacheSize=3)
+        self.model.addPreferences(self.movies)
+        self.dictModel = DictDataModel(self.movies)
+
+    def tearDown(self):
+        self.model.close()
+        shutil.rmtree(self.directory)
+
+    def test_IDs_SQLiteDataModel(self):
+        # Users without preferences are not stored in the table.
+        self.assertEquals([userID for userID in self.dictModel.UserIDs()
+                           if userID != 'Maria Gabriela'],
+                          self.model.UserIDs())
+        self.assertEquals(self.dictModel.ItemIDs(), self.model.ItemIDs())
+        self.assertEquals(7, self.model.NumUsers())
+        self.assertEquals(6, self.model.NumItems())
+
+    def test_Preferences_SQLiteDataModel(self):
+        for userID in self.model.UserIDs():
+            self.assertEquals(self.dictModel.PreferencesFromUser(userID),
+                              self.model.PreferencesFromUser(userID))
+        for itemID in self.model.ItemIDs():
+            self.assertEquals(self.dictModel.PreferencesForItem(itemID),
+                              self.model.PreferencesForItem(itemID))
+        self.assertEquals([('The Night Listener', 4.5),
+                           ('Superman Returns', 4.0),
+                           ('Snakes on a Plane', 3.5),
+                           ('Just My Luck', 3.0),
+                           ('You, Me and Dupree', 2.5)],
+                self.model.PreferencesFromUser('Lorena Abreu', orderByID=False))
+        self.assertRaises(ValueError, self.model.PreferencesFromUser, 'Flavia')
+        self.assertRaises(ValueError, self.model.PreferencesForItem,
+                          'Back to the Future')
+        self.assert_(len(self.model._userCache) <= 3)
+
+    def test_PreferencesFromUsers_SQLiteDataModel(self):
+        prefs = self.model.PreferencesFromUsers(
+                ['Lorena Abreu', 'Penny Frewman', 'Flavia'])
+        self.assertEquals(['Lorena Abreu', 'Penny Frewman'], sorted(prefs))
+        self.assertEquals(self.dictModel.PreferencesFromUser('Penny Frewman'),
+                          prefs['Penny Frewman'])
+
+    def test_PreferenceValue_SQLiteDataModel(self):
+        self.assertEquals(3.5, self.model.PreferenceValue('Marcel Caraciolo',
+                                                          'Superman Returns'))
+        self.model.PreferencesFromUser('Marcel Caraciolo')
+        self.assertEquals(3.5, self.model.PreferenceValue('Marcel Caraciolo',
+                                                          'Superman Returns'))
+        self.assertEquals(None, self.model.PreferenceValue('Leopoldo Pires',
+                                                           'Just My Luck'))
+
+    def test_NumUsersWithPreferenceFor_SQLiteDataModel(self):
+        self.assertEquals(7, self.model.NumUsersWithPreferenceFor(
+                    'Superman Returns'))
+        self.assertEquals(4, self.model.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck'))
+        self.assertEquals(3, self.model.NumUsersWithPreferenceFor(
+                    'Superman Returns', 'Just My Luck', 'Lady in the Water'))
+        self.assertRaises(ValueError, self.model.NumUsersWithPreferenceFor)
+        self.assertRaises(ValueError, self.model.NumUsersWithPreferenceFor,
+                          'Superman Returns', 'Back to the Future')
+
+    def test_stale_rows_not_cached_SQLiteDataModel(self):
+        fetchRows = self.model._fetchRows
+
+        def fetchThenWrite(keyColumn, otherColumn, keys):
+            # A write lands between the fetch and the caching of the rows.
+            rows = fetchRows(keyColumn, otherColumn, keys)
+            self.model.setPreference('Penny Frewman', 'Just My Luck', 5.0)
+            return rows
+
+        self.model._fetchRows = fetchThenWrite
+        self.assertEquals(3, len(self.model.PreferencesFromUser(
+                    'Penny Frewman')))
+        self.model._fetchRows = fetchRows
+        self.assertEquals(0, len(self.model._userCache))
+        self.assertEquals(4, len(self.model.PreferencesFromUser(
+                    'Penny Frewman')))
+
+    def test_set_remove_SQLiteDataModel(self):
+        self.assertEquals(5.0, self.model.MaxPreference())
+        self.model.PreferencesFromUser('Penny Frewman')
+        self.model.setPreference('Penny Frewman', 'Just My Luck', 5.5)
+        self.assertEquals(5.5, self.model.MaxPreference())
+        self.assertEquals(5.5, self.model.PreferenceValue('Penny Frewman',
+                                                          'Just My Luck'))
+        self.model.removePreference('Penny Frewman', 'You, Me and Dupree')
+        self.assertEquals(1.5, self.model.MinPreference())
+        self.assertEquals([('Just My Luck', 5.5), ('Snakes on a Plane', 4.5),
+                           ('Superman Returns', 4.0)],
+                          self.model.PreferencesFromUser('Penny Frewman'))
+
+    def test_failed_write_SQLiteDataModel(self):
+        model = SQLiteDataModel(os.path.join(self.directory, 'movies.db'),
+                                timeout=0.1)
+        self.assertRaises(sqlite3.IntegrityError, model.addPreferences,
+                          {'Penny Frewman': {'Just My Luck': 2.0,
+                                             'Lady in the Water': None}})
+        # The write goes through another pooled connection.
+        with model.pool.connection():
+            model.setPreference('Penny Frewman', 'Just My Luck', 5.5)
+        self.assertEquals(5.5, model.PreferenceValue('Penny Frewman',
+                                                     'Just My Luck'))
+        self.assertEquals(None, model.PreferenceValue('Penny Frewman',
+                                                      'Lady in the Water'))
+        model.close()
+
+    def test_threads_SQLiteDataModel(self):
+        errors = []
+
+        def read():
+            try:
+                for userID in self.model.UserIDs():
+                    self.model.PreferencesFromUser(userID)
+                    self.model.PreferenceValue(userID, 'Superman Returns')
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals([], errors)
+        self.assert_(self.model.pool._opened <= 4)
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTests(unittest.makeSuite(TestDictModel))
+    suite.addTests(unittest.makeSuite(TestMatrixModel))
+    suite.addTests(unittest.makeSuite(TestBooleanModel))
+    suite.addTests(unittest.makeSuite(TestMaskedDataModel))
+    suite.addTests(unittest.makeSuite(TestReloadableDataModel))
+    suite.addTests(unittest.makeSuite(TestPlusAnonymousUserDataModel))
+    suite.addTests(unittest.makeSuite(TestIDMigrator))
+    suite.addTests(unittest.makeSuite(TestSnapshot))
+    suite.addTests(unittest.makeSuite(TestJournaledDataModel))
+    suite.addTests(unittest.makeSuite(TestFileDataModel))
+    suite.addTests(unittest.makeSuite(TestSQLiteDataModel))
 
     return suite
 
@@ -37,11 +37,26 @@
 
 __author__ = 'marcel@orygens.com'
 
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
+import weakref
 
 from similarities.similarity import *
 from similarities.similarity_distance import *
 from models.datamodel import *
+from models.booleanmodel import BooleanDataModel
+from models.matrixmodel import MatrixDataModel
+from models.quantizers import LinearQuantizer
+from similarities.batch import userSimilarities, itemSimilarities, \
+        supportsBatch
+from similarities.precomputed import PrecomputedItemSimilarity
+from similarities.lsh import MinHashIndex, SimHashIndex, recallReport
+from similarities.cooccurrence import userCooccurrences, \
+        userCooccurrenceSimilarities, itemCooccurrenceSimilarities, COUNT
 
 
 class TestSimilarityDistance(unittest.TestCase):
@@ -393,6 +408,7 @@ class TestUserSimilarity(unittest.TestCase):
                 'Maria Gabriela': {}}
 
         self.model = DictDataModel(movies)
+        self.booleanModel = BooleanDataModel(movies)
 
     # User Basic Similarity
     def test_user_all_similarity(self):
@@ -422,6 +438,61 @@ class TestUserSimilarity(unittest.TestCase):
         self.assertAlmostEquals(0.0,
                 matrix.getSimilarity('Marcel Caraciolo', 'Maria Gabriela'))
 
+    def test_user_overlap_similarity(self):
+        for distance in (sim_tanimoto, sim_jaccard, sim_sorensen):
+            matrix = UserSimilarity(self.model, distance)
+            booleanMatrix = UserSimilarity(self.booleanModel, distance)
+            for user1 in self.model.UserIDs():
+                for user2 in self.model.UserIDs():
+                    self.assertAlmostEquals(
+                            matrix.getSimilarity(user1, user2),
+                            booleanMatrix.getSimilarity(user1, user2))
+
+        matrix = UserSimilarity(self.booleanModel, sim_loglikehood)
+        usr1Prefs = self.model.ItemIDsFromUser('Marcel Caraciolo')
+        usr2Prefs = self.model.ItemIDsFromUser('Penny Frewman')
+        self.assertAlmostEquals(
+                sim_loglikehood(self.model.NumItems(), usr1Prefs, usr2Prefs),
+                matrix.getSimilarity('Marcel Caraciolo', 'Penny Frewman'))
+
+
+    def test_user_iter_similarities(self):
+        matrix = UserSimilarity(self.model, sim_pearson)
+        for blockSize in (1, 3, 256):
+            rows = list(matrix.iterSimilarities(blockSize))
+            self.assertEquals(self.model.UserIDs(),
+                              [userID for userID, sims in rows])
+            for userID, sims in rows:
+                self.assertEquals(matrix[userID], sims)
+
+        matrix = UserSimilarity(self.model, sim_euclidian, 3)
+        for userID, sims in matrix.iterSimilarities(blockSize=2, numBest=3):
+            self.assertEquals(matrix[userID], sims)
+        self.assertEquals([(userID, matrix[userID])
+                           for userID in self.model.UserIDs()], list(matrix))
+
+    def test_user_iter_blocked_similarities(self):
+        calls = []
+
+        def distance(vector1, vector2):
+            calls.append(1)
+            return sim_euclidian(vector1, vector2)
+
+        matrix = UserSimilarity(self.model, distance)
+        rows = matrix.iterSimilarities(blockSize=2)
+        rows.next()
+        # Only the first block of rows is computed and held.
+        self.assertEquals(2 * self.model.NumUsers(), len(calls))
+        for userID, sims in [rows.next()] + list(rows):
+            self.assertEquals(
+                    [(otherID, sim_euclidian(dict(self.model[userID]),
+                                             dict(self.model[otherID])))
+                     for otherID in self.model.UserIDs()], sims)
+
+    def test_user_iter_overlap_similarities(self):
+        matrix = UserSimilarity(self.booleanModel, sim_tanimoto, 2)
+        self.assertEquals([(userID, matrix[userID])
+                           for userID in self.model.UserIDs()], list(matrix))
 
 class TestItemSimilarity(unittest.TestCase):
 
@@ -472,6 +543,7 @@ class TestItemSimilarity(unittest.TestCase):
         'Maria Gabriela': {}}
 
         self.model = DictDataModel(movies)
+        self.booleanModel = BooleanDataModel(movies)
 
     # User Basic Similarity
     def test_item_all_similarity(self):
@@ -501,11 +573,799 @@ class TestItemSimilarity(unittest.TestCase):
         self.assertAlmostEquals(0.97987805999365596,
                 matrix.getSimilarity('Superman Returns', 'Snakes on a Plane'))
 
+    def test_item_overlap_similarity(self):
+        matrix = ItemSimilarity(self.booleanModel, sim_tanimoto, 4)
+        self.assertEquals(
+                [('Snakes on a Plane', 1.0),
+                 ('Superman Returns', 1.0),
+                 ('The Night Listener', 0.8571428571428571),
+                 ('You, Me and Dupree', 0.8571428571428571)],
+                matrix['Superman Returns'])
+        matrix = ItemSimilarity(self.booleanModel, sim_sorensen)
+        self.assertAlmostEquals(0.6666666666666666,
+                matrix.getSimilarity('Just My Luck', 'Lady in the Water'))
+
+
+class TestBatchSimilarity(unittest.TestCase):
+
+    def setUp(self):
+        movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+        self.model = DictDataModel(movies)
+        self.matrixModel = MatrixDataModel(movies)
+        self.quantizedModel = MatrixDataModel(movies,
+                quantizer=LinearQuantizer(0.5))
+        self.booleanModel = BooleanDataModel(movies)
+        self.distances = [sim_euclidian, sim_pearson, sim_manhattan,
+                          sim_cosine, sim_tanimoto, sim_jaccard,
+                          sim_sorensen]
+
+    def assertSameSimilarities(self, expected, sims):
+        self.assertEquals([other for other, sim in expected],
+                          [other for other, sim in sims])
+        for (other, sim), (other, batchSim) in zip(expected, sims):
+            self.assertAlmostEquals(sim, batchSim)
+
+    def test_user_batch_similarities(self):
+        for model in (self.matrixModel, self.quantizedModel):
+            for distance in self.distances:
+                matrix = UserSimilarity(self.model, distance)
+                batchMatrix = UserSimilarity(model, distance)
+                for userID in self.model.UserIDs():
+                    self.assertSameSimilarities(
+                            matrix.getSimilarities(userID),
+                            batchMatrix.getSimilarities(userID))
+
+    def test_item_batch_similarities(self):
+        for model in (self.matrixModel, self.quantizedModel):
+            for distance in self.distances:
+                matrix = ItemSimilarity(self.model, distance)
+                batchMatrix = ItemSimilarity(model, distance)
+                for itemID in self.model.ItemIDs():
+                    self.assertSameSimilarities(
+                            matrix.getSimilarities(itemID),
+                            batchMatrix.getSimilarities(itemID))
+
+    def test_boolean_batch_similarities(self):
+        for distance in (sim_tanimoto, sim_jaccard, sim_sorensen,
+                         sim_loglikehood):
+            matrix = UserSimilarity(self.booleanModel, distance)
+            sims = userSimilarities(self.booleanModel, distance,
+                                    'Marcel Caraciolo')
+            self.assertEquals(self.booleanModel.NumUsers(), len(sims))
+            for userID, sim in zip(self.booleanModel.UserIDs(), sims):
+                self.assertAlmostEquals(
+                        matrix.getSimilarity('Marcel Caraciolo', userID),
+                        sim)
+
+    def test_unsupported_batch_similarities(self):
+        self.assertFalse(supportsBatch(self.model, sim_pearson))
+        self.assertFalse(supportsBatch(self.matrixModel, sim_spearman))
+        self.assertEquals(None, userSimilarities(self.matrixModel,
+                sim_spearman, 'Marcel Caraciolo'))
+        self.assertEquals(None, itemSimilarities(self.model, sim_pearson,
+                'Superman Returns'))
+        self.assertRaises(ValueError, userSimilarities, self.matrixModel,
+                          sim_pearson, 'Unknown')
+
+        matrix = UserSimilarity(self.model, sim_spearman)
+        batchMatrix = UserSimilarity(self.matrixModel, sim_spearman)
+        self.assertSameSimilarities(
+                matrix.getSimilarities('Marcel Caraciolo'),
+                batchMatrix.getSimilarities('Marcel Caraciolo'))
+
+    def test_iter_similarities(self):
+        matrix = ItemSimilarity(self.matrixModel, sim_pearson, 2)
+        self.assertEquals([(itemID, matrix[itemID])
+                           for itemID in self.matrixModel.ItemIDs()],
+                          list(matrix))
+        items = ItemSimilarity(self.model, sim_pearson, 2)
+        for (itemID, sims), (itemID, batchSims) in zip(
+                items.iterSimilarities(blockSize=2, numBest=2),
+                matrix.iterSimilarities(numBest=2)):
+            self.assertSameSimilarities(sims, batchSims)
+
+
+class TestCooccurrenceSimilarity(unittest.TestCase):
+
+    def setUp(self):
+        movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+        self.model = DictDataModel(movies)
+        self.distances = [sim_euclidian, sim_pearson, sim_manhattan,
+                          sim_cosine, sim_tanimoto, sim_jaccard,
+                          sim_sorensen]
+
+    def test_user_cooccurrences(self):
+        pairs = userCooccurrences(self.model, 'Penny Frewman')
+        # Every user but the one without preferences shares an item.
+        self.assertEquals(sorted(userID for userID in self.model.UserIDs()
+                                 if userID != 'Maria Gabriela'),
+                          sorted(pairs))
+        self.assertEquals(3, pairs['Penny Frewman'][COUNT])
+        self.assertEquals(2, pairs['Leopoldo Pires'][COUNT])
+        self.assertEquals({}, userCooccurrences(self.model,
+                                                'Maria Gabriela'))
+
+    def test_user_cooccurrence_similarities(self):
+        for distance in self.distances:
+            for userID in self.model.UserIDs():
+                sims = userCooccurrenceSimilarities(self.model, distance,
+                                                    userID)
+                self.assertEquals(self.model.UserIDs(),
+                                  [other for other, sim in sims])
+                for other, sim in sims:
+                    self.assertAlmostEquals(
+                            distance(dict(self.model[userID]),
+                                     dict(self.model[other])), sim)
+
+        usr1Prefs = self.model.ItemIDsFromUser('Marcel Caraciolo')
+        usr2Prefs = self.model.ItemIDsFromUser('Penny Frewman')
+        self.assertAlmostEquals(
+                sim_loglikehood(self.model.NumItems(), usr1Prefs, usr2Prefs),
+                dict(userCooccurrenceSimilarities(self.model,
+                        sim_loglikehood, 'Marcel Caraciolo'))[
+                            'Penny Frewman'])
+        self.assertEquals(None, userCooccurrenceSimilarities(self.model,
+                sim_spearman, 'Marcel Caraciolo'))
+
+    def test_item_cooccurrence_similarities(self):
+        for distance in self.distances:
+            for itemID in self.model.ItemIDs():
+                sims = itemCooccurrenceSimilarities(self.model, distance,
+                                                    itemID)
+                for other, sim in sims:
+                    self.assertAlmostEquals(
+                            distance(
+                                dict(self.model.PreferencesForItem(itemID)),
+                                dict(self.model.PreferencesForItem(other))),
+                            sim)
+
+
+    def test_zero_norm_cooccurrence_similarities(self):
+        self.model.setPreference('Maria Gabriela', 'Just My Luck', 0.0)
+        sims = dict(userCooccurrenceSimilarities(self.model, sim_cosine,
+                                                 'Maria Gabriela'))
+        self.assertEquals(0.0, sims['Marcel Caraciolo'])
+        self.assertEquals(0.0, dict(UserSimilarity(self.model, sim_cosine)
+                .getSimilarities('Marcel Caraciolo'))['Maria Gabriela'])
+
+    def test_cooccurrence_stats_fetched(self):
+        calls = []
+        userStats = self.model.UserStats
+
+        def countingStats(userID):
+            calls.append(userID)
+            return userStats(userID)
+
+        self.model.UserStats = countingStats
+        userCooccurrenceSimilarities(self.model, sim_pearson, 'Sheldom')
+        self.assertEquals([], calls)
+        userCooccurrenceSimilarities(self.model, sim_cosine, 'Sheldom')
+        self.assertEquals(self.model.NumUsers(), len(calls))
+
+class TestPrecomputedItemSimilarity(unittest.TestCase):
+
+    def setUp(self):
+        movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+        self.model = DictDataModel(movies)
+        self.similarity = ItemSimilarity(self.model, sim_pearson)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_all_precomputed_similarities(self):
+        matrix = PrecomputedItemSimilarity(self.model, sim_pearson)
+        for itemID in self.model.ItemIDs():
+            for otherItemID in self.model.ItemIDs():
+                if itemID == otherItemID:
+                    self.assertEquals(None,
+                            matrix.getSimilarity(itemID, otherItemID))
+                else:
+                    self.assertAlmostEquals(
+                            self.similarity.getSimilarity(itemID,
+                                                          otherItemID),
+                            matrix.getSimilarity(itemID, otherItemID), 6)
+        self.assertRaises(ValueError, matrix.getSimilarity,
+                          'Unknown', 'Just My Luck')
+
+    def test_pruned_precomputed_similarities(self):
+        matrix = PrecomputedItemSimilarity(self.model, sim_pearson,
+                                           numNeighbors=2, threshold=0.0)
+        for itemID in self.model.ItemIDs():
+            neighbors = matrix.getSimilarities(itemID)
+            self.assertTrue(len(neighbors) <= 2)
+            sims = sorted([sim for other, sim in
+                           self.similarity.getSimilarities(itemID)
+                           if other != itemID and sim >= 0.0], reverse=True)
+            self.assertEquals(min(len(sims), 2), len(neighbors))
+            for other, sim in neighbors:
+                self.assertTrue(sim >= 0.0)
+                self.assertTrue(sim >= sims[min(len(sims), 2) - 1] - 1e-6)
+        # A pair pruned from both items has no similarity.
+        self.assertEquals(None, matrix.getSimilarity('Just My Luck',
+                                                     'Superman Returns'))
+
+    def test_pairs_computed_once_precomputed_similarities(self):
+        calls = []
+
+        def distance(vector1, vector2):
+            calls.append(1)
+            return sim_pearson(vector1, vector2)
+
+        matrix = PrecomputedItemSimilarity(self.model, distance,
+                                           numNeighbors=2)
+        numItems = self.model.NumItems()
+        self.assertEquals(numItems * (numItems + 1) / 2, len(calls))
+        pruned = PrecomputedItemSimilarity(self.model, sim_pearson,
+                                           numNeighbors=2)
+        for itemID in self.model.ItemIDs():
+            self.assertEquals(pruned.getSimilarities(itemID),
+                              matrix.getSimilarities(itemID))
+
+    def test_save_load_precomputed_similarities(self):
+        matrix = PrecomputedItemSimilarity(self.model, sim_pearson,
+                                           numNeighbors=3)
+        path = os.path.join(self.directory, 'similarities.snapshot')
+        matrix.save(path)
+        loaded = PrecomputedItemSimilarity.load(path)
+        self.assertEquals(3, loaded.numNeighbors)
+        for itemID in self.model.ItemIDs():
+            self.assertEquals(matrix.getSimilarities(itemID),
+                              loaded.getSimilarities(itemID))
+        loaded.refresh()
+        self.assertEquals(matrix.getSimilarities('Just My Luck'),
+                          loaded.getSimilarities('Just My Luck'))
+
+    def test_iter_precomputed_similarities(self):
+        matrix = PrecomputedItemSimilarity(self.model, sim_pearson,
+                                           numNeighbors=3, numBest=2)
+        self.assertEquals([(itemID, matrix[itemID])
+                           for itemID in self.model.ItemIDs()],
+                          list(matrix))
+
+    def test_reload_precomputed_similarities(self):
+        matrix = PrecomputedItemSimilarity(self.model, sim_pearson)
+        self.model.setPreference('Penny Frewman', 'Just My Luck', 1.0)
+        self.assertNotAlmostEquals(
+                self.similarity.getSimilarity('Just My Luck',
+                                              'Superman Returns'),
+                matrix.getSimilarity('Just My Luck', 'Superman Returns'), 6)
+        matrix.refresh()
+        self.assertAlmostEquals(
+                self.similarity.getSimilarity('Just My Luck',
+                                              'Superman Returns'),
+                matrix.getSimilarity('Just My Luck', 'Superman Returns'), 6)
+
+    def test_reload_swaps_precomputed_similarities(self):
+        matrix = PrecomputedItemSimilarity(self.model, sim_pearson)
+        rows = matrix.iterSimilarities()
+        first = rows.next()
+        self.model.setPreference('Penny Frewman', 'Jaws', 3.0)
+        self.model.setPreference('Sheldom', 'Jaws', 2.0)
+        matrix.refresh()
+        # The rows in flight come from the table they started on.
+        self.assertEquals(len(self.model.ItemIDs()) - 1,
+                          len([first] + list(rows)))
+        self.assertEquals(len(self.model.ItemIDs()), len(list(matrix)))
+        self.assertEquals(0.0, matrix.getSimilarity('Jaws', 'Just My Luck'))
+
+
+class TestCachingSimilarity(unittest.TestCase):
+
+    def setUp(self):
+        movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+        self.model = DictDataModel(movies)
+
+    def test_cached_similarities(self):
+        similarity = UserSimilarity(self.model, sim_pearson)
+        matrix = CachingSimilarity(similarity)
+        self.assertAlmostEquals(
+                similarity.getSimilarity('Marcel Caraciolo', 'Sheldom'),
+                matrix.getSimilarity('Marcel Caraciolo', 'Sheldom'))
+        self.assertAlmostEquals(
+                similarity.getSimilarity('Marcel Caraciolo', 'Sheldom'),
+                matrix.getSimilarity('Sheldom', 'Marcel Caraciolo'))
+        self.assertEquals((1, 1), (matrix.hits, matrix.misses))
+        self.assertEquals(1, len(matrix))
+        self.assertEquals(similarity.getSimilarities('Sheldom'),
+                          matrix.getSimilarities('Sheldom'))
+
+    def test_lru_cached_similarities(self):
+        matrix = CachingSimilarity(UserSimilarity(self.model, sim_pearson),
+                                   maxSize=2)
+        matrix.getSimilarity('Marcel Caraciolo', 'Sheldom')
+        matrix.getSimilarity('Marcel Caraciolo', 'Luciana Nunes')
+        matrix.getSimilarity('Sheldom', 'Marcel Caraciolo')
+        matrix.getSimilarity('Marcel Caraciolo', 'Steve Gates')
+        self.assertEquals(2, len(matrix))
+        # Luciana Nunes was the least recently used.
+        matrix.getSimilarity('Marcel Caraciolo', 'Sheldom')
+        matrix.getSimilarity('Marcel Caraciolo', 'Luciana Nunes')
+        self.assertEquals((2, 4), (matrix.hits, matrix.misses))
+
+    def test_no_similarity_cached_similarities(self):
+        matrix = CachingSimilarity(PrecomputedItemSimilarity(self.model,
+                sim_pearson, numNeighbors=2, threshold=0.0))
+        self.assertEquals(None,
+                matrix.getSimilarity('Just My Luck', 'Superman Returns'))
+        self.assertEquals(None,
+                matrix.getSimilarity('Superman Returns', 'Just My Luck'))
+        self.assertEquals((1, 1), (matrix.hits, matrix.misses))
+
+    def test_evict_cached_similarities(self):
+        matrix = CachingSimilarity(UserSimilarity(self.model, sim_pearson))
+        matrix.getSimilarity('Marcel Caraciolo', 'Sheldom')
+        matrix.getSimilarity('Luciana Nunes', 'Sheldom')
+        self.model.setPreference('Marcel Caraciolo', 'Just My Luck', 5.0)
+        self.assertEquals(1, len(matrix))
+        self.assertAlmostEquals(
+                sim_pearson(dict(self.model['Marcel Caraciolo']),
+                            dict(self.model['Sheldom'])),
+                matrix.getSimilarity('Sheldom', 'Marcel Caraciolo'))
+
+        items = CachingSimilarity(ItemSimilarity(self.model, sim_pearson))
+        items.getSimilarity('Just My Luck', 'Superman Returns')
+        items.getSimilarity('Lady in the Water', 'Superman Returns')
+        self.model.removePreference('Marcel Caraciolo', 'Just My Luck')
+        self.assertEquals(1, len(items))
+
+        matrix.refresh()
+        self.assertEquals(0, len(matrix))
+
+    def test_stale_cached_similarities(self):
+        similarity = UserSimilarity(self.model, sim_pearson)
+        matrix = CachingSimilarity(similarity)
+        getSimilarity = similarity.getSimilarity
+
+        def computeThenEvict(vec1, vec2):
+            # An eviction lands while the pair is computed.
+            sim = getSimilarity(vec1, vec2)
+            matrix.evict(vec1)
+            return sim
+
+        similarity.getSimilarity = computeThenEvict
+        sim = matrix.getSimilarity('Marcel Caraciolo', 'Sheldom')
+        self.assertEquals(0, len(matrix))
+        similarity.getSimilarity = getSimilarity
+        self.assertEquals(sim, matrix.getSimilarity('Marcel Caraciolo',
+                                                    'Sheldom'))
+        self.assertEquals(1, len(matrix))
+
+    def test_close_cached_similarities(self):
+        listeners = len(self.model._preferenceListeners)
+        matrix = CachingSimilarity(UserSimilarity(self.model, sim_pearson))
+        self.assertEquals(listeners + 1,
+                          len(self.model._preferenceListeners))
+        matrix.close()
+        self.assertEquals(listeners, len(self.model._preferenceListeners))
+
+        # A dropped cache is not kept alive by the model.
+        matrix = CachingSimilarity(UserSimilarity(self.model, sim_pearson))
+        reference = weakref.ref(matrix)
+        del matrix
+        self.assertEquals(None, reference())
+        self.model.setPreference('Marcel Caraciolo', 'Just My Luck', 5.0)
+        self.assertEquals(listeners, len(self.model._preferenceListeners))
+
+
+class TestMinHashIndex(unittest.TestCase):
+
+    def setUp(self):
+        movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+        self.model = DictDataModel(movies)
+        self.booleanModel = BooleanDataModel(movies)
+
+    def test_candidates(self):
+        index = MinHashIndex(self.model, bands=10, rows=3, seed=1)
+        # Users with the same items always share every band.
+        candidates = index.candidates('Marcel Caraciolo')
+        self.assertTrue('Luciana Nunes' in candidates)
+        self.assertTrue('Steve Gates' in candidates)
+        self.assertFalse('Marcel Caraciolo' in candidates)
+        self.assertEquals([userID for userID in self.model.UserIDs()
+                           if userID in candidates], candidates)
+        self.assertEquals([], index.candidates('Maria Gabriela'))
+        self.assertFalse('Maria Gabriela' in
+                         index.candidates('Penny Frewman'))
+
+        items = MinHashIndex(self.booleanModel, bands=10, rows=3,
+                             byUser=False, seed=1)
+        self.assertFalse('Lady in the Water' in
+                         items.candidates('Lady in the Water'))
+        self.assertEquals(items.candidates('Lady in the Water'),
+                          [itemID for itemID in self.model.ItemIDs()
+                           if itemID in items.candidates('Lady in the Water')])
+
+    def test_estimateSimilarity(self):
+        index = MinHashIndex(self.booleanModel, bands=50, rows=4, seed=1)
+        self.assertEquals(1.0, index.estimateSimilarity('Marcel Caraciolo',
+                                                        'Luciana Nunes'))
+        for userID in ('Leopoldo Pires', 'Lorena Abreu', 'Penny Frewman'):
+            exact = sim_jaccard(self.model.ItemIDsFromUser('Sheldom'),
+                                self.model.ItemIDsFromUser(userID))
+            self.assertTrue(abs(exact - index.estimateSimilarity(
+                    'Sheldom', userID)) < 0.15)
+        self.assertEquals(None, index.estimateSimilarity('Sheldom',
+                                                         'Maria Gabriela'))
+
+    def test_refresh_candidates(self):
+        index = MinHashIndex(self.model, bands=10, rows=3, seed=1)
+        # A user missing from the index is hashed on the fly.
+        self.model.setPreference('Maria Gabriela', 'Snakes on a Plane', 4.5)
+        self.model.setPreference('Maria Gabriela', 'You, Me and Dupree', 1.0)
+        self.model.setPreference('Maria Gabriela', 'Superman Returns', 4.0)
+        self.assertTrue('Penny Frewman' in
+                        index.candidates('Maria Gabriela'))
+        self.assertFalse('Maria Gabriela' in
+                         index.candidates('Penny Frewman'))
+        index.refresh()
+        self.assertTrue('Maria Gabriela' in
+                        index.candidates('Penny Frewman'))
+
+    def test_recallReport(self):
+        index = MinHashIndex(self.booleanModel, bands=20, rows=2, seed=1)
+        self.assertAlmostEquals(1 - 0.75 ** 20,
+                                index.probability(0.5))
+        self.assertAlmostEquals((1.0 / 20) ** 0.5, index.threshold())
+        report = recallReport(index, UserSimilarity(self.booleanModel,
+                                                    sim_jaccard), None, 3)
+        self.assertEquals(['candidates', 'recall'], sorted(report))
+        self.assertTrue(0.9 <= report['recall'] <= 1.0)
+        self.assertTrue(0.0 < report['candidates'] <= 1.0)
+
+    def test_signature_across_processes(self):
+        # The signatures must not depend on the randomized hash().
+        script = ('from similarities.lsh import MinHashIndex\n'
+                  'from models.datamodel import DictDataModel\n'
+                  'model = DictDataModel({"Sheldom": {"Lady in the Water": '
+                  '3.0, "Superman Returns": 5.0}})\n'
+                  'print MinHashIndex(model, bands=2, rows=2, seed=1)'
+                  '.signature(model.PreferencesFromUser("Sheldom"))')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        outputs = []
+        for seed in ('1', '2'):
+            env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=root)
+            outputs.append(subprocess.Popen([sys.executable, '-c', script],
+                    stdout=subprocess.PIPE, env=env).communicate()[0])
+        self.assertTrue(outputs[0])
+        self.assertEquals(outputs[0], outputs[1])
+
+
+class TestSimHashIndex(unittest.TestCase):
+
+    def setUp(self):
+        movies = {
+                'Marcel Caraciolo': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'Superman Returns': 3.5,
+                    'You, Me and Dupree': 2.5,
+                    'The Night Listener': 3.0},
+                'Luciana Nunes': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 1.5,
+                    'Superman Returns': 5.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 3.5},
+                'Leopoldo Pires': {
+                    'Lady in the Water': 2.5,
+                    'Snakes on a Plane': 3.0,
+                    'Superman Returns': 3.5,
+                    'The Night Listener': 4.0},
+                'Lorena Abreu': {
+                    'Snakes on a Plane': 3.5,
+                    'Just My Luck': 3.0,
+                    'The Night Listener': 4.5,
+                    'Superman Returns': 4.0,
+                    'You, Me and Dupree': 2.5},
+                'Steve Gates': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'Just My Luck': 2.0,
+                    'Superman Returns': 3.0,
+                    'The Night Listener': 3.0,
+                    'You, Me and Dupree': 2.0},
+                'Sheldom': {
+                    'Lady in the Water': 3.0,
+                    'Snakes on a Plane': 4.0,
+                    'The Night Listener': 3.0,
+                    'Superman Returns': 5.0,
+                    'You, Me and Dupree': 3.5},
+                'Penny Frewman': {
+                    'Snakes on a Plane': 4.5,
+                    'You, Me and Dupree': 1.0,
+                    'Superman Returns': 4.0},
+                'Maria Gabriela': {}}
+
+        self.model = DictDataModel(movies)
+        self.matrixModel = MatrixDataModel(movies)
+
+    def test_estimateSimilarity(self):
+        index = SimHashIndex(self.model, bands=64, rows=8, seed=1)
+        prefs = self.model.PreferencesFromUser
+        for userID in ('Luciana Nunes', 'Leopoldo Pires', 'Penny Frewman'):
+            exact = sim_cosine(dict(prefs('Sheldom')), dict(prefs(userID)))
+            self.assertTrue(abs(exact - index.estimateSimilarity(
+                    'Sheldom', userID)) < 0.15)
+        self.assertAlmostEquals(1.0, index.estimateSimilarity('Sheldom',
+                                                              'Sheldom'))
+        self.assertEquals(None, index.estimateSimilarity('Sheldom',
+                                                         'Maria Gabriela'))
+
+    def test_candidates(self):
+        index = SimHashIndex(self.matrixModel, bands=8, rows=8, seed=1)
+        probed = SimHashIndex(self.matrixModel, bands=8, rows=8, seed=1,
+                              probes=1)
+        for userID in self.model.UserIDs():
+            candidates = index.candidates(userID)
+            self.assertFalse(userID in candidates)
+            self.assertEquals([], [other for other in candidates
+                                   if other not in probed.candidates(userID)])
+        self.assertEquals([], index.candidates('Maria Gabriela'))
+        self.assertTrue(probed.probability(0.5) > index.probability(0.5))
+
+        items = SimHashIndex(self.model, bands=8, rows=4, byUser=False,
+                             seed=1)
+        self.assertFalse('Lady in the Water' in
+                         items.candidates('Lady in the Water'))
+
+    def test_centered(self):
+        # Centered on the mean of each user, the projections approximate
+        # the correlation of the ratings instead of their cosine.
+        index = SimHashIndex(self.model, bands=64, rows=8, seed=1,
+                             centered=True)
+        self.assertTrue(index.estimateSimilarity('Marcel Caraciolo',
+                                                 'Steve Gates') > 0.5)
+        self.assertTrue(index.estimateSimilarity('Sheldom',
+                                                 'Steve Gates') < 0.5)
+
+    def test_refresh_candidates(self):
+        index = SimHashIndex(self.model, bands=8, rows=4, seed=1)
+        for itemID, value in (('Snakes on a Plane', 4.5),
+                              ('You, Me and Dupree', 1.0),
+                              ('Superman Returns', 4.0)):
+            self.model.setPreference('Maria Gabriela', itemID, value)
+        self.assertTrue('Penny Frewman' in
+                        index.candidates('Maria Gabriela'))
+        self.assertFalse('Maria Gabriela' in
+                         index.candidates('Penny Frewman'))
+        index.refresh()
+        self.assertTrue('Maria Gabriela' in
+                        index.candidates('Penny Frewman'))
+
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTests(unittest.makeSuite(TestSimilarityDistance))
     suite.addTests(unittest.makeSuite(TestUserSimilarity))
+    suite.addTests(unittest.makeSuite(TestBatchSimilarity))
+    suite.addTests(unittest.makeSuite(TestCooccurrenceSimilarity))
+    suite.addTests(unittest.makeSuite(TestPrecomputedItemSimilarity))
+    suite.addTests(unittest.makeSuite(TestCachingSimilarity))
+    suite.addTests(unittest.makeSuite(TestMinHashIndex))
+    suite.addTests(unittest.makeSuite(TestSimHashIndex))
 
     return suite
 
@@ -40,6 +40,7 @@ from scoring.scorer import TanHScorer, NaiveScorer
 from neighborhood.neighborhood import NearestNUserNeighborhood
 from neighborhood.itemstrategies import  PreferredItemsNeighborhoodStrategy
 from evaluation.statistics import *
+from models.views import MaskedDataModel
 
 
 
@@ -84,25 +85,24 @@ class TestAverageAbsoluteDistanceRecommenderEvaluator(unittest.TestCase):
         trainingPercentage = 0.7
     
         numUsers = self.model.NumUsers()
-        trainingUsers = {}
+        trainingUserIDs = []
         testUserPrefs = {}
         self.total = 0
         self.diffs = 0.0
 
         for userID in self.model.UserIDs():
             if random() < evaluationPercentage:
-                evaluator.processOneUser(trainingPercentage,trainingUsers,testUserPrefs,userID,self.model)        
+                evaluator.splitOneUser(trainingPercentage,trainingUserIDs,testUserPrefs,userID,self.model)        
 
-        total_training =  sum([ len([pref  for pref in prefs]) for user,prefs in trainingUsers.iteritems()])
+        trainingModel = MaskedDataModel(self.model,testUserPrefs,trainingUserIDs)
+
+        total_training =  sum([ len(trainingModel.PreferencesFromUser(user)) for user in trainingModel.UserIDs()])
         total_testing =  sum([ len([pref  for pref in prefs]) for user,prefs in testUserPrefs.iteritems()])
         
         #self.assertAlmostEquals(total_training/float(total_training+total_testing), 0.7)
         #self.assertAlmostEquals(total_testing/float(total_training+total_testing), 0.3)
         
-        
-        trainingModel = DictDataModel(trainingUsers)
-        
-        self.assertEquals(sorted(trainingModel.UserIDs()), sorted([user for user in trainingUsers]))
+        self.assertEquals(sorted(trainingModel.UserIDs()), sorted(trainingUserIDs))
 
         recommender.model = trainingModel
 
@@ -191,25 +191,24 @@ class TestRMSRecommenderEvaluator(unittest.TestCase):
         trainingPercentage = 0.7
     
         numUsers = self.model.NumUsers()
-        trainingUsers = {}
+        trainingUserIDs = []
         testUserPrefs = {}
         self.total = 0
         self.diffs = 0.0
 
         for userID in self.model.UserIDs():
             if random() < evaluationPercentage:
-                evaluator.processOneUser(trainingPercentage,trainingUsers,testUserPrefs,userID,self.model)        
+                evaluator.splitOneUser(trainingPercentage,trainingUserIDs,testUserPrefs,userID,self.model)        
 
-        total_training =  sum([ len([pref  for pref in prefs]) for user,prefs in trainingUsers.iteritems()])
+        trainingModel = MaskedDataModel(self.model,testUserPrefs,trainingUserIDs)
+
+        total_training =  sum([ len(trainingModel.PreferencesFromUser(user)) for user in trainingModel.UserIDs()])
         total_testing =  sum([ len([pref  for pref in prefs]) for user,prefs in testUserPrefs.iteritems()])
         
         #self.assertAlmostEquals(total_training/float(total_training+total_testing), 0.7)
         #self.assertAlmostEquals(total_testing/float(total_training+total_testing), 0.3)
         
-        
-        trainingModel = DictDataModel(trainingUsers)
-        
-        self.assertEquals(sorted(trainingModel.UserIDs()), sorted([user for user in trainingUsers]))
+        self.assertEquals(sorted(trainingModel.UserIDs()), sorted(trainingUserIDs))
 
         recommender.model = trainingModel
 
@@ -360,13 +359,7 @@ class TestIRStatsRecommenderEvaluator(unittest.TestCase):
                 if len(relevantItemIDs) == 0:
                     continue
                 
-                trainingUsers = {}
-                for otherUserID in self.model.UserIDs():
-                    evaluator.processOtherUser(userID,relevantItemIDs,trainingUsers,otherUserID,self.model)
-                
-                
-
-                trainingModel = DictDataModel(trainingUsers)
+                trainingModel = MaskedDataModel(self.model,{userID: set(relevantItemIDs)})
                 
                 recommender.model = trainingModel
                 
@@ -26,7 +26,8 @@ __author__ = 'marcel@orygens.com'
 import unittest
 
 from models.datamodel import *
-from neighborhood.itemstrategies import PreferredItemsNeighborhoodStrategy
+from neighborhood.itemstrategies import PreferredItemsNeighborhoodStrategy, IndexedItemsStrategy
+from similarities.lsh import MinHashIndex
 
 
 class TestPreferredItemsNeighborhoodStrategy(unittest.TestCase):
@@ -74,6 +75,14 @@ class TestPreferredItemsNeighborhoodStrategy(unittest.TestCase):
 		self.assertEquals(['Just My Luck', 'You, Me and Dupree'],strategy.candidateItems(userID,self.model))
 		
 
+	def test_indexed_candidateItems(self):
+		index = MinHashIndex(self.model,bands=50,rows=1,byUser=False,seed=1)
+		strategy = IndexedItemsStrategy(index)
+		self.assertEquals(['Just My Luck', 'You, Me and Dupree'],sorted(strategy.candidateItems('Leopoldo Pires',self.model)))
+		self.assertEquals([],strategy.candidateItems('Marcel Caraciolo',self.model))
+		self.assertEquals([],strategy.candidateItems('Maria Gabriela',self.model))
+		
+
 	def suite():
 		suite = unittest.TestSuite()
 		suite.addTests(unittest.makeSuite(TestNearestNUserNeighborhood))
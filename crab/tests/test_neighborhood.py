@@ -29,6 +29,7 @@ from models.datamodel import *
 from neighborhood.neighborhood import NearestNUserNeighborhood
 from similarities.similarity import UserSimilarity
 from similarities.similarity_distance import *
+from similarities.lsh import MinHashIndex, SimHashIndex
 from scoring.scorer import TanHScorer, NaiveScorer
 
 class TestNearestNUserNeighborhood(unittest.TestCase):
@@ -93,6 +94,32 @@ class TestNearestNUserNeighborhood(unittest.TestCase):
 		samplingRate = 0.0
 		n = NearestNUserNeighborhood(self.similarity,self.model,numUsers,minSimilarity,samplingRate)				
 		self.assertEquals(0,len(n.getSampleUserIDs()))
+
+	def test_seeded_getSampleUserIDs(self):
+		n = NearestNUserNeighborhood(self.similarity,self.model,4,0.0,0.5,seed=42)
+		other = NearestNUserNeighborhood(self.similarity,self.model,4,0.0,0.5,seed=42)
+		self.assertEquals(n.getSampleUserIDs(),other.getSampleUserIDs())
+
+	def test_non_mutating_getSampleUserIDs(self):
+		userIDs = list(self.model.UserIDs())
+		n = NearestNUserNeighborhood(self.similarity,self.model,4,0.0,0.4)
+		sample = n.getSampleUserIDs()
+		self.assertEquals(userIDs,self.model.UserIDs())
+		self.assertEquals(8,self.model.NumUsers())
+		self.assertEquals(len(set(sample)),len(sample))
+		self.assertEquals([userID for userID in userIDs if userID in sample],sample)
+
+	def test_stratified_getSampleUserIDs(self):
+		n = NearestNUserNeighborhood(self.similarity,self.model,4,0.0,0.5,seed=1,strata=2)
+		sample = n.getSampleUserIDs()
+		self.assertEquals(4,len(sample))
+		userIDs = self.model.UserIDs()
+		strata = n._activityStrata(userIDs)
+		self.assertEquals([4,4],[len(stratum) for stratum in strata])
+		#Two users out of the four lightest, two out of the four heaviest.
+		for stratum in strata:
+			self.assertEquals(2,len([index for index in stratum if userIDs[index] in sample]))
+		self.assertEquals(0,self.model.UserStats(userIDs[strata[0][0]]).count)
 	
 	def test_estimatePreference(self):
 		numUsers = 4
@@ -135,6 +162,27 @@ class TestNearestNUserNeighborhood(unittest.TestCase):
 		n = NearestNUserNeighborhood(self.similarity,self.model,numUsers,minSimilarity)
 		self.assertEquals(['Luciana Nunes', 'Steve Gates', 'Lorena Abreu', 'Sheldom'],n.userNeighborhood(userID,scorer))
 
+	def test_index_userNeighborhood(self):
+		userID = 'Leopoldo Pires'
+		index = MinHashIndex(self.model,bands=10,rows=3,seed=1)
+		n = NearestNUserNeighborhood(self.similarity,self.model,4,0.0,index=index)
+		candidates = index.candidates(userID)
+		neighbors = n.userNeighborhood(userID)
+		self.assertTrue(neighbors)
+		self.assertEquals([],[user for user in neighbors if user not in candidates])
+		self.assertEquals([self.model,self.similarity,index],n.dependencies())
+		self.assertEquals([],n.userNeighborhood('Maria Gabriela'))
+
+	def test_simhash_userNeighborhood(self):
+		userID = 'Marcel Caraciolo'
+		index = SimHashIndex(self.model,bands=8,rows=4,seed=1,centered=True,probes=1)
+		similarity = UserSimilarity(self.model,sim_pearson)
+		n = NearestNUserNeighborhood(similarity,self.model,4,0.0,index=index)
+		candidates = index.candidates(userID)
+		neighbors = n.userNeighborhood(userID)
+		self.assertTrue(neighbors)
+		self.assertEquals([],[user for user in neighbors if user not in candidates])
+
 	def test_invalid_UserID_userNeighborhood(self):
 		numUsers = 4
 		userID = 'Marcel'
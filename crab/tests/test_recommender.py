@@ -28,10 +28,13 @@ import sys
 
 
 from models.datamodel import *
+from models.matrixmodel import MatrixDataModel
+from models.views import PlusAnonymousUserDataModel, ReloadableDataModel
 from recommender.topmatches import *
 from recommender.recommender import UserRecommender, ItemRecommender, SlopeOneRecommender
 from recommender.utils import DiffStorage
-from similarities.similarity import UserSimilarity, ItemSimilarity
+from similarities.similarity import UserSimilarity, ItemSimilarity, CachingSimilarity
+from similarities.precomputed import PrecomputedItemSimilarity
 from similarities.similarity_distance import *
 from scoring.scorer import TanHScorer, NaiveScorer
 from neighborhood.neighborhood import NearestNUserNeighborhood
@@ -317,6 +320,70 @@ class TestSlopeOneRecommender(unittest.TestCase):
 		self.assertEquals(['You, Me and Dupree'],recSys.recommend(userID,1))
 				
 
+class TestMatrixModelRecommenders(unittest.TestCase):
+	
+	def setUp(self):
+		#SIMILARITY BY RATES.
+		movies={'Marcel Caraciolo': {'Lady in the Water': 2.5, 'Snakes on a Plane': 3.5,
+		 'Just My Luck': 3.0, 'Superman Returns': 3.5, 'You, Me and Dupree': 2.5, 
+		 'The Night Listener': 3.0},
+		'Luciana Nunes': {'Lady in the Water': 3.0, 'Snakes on a Plane': 3.5, 
+		 'Just My Luck': 1.5, 'Superman Returns': 5.0, 'The Night Listener': 3.0, 
+		 'You, Me and Dupree': 3.5}, 
+		'Leopoldo Pires': {'Lady in the Water': 2.5, 'Snakes on a Plane': 3.0,
+		 'Superman Returns': 3.5, 'The Night Listener': 4.0},
+		'Lorena Abreu': {'Snakes on a Plane': 3.5, 'Just My Luck': 3.0,
+		 'The Night Listener': 4.5, 'Superman Returns': 4.0, 
+		 'You, Me and Dupree': 2.5},
+		'Steve Gates': {'Lady in the Water': 3.0, 'Snakes on a Plane': 4.0, 
+		 'Just My Luck': 2.0, 'Superman Returns': 3.0, 'The Night Listener': 3.0,
+		 'You, Me and Dupree': 2.0}, 
+		'Sheldom': {'Lady in the Water': 3.0, 'Snakes on a Plane': 4.0,
+		 'The Night Listener': 3.0, 'Superman Returns': 5.0, 'You, Me and Dupree': 3.5},
+		'Penny Frewman': {'Snakes on a Plane':4.5,'You, Me and Dupree':1.0,'Superman Returns':4.0},
+		'Maria Gabriela': {}}
+
+		self.dictModel = DictDataModel(movies)
+		self.model = MatrixDataModel(movies)
+
+	def test_UserRecommender_MatrixModel(self):
+		similarity = UserSimilarity(self.model,sim_euclidian)
+		neighbor = NearestNUserNeighborhood(similarity,self.model,4,0.0)
+		recSys = UserRecommender(self.model,similarity,neighbor,False)
+		self.assertEquals(['Just My Luck', 'You, Me and Dupree'],recSys.recommend('Leopoldo Pires',4))
+		self.assertAlmostEquals(2.065394689,recSys.estimatePreference(userID='Leopoldo Pires',similarity=similarity,itemID='You, Me and Dupree'))
+
+	def test_ItemRecommender_MatrixModel(self):
+		similarity = ItemSimilarity(self.model,sim_euclidian)
+		recSys = ItemRecommender(self.model,similarity,PreferredItemsNeighborhoodStrategy(),False)
+		self.assertEquals(['Just My Luck', 'You, Me and Dupree'],recSys.recommend('Leopoldo Pires',4))
+		self.assertAlmostEquals(3.14717875510,recSys.estimatePreference(userID='Leopoldo Pires',similarity=similarity,itemID='You, Me and Dupree'))
+		self.assertEquals(['Snakes on a Plane', 'The Night Listener', 'Lady in the Water', 'Just My Luck'],recSys.mostSimilarItems(['Superman Returns'],4))
+
+	def test_UserRecommender_CachingSimilarity(self):
+		similarity = CachingSimilarity(UserSimilarity(self.model,sim_euclidian))
+		neighbor = NearestNUserNeighborhood(similarity,self.model,4,0.0)
+		recSys = UserRecommender(self.model,similarity,neighbor,False)
+		self.assertEquals(['Just My Luck', 'You, Me and Dupree'],recSys.recommend('Leopoldo Pires',4))
+		self.assertTrue(similarity.hits > 0)
+
+	def test_ItemRecommender_PrecomputedItemSimilarity(self):
+		similarity = PrecomputedItemSimilarity(self.model,sim_euclidian)
+		recSys = ItemRecommender(self.model,similarity,PreferredItemsNeighborhoodStrategy(),False)
+		self.assertEquals(['Just My Luck', 'You, Me and Dupree'],recSys.recommend('Leopoldo Pires',4))
+		self.assertAlmostEquals(3.14717875510,recSys.estimatePreference(userID='Leopoldo Pires',similarity=similarity,itemID='You, Me and Dupree'),6)
+		similarity = PrecomputedItemSimilarity(self.model,sim_euclidian,numNeighbors=1)
+		recSys = ItemRecommender(self.model,similarity,PreferredItemsNeighborhoodStrategy(),False)
+		self.assertEquals(['Snakes on a Plane'],recSys.mostSimilarItems(['Superman Returns'],4))
+		self.assertEquals(['Lady in the Water'],recSys.recommendedBecause('Leopoldo Pires','Just My Luck',4))
+
+	def test_SlopeOneRecommender_MatrixModel(self):
+		recSys = SlopeOneRecommender(self.model,True,False,False)
+		self.assertEquals(['You, Me and Dupree', 'Just My Luck'],recSys.recommend('Leopoldo Pires',4))
+		self.assertEquals(SlopeOneRecommender(self.dictModel,True,False,True).storage._diffStorage,
+				SlopeOneRecommender(self.model,True,False,True).storage._diffStorage)
+		
+		
 class TestItemBasedRecommender(unittest.TestCase):
 		
 	def setUp(self):
@@ -434,11 +501,134 @@ class TestItemBasedRecommender(unittest.TestCase):
 		self.assertEquals(['The Night Listener', 'Superman Returns'],recSys.recommendedBecause(userID,itemID,2))
 		
 	
+class TestAnonymousUserRecommenders(unittest.TestCase):
+	
+	def setUp(self):
+		#SIMILARITY BY RATES.
+		movies={'Marcel Caraciolo': {'Lady in the Water': 2.5, 'Snakes on a Plane': 3.5,
+		 'Just My Luck': 3.0, 'Superman Returns': 3.5, 'You, Me and Dupree': 2.5, 
+		 'The Night Listener': 3.0},
+		'Luciana Nunes': {'Lady in the Water': 3.0, 'Snakes on a Plane': 3.5, 
+		 'Just My Luck': 1.5, 'Superman Returns': 5.0, 'The Night Listener': 3.0, 
+		 'You, Me and Dupree': 3.5}, 
+		'Leopoldo Pires': {'Lady in the Water': 2.5, 'Snakes on a Plane': 3.0,
+		 'Superman Returns': 3.5, 'The Night Listener': 4.0},
+		'Lorena Abreu': {'Snakes on a Plane': 3.5, 'Just My Luck': 3.0,
+		 'The Night Listener': 4.5, 'Superman Returns': 4.0, 
+		 'You, Me and Dupree': 2.5},
+		'Steve Gates': {'Lady in the Water': 3.0, 'Snakes on a Plane': 4.0, 
+		 'Just My Luck': 2.0, 'Superman Returns': 3.0, 'The Night Listener': 3.0,
+		 'You, Me and Dupree': 2.0}, 
+		'Sheldom': {'Lady in the Water': 3.0, 'Snakes on a Plane': 4.0,
+		 'The Night Listener': 3.0, 'Superman Returns': 5.0, 'You, Me and Dupree': 3.5},
+		'Penny Frewman': {'Snakes on a Plane':4.5,'You, Me and Dupree':1.0,'Superman Returns':4.0},
+		'Maria Gabriela': {}}
+
+		self.visitor = movies.pop('Leopoldo Pires')
+		self.model = PlusAnonymousUserDataModel(MatrixDataModel(movies))
+		self.model.setSessionUser('Leopoldo Pires', self.visitor)
+
+	def test_UserRecommender_anonymous_user(self):
+		similarity = UserSimilarity(self.model,sim_euclidian)
+		neighbor = NearestNUserNeighborhood(similarity,self.model,4,0.0)
+		recSys = UserRecommender(self.model,similarity,neighbor,False)
+		self.assertEquals(['Just My Luck', 'You, Me and Dupree'],recSys.recommend('Leopoldo Pires',4))
+		self.assertAlmostEquals(2.065394689,recSys.estimatePreference(userID='Leopoldo Pires',similarity=similarity,itemID='You, Me and Dupree'))
+
+	def test_ItemRecommender_anonymous_user(self):
+		similarity = ItemSimilarity(self.model,sim_euclidian)
+		recSys = ItemRecommender(self.model,similarity,PreferredItemsNeighborhoodStrategy(),False)
+		self.assertEquals(['Just My Luck', 'You, Me and Dupree'],recSys.recommend('Leopoldo Pires',4))
+		self.assertAlmostEquals(3.14717875510,recSys.estimatePreference(userID='Leopoldo Pires',similarity=similarity,itemID='You, Me and Dupree'))
+		self.model.removeSessionUser('Leopoldo Pires')
+		self.assertRaises(ValueError,recSys.recommend,'Leopoldo Pires',4)
+
+
+class TestRefreshRecommenders(unittest.TestCase):
+	
+	def setUp(self):
+		#SIMILARITY BY RATES.
+		movies={'Marcel Caraciolo': {'Lady in the Water': 2.5, 'Snakes on a Plane': 3.5,
+		 'Just My Luck': 3.0, 'Superman Returns': 3.5, 'You, Me and Dupree': 2.5, 
+		 'The Night Listener': 3.0},
+		'Luciana Nunes': {'Lady in the Water': 3.0, 'Snakes on a Plane': 3.5, 
+		 'Just My Luck': 1.5, 'Superman Returns': 5.0, 'The Night Listener': 3.0, 
+		 'You, Me and Dupree': 3.5}, 
+		'Leopoldo Pires': {'Lady in the Water': 2.5, 'Snakes on a Plane': 3.0,
+		 'Superman Returns': 3.5, 'The Night Listener': 4.0},
+		'Lorena Abreu': {'Snakes on a Plane': 3.5, 'Just My Luck': 3.0,
+		 'The Night Listener': 4.5, 'Superman Returns': 4.0, 
+		 'You, Me and Dupree': 2.5},
+		'Steve Gates': {'Lady in the Water': 3.0, 'Snakes on a Plane': 4.0, 
+		 'Just My Luck': 2.0, 'Superman Returns': 3.0, 'The Night Listener': 3.0,
+		 'You, Me and Dupree': 2.0}, 
+		'Sheldom': {'Lady in the Water': 3.0, 'Snakes on a Plane': 4.0,
+		 'The Night Listener': 3.0, 'Superman Returns': 5.0, 'You, Me and Dupree': 3.5},
+		'Penny Frewman': {'Snakes on a Plane':4.5,'You, Me and Dupree':1.0,'Superman Returns':4.0},
+		'Maria Gabriela': {}}
+
+		self.movies = movies
+		self.loads = 0
+		self.model = ReloadableDataModel(self.load)
+
+	def load(self):
+		self.loads += 1
+		return DictDataModel(dict(self.movies))
+
+	def test_refresh_UserRecommender(self):
+		similarity = UserSimilarity(self.model,sim_euclidian)
+		neighbor = NearestNUserNeighborhood(similarity,self.model,4,0.0)
+		recSys = UserRecommender(self.model,similarity,neighbor,False)
+		self.assertEquals(['Just My Luck', 'You, Me and Dupree'],recSys.recommend('Leopoldo Pires',4))
+		self.movies['Leopoldo Pires'] = dict(self.movies['Leopoldo Pires'])
+		self.movies['Leopoldo Pires']['Just My Luck'] = 1.0
+		recSys.refresh()
+		# The model is shared by the similarity, the neighborhood and the
+		# recommender, but it is loaded again only once.
+		self.assertEquals(2,self.loads)
+		self.assertEquals(['You, Me and Dupree'],recSys.recommend('Leopoldo Pires',4))
+
+	def test_refresh_SlopeOneRecommender(self):
+		recSys = SlopeOneRecommender(self.model,True,False,False)
+		storage = recSys.storage
+		self.movies['Leopoldo Pires'] = dict(self.movies['Leopoldo Pires'])
+		self.movies['Leopoldo Pires']['Just My Luck'] = 1.0
+		recSys.refreshInBackground().join()
+		self.assertEquals(2,self.loads)
+		self.assert_(recSys.storage is not storage)
+		self.assertEquals(['You, Me and Dupree'],recSys.recommend('Leopoldo Pires',4))
+
+	def test_recommend_one_storage_SlopeOneRecommender(self):
+		recSys = SlopeOneRecommender(self.model,True,False,False)
+		expected = recSys.recommend('Leopoldo Pires',4)
+		estimatePreference = recSys.estimatePreference
+		def estimateThenReset(**args):
+			# A reset lands in the middle of the recommendation.
+			recSys.storage = DiffStorage(DictDataModel({}),False)
+			return estimatePreference(**args)
+		recSys.estimatePreference = estimateThenReset
+		self.assertEquals(expected,recSys.recommend('Leopoldo Pires',4))
+
+	def test_refresh_ItemRecommender(self):
+		similarity = ItemSimilarity(self.model,sim_euclidian)
+		strategy = PreferredItemsNeighborhoodStrategy()
+		recSys = ItemRecommender(self.model,similarity,strategy,False)
+		refreshed = set()
+		recSys.refresh(refreshed)
+		self.assertEquals(set([recSys,self.model,similarity,strategy]),refreshed)
+		self.assertEquals(2,self.loads)
+		similarity.refresh(refreshed)
+		self.assertEquals(2,self.loads)
+
+
 def suite():
 	suite = unittest.TestSuite()
 	suite.addTests(unittest.makeSuite(TestUserBasedRecommender))
 	suite.addTests(unittest.makeSuite(TestItemBasedRecommender))
 	suite.addTests(unittest.makeSuite(TestSlopeOneRecommender))
+	suite.addTests(unittest.makeSuite(TestMatrixModelRecommenders))
+	suite.addTests(unittest.makeSuite(TestAnonymousUserRecommenders))
+	suite.addTests(unittest.makeSuite(TestRefreshRecommenders))
 	
 
 	return suite